@@ -0,0 +1,161 @@
+# aggregates.py
+"""Portfolio totals, per-fund-type breakdowns and weighted ROI.
+
+The dashboard totals come from ``SUMMARY_QUERY``, one primary-key read of
+the trigger-maintained ``user_portfolio_summary`` row (see ``summary.py``).
+Per-fund-type breakdowns come from ``AGGREGATE_QUERY``, a single grouped
+query that the covering indexes from migration 3 can answer without reading
+table rows. ``aggregate_rows`` computes the same result with pandas for rows
+that are already in memory.
+"""
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+# One row per fund type plus one bank row; params are (username, username)
+AGGREGATE_QUERY = """
+    SELECT 'fund' AS kind, fund_type, COUNT(*) AS holdings,
+           COALESCE(SUM(investment_amount), 0) AS invested,
+           COALESCE(SUM(current_value), 0) AS current_value
+    FROM user_mutual_funds
+    WHERE username = %s
+    GROUP BY fund_type
+    UNION ALL
+    SELECT 'bank' AS kind, NULL AS fund_type, COUNT(*) AS holdings,
+           0 AS invested, COALESCE(SUM(account_balance), 0) AS current_value
+    FROM user_banks
+    WHERE username = %s
+"""
+
+SUMMARY_COLUMNS = ('bank_count', 'total_balance', 'fund_count', 'total_invested', 'fund_value',
+                   'card_count', 'active_cards')
+
+SUMMARY_QUERY = f"""
+    SELECT {', '.join(SUMMARY_COLUMNS)}
+    FROM user_portfolio_summary
+    WHERE username = %s
+"""
+
+
+def weighted_roi(invested, current_value):
+    """Return on the combined amount invested, as a percentage"""
+    return float((current_value - invested) / invested * 100) if invested else 0.0
+
+
+@dataclass
+class FundTypeBreakdown:
+    fund_type: str
+    holdings: int = 0
+    invested: Decimal = Decimal('0')
+    current_value: Decimal = Decimal('0')
+
+    @property
+    def roi(self):
+        return weighted_roi(self.invested, self.current_value)
+
+
+@dataclass
+class PortfolioAggregates:
+    bank_count: int = 0
+    total_balance: Decimal = Decimal('0')
+    by_fund_type: dict = field(default_factory=dict)
+
+    @property
+    def fund_count(self):
+        return sum(b.holdings for b in self.by_fund_type.values())
+
+    @property
+    def total_invested(self):
+        return sum((b.invested for b in self.by_fund_type.values()), Decimal('0'))
+
+    @property
+    def current_value(self):
+        return sum((b.current_value for b in self.by_fund_type.values()), Decimal('0'))
+
+    @property
+    def net_worth(self):
+        return self.total_balance + self.current_value
+
+    @property
+    def roi(self):
+        return weighted_roi(self.total_invested, self.current_value)
+
+
+@dataclass
+class PortfolioSummary:
+    bank_count: int = 0
+    total_balance: Decimal = Decimal('0')
+    fund_count: int = 0
+    total_invested: Decimal = Decimal('0')
+    fund_value: Decimal = Decimal('0')
+    card_count: int = 0
+    active_cards: int = 0
+
+    @property
+    def current_value(self):
+        return self.fund_value
+
+    @property
+    def net_worth(self):
+        return self.total_balance + self.fund_value
+
+    @property
+    def roi(self):
+        return weighted_roi(self.total_invested, self.fund_value)
+
+
+def build_summary(rows):
+    """PortfolioSummary from ``SUMMARY_QUERY`` rows; zeros if the user has none"""
+    if not rows:
+        return PortfolioSummary()
+    row = rows[0]
+    return PortfolioSummary(**{column: row[column] for column in SUMMARY_COLUMNS})
+
+
+def _decimal(value):
+    return value if isinstance(value, Decimal) else Decimal(str(value or 0))
+
+
+def build_aggregates(rows):
+    """Fold ``AGGREGATE_QUERY`` result rows (dicts) into PortfolioAggregates"""
+    result = PortfolioAggregates()
+    for row in rows:
+        if row['kind'] == 'bank':
+            result.bank_count = int(row['holdings'])
+            result.total_balance = _decimal(row['current_value'])
+        else:
+            result.by_fund_type[row['fund_type']] = FundTypeBreakdown(
+                fund_type=row['fund_type'],
+                holdings=int(row['holdings']),
+                invested=_decimal(row['invested']),
+                current_value=_decimal(row['current_value']),
+            )
+    return result
+
+
+def aggregate_rows(bank_rows, mf_rows):
+    """Vectorized fallback over bank and mutual fund rows already in memory"""
+    banks = pd.DataFrame(bank_rows or [], columns=['account_balance'])
+    funds = pd.DataFrame(mf_rows or [], columns=['fund_type', 'investment_amount', 'current_value'])
+    balances = pd.to_numeric(banks['account_balance'], errors='coerce').fillna(0).to_numpy()
+    for column in ('investment_amount', 'current_value'):
+        funds[column] = pd.to_numeric(funds[column], errors='coerce').fillna(0)
+
+    rows = [{
+        'kind': 'bank', 'fund_type': None, 'holdings': len(balances),
+        'invested': 0, 'current_value': round(float(np.sum(balances)), 2),
+    }]
+    grouped = funds.groupby('fund_type', sort=False).agg(
+        holdings=('current_value', 'size'),
+        invested=('investment_amount', 'sum'),
+        current_value=('current_value', 'sum'),
+    )
+    for fund_type, group in grouped.iterrows():
+        rows.append({
+            'kind': 'fund', 'fund_type': fund_type, 'holdings': group['holdings'],
+            'invested': round(group['invested'], 2),
+            'current_value': round(group['current_value'], 2),
+        })
+    return build_aggregates(rows)
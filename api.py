@@ -0,0 +1,403 @@
+# api.py
+"""Headless JSON API over the same data layer as the Streamlit app.
+
+    uvicorn api:app --workers 4 --port 8000     (or: python api.py --workers 4)
+
+A plain ASGI application; the only extra dependency is an ASGI server.
+All endpoints except login need ``Authorization: Bearer <token>``::
+
+    POST   /v1/sessions   {"username": ..., "password": ...} -> {"token": ...}
+    DELETE /v1/sessions   log the token out
+    GET    /v1/user       profile
+    GET    /v1/banks      ?limit=&cursor=  (keyset pages, ``next_cursor`` in the body)
+    GET    /v1/funds      ?limit=&cursor=
+    GET    /v1/cards
+    GET    /v1/summary
+
+Sessions live in ``api_sessions`` (only a hash of each token is stored), so
+any worker or host can serve any client. A token starts with its encoded
+username, which routes it to the user's shard. Every GET resolves the session and
+the user's data version in one primary-key query. The data version is bumped
+by triggers on any change to the user's rows (migration 8) and is the weak
+ETag, so a matching ``If-None-Match`` is answered with 304 straight away.
+Bodies are cached per version, gzipped once, so repeat reads skip the data
+queries. Writes made by other processes never reach this process's cache,
+so the data readers are called with ``.uncached``, and on the primary
+rather than a read replica that may not have the version yet.
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import gzip
+import hashlib
+import json
+import os
+import secrets
+import sys
+from dataclasses import asdict
+from datetime import date, datetime
+from decimal import Decimal
+from urllib.parse import parse_qs
+
+from mysql.connector import Error
+
+import auth
+import database
+import statements
+from cache import get_cache
+from migrations import ensure_schema
+
+API_PAGE_SIZE = database.PAGE_SIZE
+API_MAX_PAGE_SIZE = 200
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+MAX_BODY_BYTES = 64 * 1024
+
+# The session's user and their data version in one round trip
+SESSION_QUERY = """
+    SELECT s.username, COALESCE(v.data_version, 0)
+    FROM api_sessions s
+    LEFT JOIN user_portfolio_summary v ON v.username = s.username
+    WHERE s.token_hash = %s AND s.expires_at > NOW()
+"""
+statements.register('session', SESSION_QUERY)
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _json_default(value):
+    # Money stays exact as a string; clients parse it as a decimal
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_json(payload):
+    return json.dumps(payload, default=_json_default, separators=(',', ':')).encode()
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return 0
+    try:
+        text = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        prefix, value = text.split(':', 1)
+        if prefix != 'id':
+            raise ValueError(text)
+        return int(value)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise ApiError(400, "Invalid cursor")
+
+
+def _limit(params):
+    try:
+        limit = int(params.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError(400, "limit must be an integer")
+    if not 1 <= limit <= API_MAX_PAGE_SIZE:
+        raise ApiError(400, f"limit must be between 1 and {API_MAX_PAGE_SIZE}")
+    return limit
+
+
+def _page(reader, username, params):
+    limit = _limit(params)
+    rows = reader.uncached(username, decode_cursor(params.get('cursor')), limit + 1)
+    if rows is None:
+        return None
+    items = rows[:limit]
+    has_more = len(rows) > limit
+    return {'items': items, 'next_cursor': encode_cursor(items[-1]['id']) if has_more else None}
+
+
+def list_banks(username, params):
+    return _page(database.get_bank_accounts_page, username, params)
+
+
+def list_funds(username, params):
+    return _page(database.get_mutual_funds_page, username, params)
+
+
+def list_cards(username, params):
+    cards = database.get_cards.uncached(username)
+    if cards is None:
+        return None
+    # Only the last four digits ever leave the server
+    return {'items': [{**{k: v for k, v in card.items() if k != 'card_number'},
+                       'card_last4': card['card_number'][-4:]} for card in cards]}
+
+
+def get_user(username, params):
+    profile = database.get_profile.uncached(username)
+    if profile is None:
+        return None
+    details = {k: v for k, v in profile.items() if k not in ('username', 'profile_photo_path')}
+    return {'username': username, 'profile_completed': bool(profile), 'profile': details or None}
+
+
+def get_summary(username, params):
+    summary = database.get_portfolio_summary.uncached(username)
+    if summary is None:
+        return None
+    return {**asdict(summary), 'net_worth': summary.net_worth, 'roi': round(summary.roi, 4)}
+
+
+ROUTES = {
+    '/v1/user': get_user,
+    '/v1/banks': list_banks,
+    '/v1/funds': list_funds,
+    '/v1/cards': list_cards,
+    '/v1/summary': get_summary,
+}
+
+
+def _render(handler, username, params, version):
+    """``(json_bytes, gzip_bytes_or_None)`` for one resource at one data version"""
+    key = (handler.__name__, tuple(sorted(params.items())), version)
+    hit, body = get_cache().get(username, 'api', key)
+    if hit:
+        return body
+    payload = handler(username, params)
+    if payload is None:
+        raise ApiError(503, "Database unavailable")
+    raw = encode_json(payload)
+    body = (raw, gzip.compress(raw, GZIP_LEVEL) if len(raw) >= GZIP_MIN_BYTES else None)
+    get_cache().set(username, 'api', body, key)
+    return body
+
+
+def _token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _token_username(token):
+    """The username a token was issued to, which picks the shard its session is on"""
+    prefix, _, secret = token.partition('.')
+    try:
+        username = base64.urlsafe_b64decode(prefix + '=' * (-len(prefix) % 4)).decode()
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+    return username if secret and username else None
+
+
+def open_session(username):
+    """Store a new session for ``username`` and return its token"""
+    prefix = base64.urlsafe_b64encode(username.encode()).decode().rstrip('=')
+    token = f"{prefix}.{secrets.token_urlsafe(32)}"
+    try:
+        with database.get_db_connection(username) as conn:
+            if conn is None:
+                raise ApiError(503, "Database unavailable")
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM api_sessions WHERE username = %s AND expires_at <= NOW()",
+                               (username,))
+                cursor.execute("""
+                    INSERT INTO api_sessions (token_hash, username, expires_at)
+                    VALUES (%s, %s, NOW() + INTERVAL %s SECOND)
+                """, (_token_hash(token), username, int(auth.SESSION_TTL)))
+                conn.commit()
+    except Error:
+        raise ApiError(503, "Database unavailable")
+    return token
+
+
+def close_session(token):
+    username = _token_username(token or '')
+    if username is None:
+        return
+    try:
+        with database.get_db_connection(username) as conn:
+            if conn is None:
+                raise ApiError(503, "Database unavailable")
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM api_sessions WHERE token_hash = %s", (_token_hash(token),))
+                conn.commit()
+    except Error:
+        raise ApiError(503, "Database unavailable")
+
+
+def resolve_session(token):
+    """``(username, data_version)`` for a live token, or None"""
+    username = _token_username(token or '')
+    if username is None:
+        return None
+    try:
+        with database.get_db_connection(username) as conn:
+            if conn is None:
+                raise ApiError(503, "Database unavailable")
+            row = statements.fetchone(conn, 'session', (_token_hash(token),))
+    except Error:
+        raise ApiError(503, "Database unavailable")
+    return (row[0], int(row[1])) if row else None
+
+
+def _read_resource(handler, token, params, if_none_match):
+    """Blocking part of a GET: session and version check, then the (cached) body"""
+    if not ensure_schema():
+        raise ApiError(503, "Database unavailable")
+    session = resolve_session(token)
+    if session is None:
+        raise ApiError(401, "Missing or expired session token")
+    username, version = session
+    etag = f'W/"{version}"'
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return etag, None
+    # The body is cached under the primary's version, so it must not come from a lagging replica
+    with database.primary_reads():
+        return etag, _render(handler, username, params, version)
+
+
+def _login(body):
+    try:
+        credentials = json.loads(body or b'{}')
+        username, password = credentials['username'], credentials['password']
+    except (ValueError, KeyError, TypeError):
+        raise ApiError(400, "Expected a JSON body with username and password")
+    if not ensure_schema():
+        raise ApiError(503, "Database unavailable")
+    try:
+        profile_completed = auth.check_credentials(str(username), str(password))
+    except Error:
+        raise ApiError(503, "Database unavailable")
+    if profile_completed is None:
+        raise ApiError(401, "Invalid username or password")
+    return {'token': open_session(str(username)), 'username': str(username),
+            'profile_completed': profile_completed}
+
+
+def _logout(token):
+    if not ensure_schema():
+        raise ApiError(503, "Database unavailable")
+    close_session(token)
+
+
+def _accepts_gzip(header):
+    for part in header.split(','):
+        coding, _, q = part.strip().partition(';')
+        if coding.strip() in ('gzip', '*'):
+            return q.strip().replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+async def _send(send, status, body=b'', headers=()):
+    headers = [(b'content-length', str(len(body)).encode())] + [
+        (name.encode(), value.encode()) for name, value in headers]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_json(send, status, payload, headers=()):
+    await _send(send, status, encode_json(payload),
+                [('content-type', 'application/json'), *headers])
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY_BYTES:
+            raise ApiError(413, "Request body too large")
+        if not message.get('more_body'):
+            return body
+
+
+async def _run(func, *args):
+    # Blocking DB work runs on the pool-sized executor the app's prefetch uses
+    return await asyncio.get_running_loop().run_in_executor(database.get_executor(), func, *args)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if not await _run(ensure_schema):
+                print("API starting without a database; requests will get 503 until it is up")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+               for name, value in scope['headers']}
+    path, method = scope['path'].rstrip('/') or '/', scope['method']
+    token = headers.get('authorization', '')
+    token = token[7:].strip() if token.lower().startswith('bearer ') else None
+    try:
+        if path == '/v1/sessions':
+            if method == 'POST':
+                result = await _run(_login, await _read_body(receive))
+                await _send_json(send, 201, result, [('cache-control', 'no-store')])
+            elif method == 'DELETE':
+                if token:
+                    await _run(_logout, token)
+                await _send(send, 204)
+            else:
+                raise ApiError(405, "Method not allowed")
+            return
+
+        handler = ROUTES.get(path)
+        if handler is None:
+            raise ApiError(404, "Not found")
+        if method != 'GET':
+            raise ApiError(405, "Method not allowed")
+
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        params = {name: values[-1] for name, values in query.items()}
+        etag, body = await _run(_read_resource, handler, token, params,
+                                headers.get('if-none-match'))
+        common = [('etag', etag), ('cache-control', 'private, no-cache'),
+                  ('vary', 'Accept-Encoding, Authorization')]
+        if body is None:
+            await _send(send, 304, headers=common)
+            return
+        raw, gzipped = body
+        if gzipped is not None and _accepts_gzip(headers.get('accept-encoding', '')):
+            content, common = gzipped, [('content-encoding', 'gzip'), *common]
+        else:
+            content = raw
+        await _send(send, 200, content, [('content-type', 'application/json'), *common])
+    except ApiError as e:
+        extra = [('www-authenticate', 'Bearer')] if e.status == 401 else []
+        await _send_json(send, e.status, {'error': e.message}, extra)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the JSON API")
+    parser.add_argument('--host', default=os.environ.get('FOLIO_API_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('FOLIO_API_PORT', 8000)))
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        print("The API needs an ASGI server: pip install uvicorn")
+        return 1
+    uvicorn.run('api:app', host=args.host, port=args.port, workers=args.workers,
+                access_log=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
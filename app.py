@@ -3,13 +3,22 @@ import streamlit as st
 st.set_page_config(layout="wide")
 
 # Now import other libraries
-import hashlib
 import mysql.connector
 from datetime import datetime
 import os
-from PIL import Image
+import pandas as pd
+import auth
+import cache
 import database
-from dashboard import financial_dashboard
+import images
+import migrations
+import writes
+from dashboard import financial_dashboard, get_page_params, select_rows
+from profiler import profile_rerun, stage
+from querylog import display_query_stats
+
+# Usernames that get the query statistics tab
+ADMIN_USERS = {u.strip() for u in os.environ.get('FOLIO_ADMIN_USERS', '').split(',') if u.strip()}
 
 # Initialize session state variables
 def init_session_state():
@@ -21,25 +30,19 @@ def init_session_state():
         st.session_state.profile_completed = False
     if 'just_signed_up' not in st.session_state:
         st.session_state.just_signed_up = False
+    if 'auth_token' not in st.session_state:
+        st.session_state.auth_token = None
     if 'editing_bank' not in st.session_state:
         st.session_state.editing_bank = None
     if 'editing_mf' not in st.session_state:
         st.session_state.editing_mf = None
 
-# Hash the password
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
 def save_profile_photo(username, profile_photo):
-    """Save uploaded profile photo and return path"""
+    """Save a thumbnail of the uploaded profile photo and return its path"""
     if not profile_photo:
         return None
         
-    os.makedirs("profile_photos", exist_ok=True)
-    profile_photo_path = f"profile_photos/{username}_{profile_photo.name}"
-    with open(profile_photo_path, "wb") as f:
-        f.write(profile_photo.getbuffer())
-    return profile_photo_path
+    return images.save_profile_thumbnail(profile_photo.getvalue())
 
 def validate_profile_form(full_name, email, date_of_birth, mobile_number, address):
     """Validate required profile fields"""
@@ -71,82 +74,76 @@ def profile_form(username):
             if not validate_profile_form(full_name, email, date_of_birth, mobile_number, address):
                 return
             
-            profile_photo_path = save_profile_photo(username, profile_photo)
-            
             try:
-                with database.get_db_connection() as conn:
-                    if conn is None:
-                        st.error("Failed to connect to database")
-                        return
-                        
-                    with conn.cursor() as cursor:
-                        cursor.execute("""
-                            INSERT INTO user_profiles (
-                                username, full_name, email, gender, date_of_birth,
-                                pan_card, aadhar_card, mobile_number, profile_photo_path,
-                                address, city, state, pincode, country
-                            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        """, (
-                            username, full_name, email, gender, date_of_birth,
-                            pan_card, aadhar_card, mobile_number, profile_photo_path,
-                            address, city, state, pincode, country
-                        ))
-                        conn.commit()
-                        st.success("Profile saved successfully!")
-                        st.session_state.profile_completed = True
-                        st.experimental_rerun()
-            except Exception as e:
-                st.error(f"Error saving profile: {e}")
+                profile_photo_path = save_profile_photo(username, profile_photo)
+            except OSError as e:
+                st.error(f"Could not read the uploaded photo: {e}")
+                return
+            
+            values = {
+                'username': username, 'full_name': full_name, 'email': email, 'gender': gender,
+                'date_of_birth': date_of_birth, 'pan_card': pan_card, 'aadhar_card': aadhar_card,
+                'mobile_number': mobile_number, 'profile_photo_path': profile_photo_path,
+                'address': address, 'city': city, 'state': state, 'pincode': pincode,
+                'country': country,
+            }
+            result = writes.insert_row('user_profiles', values,
+                                       writes.form_idempotency_key('profile_form', username, values))
+            if writes.show_write_result(result, "profile", "Profile saved successfully!"):
+                writes.reset_form_key('profile_form')
+                st.session_state.profile_completed = True
+                st.experimental_rerun()
 
-def view_profile(username):
+def view_profile(username, snapshot=None):
     """Display user profile information"""
     st.title("Your Profile")
     
+    if snapshot is None:
+        with stage("profile.fetch"):
+            snapshot = database.get_portfolio_snapshot(username)
+    profile = snapshot.profile if snapshot else None
+    
+    if not profile:
+        st.warning("Profile not found")
+        return
+    
     try:
-        with database.get_db_connection() as conn:
-            if conn is None:
-                st.error("Failed to connect to database")
-                return
-                
-            with conn.cursor(dictionary=True) as cursor:
-                cursor.execute("SELECT * FROM user_profiles WHERE username = %s", (username,))
-                profile = cursor.fetchone()
-                
-                if not profile:
-                    st.warning("Profile not found")
-                    return
-                
-                col1, col2 = st.columns([1, 2])
-                
-                with col1:
-                    if profile['profile_photo_path'] and os.path.exists(profile['profile_photo_path']):
-                        st.image(Image.open(profile['profile_photo_path']), caption="Profile Photo", width=200)
-                    else:
-                        st.warning("No profile photo uploaded")
-                
-                with col2:
-                    st.subheader("Personal Information")
-                    st.write(f"**Full Name:** {profile['full_name']}")
-                    st.write(f"**Email:** {profile['email']}")
-                    st.write(f"**Gender:** {profile['gender']}")
-                    st.write(f"**Date of Birth:** {profile['date_of_birth']}")
-                    st.write(f"**Mobile:** {profile['mobile_number']}")
-                    
-                    st.subheader("Identity Information")
-                    st.write(f"**PAN Card:** {profile['pan_card']}")
-                    st.write(f"**Aadhar Card:** {profile['aadhar_card']}")
-                    
-                    st.subheader("Address")
-                    st.write(profile['address'])
-                    st.write(f"{profile['city']}, {profile['state']} - {profile['pincode']}")
-                    st.write(profile['country'])
-                
-                if st.button("Edit Profile"):
-                    st.session_state.profile_completed = False
-                    st.experimental_rerun()
-                    
+        col1, col2 = st.columns([1, 2])
+        
+        with col1, stage("profile.photo"):
+            photo_path = profile['profile_photo_path']
+            if images.is_thumbnail(photo_path) and os.path.exists(photo_path):
+                # Pre-encoded at display size, so no resize or re-encode per render
+                st.image(images.load_thumbnail(photo_path), caption="Profile Photo",
+                         width=images.DISPLAY_WIDTH)
+            elif photo_path and os.path.exists(photo_path):
+                # Photos uploaded before thumbnails existed
+                st.image(photo_path, caption="Profile Photo", width=images.DISPLAY_WIDTH)
+            else:
+                st.warning("No profile photo uploaded")
+        
+        with col2, stage("profile.details"):
+            st.subheader("Personal Information")
+            st.write(f"**Full Name:** {profile['full_name']}")
+            st.write(f"**Email:** {profile['email']}")
+            st.write(f"**Gender:** {profile['gender']}")
+            st.write(f"**Date of Birth:** {profile['date_of_birth']}")
+            st.write(f"**Mobile:** {profile['mobile_number']}")
+            
+            st.subheader("Identity Information")
+            st.write(f"**PAN Card:** {profile['pan_card']}")
+            st.write(f"**Aadhar Card:** {profile['aadhar_card']}")
+            
+            st.subheader("Address")
+            st.write(profile['address'])
+            st.write(f"{profile['city']}, {profile['state']} - {profile['pincode']}")
+            st.write(profile['country'])
+        
+        if st.button("Edit Profile"):
+            st.session_state.profile_completed = False
+            st.experimental_rerun()
     except Exception as e:
-        st.error(f"Error fetching profile: {e}")
+        st.error(f"Error displaying profile: {e}")
 
 def card_details_form(username):
     """Display and handle card details form"""
@@ -171,99 +168,95 @@ def card_details_form(username):
                 st.error("Please fill all required fields (*)")
                 return
             
-            try:
-                with database.get_db_connection() as conn:
-                    if conn is None:
-                        st.error("Failed to connect to database")
-                        return
-                        
-                    with conn.cursor() as cursor:
-                        cursor.execute("""
-                            INSERT INTO user_cards (
-                                username, card_name, card_number, 
-                                card_classification, card_type,
-                                expiry_month, expiry_year, cvv
-                            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                        """, (
-                            username, card_name, card_number, 
-                            card_classification, card_type,
-                            expiry_month, expiry_year, cvv
-                        ))
-                        conn.commit()
-                        st.success("Card details saved successfully!")
-            except Exception as e:
-                st.error(f"Error saving card details: {e}")
+            values = {
+                'username': username, 'card_name': card_name, 'card_number': card_number,
+                'card_classification': card_classification, 'card_type': card_type,
+                'expiry_month': expiry_month, 'expiry_year': expiry_year, 'cvv': cvv,
+            }
+            result = writes.insert_row('user_cards', values,
+                                       writes.form_idempotency_key('card_form', username, values))
+            if writes.show_write_result(result, "card", "Card details saved successfully!"):
+                writes.reset_form_key('card_form')
 
-def view_card_details(username):
+def view_card_details(username, snapshot=None):
     """Display user's card details"""
+    if snapshot is None:
+        with stage("cards.fetch"):
+            snapshot = database.get_portfolio_snapshot(username)
+    cards = snapshot.cards if snapshot else []
+    
     try:
-        with database.get_db_connection() as conn:
-            if conn is None:
-                st.error("Failed to connect to database")
-                return
-                
-            with conn.cursor(dictionary=True) as cursor:
-                cursor.execute("""
-                    SELECT id, card_name, card_number, card_classification,
-                           card_type, expiry_month, expiry_year, is_active
-                    FROM user_cards 
-                    WHERE username = %s
-                    ORDER BY is_active DESC, card_classification
-                """, (username,))
-                
-                cards = cursor.fetchall()
-                
-                if cards:
-                    st.subheader("Your Card Details")
+        if cards and st.session_state.get('list_view', "Table") == "Table":
+            st.subheader("Your Card Details")
+            with stage("cards.table"):
+                display_card_table(cards, username)
+        elif cards:
+            st.subheader("Your Card Details")
+            
+            for card in cards:
+                with st.expander(f"{card['card_type']} {card['card_classification']} Card"):
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        st.write(f"**Card Name:** {card['card_name'] or 'Not specified'}")
+                        st.write(f"**Number:** **** **** **** {card['card_number'][-4:]}")
+                        st.write(f"**Status:** {'✅ Active' if card['is_active'] else '❌ Inactive'}")
+                    with col2:
+                        st.write(f"**Type:** {card['card_type']}")
+                        st.write(f"**Expiry:** {card['expiry_month']}/{card['expiry_year']}")
                     
-                    for card in cards:
-                        with st.expander(f"{card['card_type']} {card['card_classification']} Card"):
-                            col1, col2 = st.columns(2)
-                            with col1:
-                                st.write(f"**Card Name:** {card['card_name'] or 'Not specified'}")
-                                st.write(f"**Number:** **** **** **** {card['card_number'][-4:]}")
-                                st.write(f"**Status:** {'✅ Active' if card['is_active'] else '❌ Inactive'}")
-                            with col2:
-                                st.write(f"**Type:** {card['card_type']}")
-                                st.write(f"**Expiry:** {card['expiry_month']}/{card['expiry_year']}")
-                            
-                            # Add toggle and delete buttons
-                            col1, col2, _ = st.columns([1,1,2])
-                            with col1:
-                                if st.button("Toggle Status", key=f"toggle_{card['id']}"):
-                                    toggle_card_status(card['id'], not card['is_active'])
-                            with col2:
-                                if st.button("Delete", key=f"delete_{card['id']}"):
-                                    delete_card(card['id'])
-                else:
-                    st.info("No card details added yet")
+                    # Add toggle and delete buttons
+                    col1, col2, _ = st.columns([1,1,2])
+                    with col1:
+                        if st.button("Toggle Status", key=f"toggle_{card['id']}"):
+                            toggle_card_status(card, username)
+                    with col2:
+                        if st.button("Delete", key=f"delete_{card['id']}"):
+                            delete_card(card['id'], username)
+        else:
+            st.info("No card details added yet")
     except Exception as e:
-        st.error(f"Error fetching card details: {e}")
+        st.error(f"Error displaying card details: {e}")
 
-def toggle_card_status(card_id, new_status):
-    """Toggle card active status"""
-    try:
-        with database.get_db_connection() as conn:
-            if conn is None:
-                st.error("Failed to connect to database")
-                return
-                
-            with conn.cursor() as cursor:
-                cursor.execute("""
-                    UPDATE user_cards 
-                    SET is_active = %s 
-                    WHERE id = %s
-                """, (new_status, card_id))
-                conn.commit()
-                st.success("Card status updated!")
-                st.experimental_rerun()
-    except Exception as e:
-        st.error(f"Error updating card status: {e}")
+def display_card_table(cards, username):
+    """Show cards as a compact table with toggle/delete for the selected rows"""
+    df = pd.DataFrame(cards, columns=['id', 'card_name', 'card_number', 'card_classification',
+                                      'card_type', 'expiry_month', 'expiry_year', 'is_active'])
+    df['card_number'] = '**** ' + df['card_number'].str[-4:]
+    df['expiry'] = df['expiry_month'] + '/' + df['expiry_year']
+    df['is_active'] = df['is_active'].astype(bool)
+    df = df.drop(columns=['expiry_month', 'expiry_year'])
+    selected = select_rows(df, "card_table", {
+        'card_name': "Card Name",
+        'card_number': "Number",
+        'card_classification': "Type",
+        'card_type': "Network",
+        'expiry': "Expiry",
+        'is_active': st.column_config.CheckboxColumn("Active"),
+    })
+    cards_by_id = {card['id']: card for card in cards}
+    
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        if st.button("Toggle Status", key="toggle_selected_cards", disabled=len(selected) != 1):
+            toggle_card_status(cards_by_id[selected[0]], username)
+    with col3:
+        confirmed = st.checkbox("Confirm delete", key="confirm_delete_selected_cards",
+                                disabled=not selected)
+    with col2:
+        if st.button("Delete", key="delete_selected_cards", disabled=not (len(selected) == 1 and confirmed)):
+            delete_card(selected[0], username)
 
-def delete_card(card_id):
+def toggle_card_status(card, username):
+    """Flip a card's active status unless it changed since it was displayed"""
+    result = writes.update_row('user_cards', card['id'], username, card['row_version'],
+                               {'is_active': not card['is_active']})
+    if writes.show_write_result(result, "card", "Card status updated!"):
+        st.experimental_rerun()
+
+def delete_card(card_id, username):
     """Delete a card from database"""
     try:
-        with database.get_db_connection() as conn:
+        with database.get_db_connection(username) as conn:
             if conn is None:
                 st.error("Failed to connect to database")
                 return
@@ -271,9 +264,10 @@ def delete_card(card_id):
             with conn.cursor() as cursor:
                 cursor.execute("""
                     DELETE FROM user_cards 
-                    WHERE id = %s
-                """, (card_id,))
+                    WHERE id = %s AND username = %s
+                """, (card_id, username))
                 conn.commit()
+                cache.invalidate(username, 'cards')
                 st.success("Card deleted successfully!")
                 st.experimental_rerun()
     except Exception as e:
@@ -293,21 +287,13 @@ def signup():
             return
             
         try:
-            with database.get_db_connection() as conn:
-                if conn is None:
-                    st.error("Failed to connect to database")
-                    return
-                    
-                with conn.cursor() as cursor:
-                    cursor.execute(
-                        "INSERT INTO users (username, password) VALUES (%s, %s)", 
-                        (new_username, hash_password(new_password)))
-                    conn.commit()
-                    st.success("User registered successfully!")
-                    st.session_state.username = new_username
-                    st.session_state.just_signed_up = True
-                    st.session_state.logged_in = True
-                    st.experimental_rerun()
+            token = auth.register(new_username, new_password)
+            st.success("User registered successfully!")
+            st.session_state.username = new_username
+            st.session_state.auth_token = token
+            st.session_state.just_signed_up = True
+            st.session_state.logged_in = True
+            st.experimental_rerun()
         except mysql.connector.IntegrityError:
             st.error("Username already exists. Please choose a different username.")
         except Exception as e:
@@ -322,38 +308,32 @@ def login():
 
     if st.button("Log In"):
         try:
-            with database.get_db_connection() as conn:
-                if conn is None:
-                    st.error("Failed to connect to database")
-                    return
-                    
-                with conn.cursor(dictionary=True) as cursor:
-                    cursor.execute(
-                        "SELECT password FROM users WHERE username = %s", 
-                        (username,))
-                    result = cursor.fetchone()
-                    
-                    if not result or result['password'] != hash_password(password):
-                        st.error("Invalid username or password")
-                        return
-                        
-                    st.success("Logged in successfully!")
-                    st.session_state.logged_in = True
-                    st.session_state.username = username
-                    
-                    # Check if profile is completed
-                    cursor.execute(
-                        "SELECT 1 FROM user_profiles WHERE username = %s", 
-                        (username,))
-                    st.session_state.profile_completed = cursor.fetchone() is not None
-                    st.experimental_rerun()
+            result = auth.authenticate(username, password)
+            if result is None:
+                st.error("Invalid username or password")
+                return
+                
+            st.success("Logged in successfully!")
+            st.session_state.logged_in = True
+            st.session_state.username = result.username
+            st.session_state.auth_token = result.token
+            st.session_state.profile_completed = result.profile_completed
+            st.experimental_rerun()
         except Exception as e:
             st.error(f"An error occurred: {e}")
 
 def main():
     """Main application entry point"""
     init_session_state()
-    database.create_database_and_tables()
+    with stage("ensure_schema"):
+        migrations.ensure_schema()
+    
+    # Sessions are checked against the in-memory token cache, not the users table
+    if st.session_state.logged_in and auth.session_user(st.session_state.auth_token) != st.session_state.username:
+        st.session_state.logged_in = False
+        st.session_state.username = None
+        st.session_state.auth_token = None
+        st.warning("Your session has expired. Please log in again.")
     
     if not st.session_state.logged_in:
         choice = st.sidebar.selectbox("Choose Action", ["Login", "Sign Up"])
@@ -365,19 +345,33 @@ def main():
         if st.session_state.just_signed_up or not st.session_state.profile_completed:
             profile_form(st.session_state.username)
         else:
+            # Start every query the three tabs render; they run in parallel
+            # while the page is laid out, and each tab joins the results
+            with stage("prefetch_snapshot"):
+                prefetch = database.prefetch_portfolio_snapshot(
+                    st.session_state.username, *get_page_params())
+            
             # Create tabs for different sections
-            tab1, tab2, tab3 = st.tabs(["Dashboard", "Profile", "Cards"])
+            is_admin = st.session_state.username in ADMIN_USERS
+            tabs = st.tabs(["Dashboard", "Profile", "Cards"] + (["Queries"] if is_admin else []))
+            tab1, tab2, tab3 = tabs[:3]
             
-            with tab1:
-                financial_dashboard(st.session_state.username)
+            with tab1, stage("tab.dashboard"):
+                financial_dashboard(st.session_state.username, prefetch.result())
             
-            with tab2:
-                view_profile(st.session_state.username)
+            with tab2, stage("tab.profile"):
+                view_profile(st.session_state.username, prefetch.result())
             
-            with tab3:
+            with tab3, stage("tab.cards"):
                 st.header("💳 Card Management")
-                view_card_details(st.session_state.username)
-                card_details_form(st.session_state.username)
+                view_card_details(st.session_state.username, prefetch.result())
+                with stage("cards.form"):
+                    card_details_form(st.session_state.username)
+            
+            if is_admin:
+                with tabs[3]:
+                    display_query_stats()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with profile_rerun():
+        main()
\ No newline at end of file
@@ -0,0 +1,229 @@
+# auth.py
+"""Password hashing, login and in-process session tokens.
+
+Passwords are hashed with scrypt, a memory-hard KDF from the standard
+library, with a random salt per user. The cost parameters are stored in each
+hash, so they can be raised later (see ``python -m benchmarks.kdf``). Older
+hashes, including the unsalted SHA-256 ones from before this module,
+are upgraded the next time that user logs in.
+
+A successful login issues a random session token, kept in this process
+together with the username. Reruns check the token in memory and never
+query ``users`` again until the token expires or the user logs out.
+"""
+import base64
+import hashlib
+import hmac
+import itertools
+import os
+import re
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+
+from mysql.connector import Error
+
+from database import get_db_connection
+import statements
+
+SCRYPT_N = int(os.environ.get('FOLIO_SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.environ.get('FOLIO_SCRYPT_R', 8))
+SCRYPT_P = int(os.environ.get('FOLIO_SCRYPT_P', 1))
+SALT_BYTES = 16
+KEY_BYTES = 32
+SESSION_TTL = float(os.environ.get('FOLIO_SESSION_TTL', 12 * 60 * 60))
+MAX_SESSION_TOKENS = int(os.environ.get('FOLIO_MAX_SESSION_TOKENS', 100000))
+
+_LEGACY_SHA256 = re.compile(r'[0-9a-f]{64}')
+
+# Password hash and profile existence in one round trip
+LOGIN_QUERY = """
+    SELECT u.password, p.username IS NOT NULL AS has_profile
+    FROM users u
+    LEFT JOIN user_profiles p ON p.username = u.username
+    WHERE u.username = %s
+"""
+statements.register('login', LOGIN_QUERY)
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _scrypt(password, salt, n, r, p):
+    # scrypt needs about 128 * n * r bytes; leave headroom over OpenSSL's 32 MiB default
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r + 1024 * 1024, dklen=KEY_BYTES)
+
+
+def hash_password(password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    """``scrypt$n$r$p$salt$key`` for storing in ``users.password``"""
+    salt = secrets.token_bytes(SALT_BYTES)
+    return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def verify_password(password, stored):
+    """Return ``(matches, needs_rehash)`` for a stored hash of any supported kind"""
+    if stored and stored.startswith('scrypt$'):
+        try:
+            _, n, r, p, salt, key = stored.split('$')
+            n, r, p = int(n), int(r), int(p)
+            expected = _unb64(key)
+            actual = _scrypt(password, _unb64(salt), n, r, p)
+        except ValueError:
+            return False, False
+        matches = hmac.compare_digest(actual, expected)
+        return matches, matches and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    if stored and _LEGACY_SHA256.fullmatch(stored):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        matches = hmac.compare_digest(legacy, stored)
+        return matches, matches
+    return False, False
+
+
+# Verified against unknown usernames so they take as long as real ones
+_DUMMY_HASH = hash_password(secrets.token_hex(8))
+
+
+@dataclass
+class LoginResult:
+    username: str
+    profile_completed: bool
+    token: str
+
+
+class SessionTokens:
+    """Thread-safe token -> (username, expiry) map shared by all sessions.
+
+    Every token gets the same TTL, so the dict's insertion order is also
+    expiry order. ``issue`` drops expired tokens from the front and, past
+    ``max_tokens``, the oldest live ones, whose users have to log in again.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, max_tokens=MAX_SESSION_TOKENS):
+        self.ttl = ttl
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._tokens = {}
+
+    def issue(self, username):
+        token = secrets.token_urlsafe(32)
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            self._tokens[token] = (username, now + self.ttl)
+        return token
+
+    def _sweep(self, now):
+        expired = [token for token, _ in itertools.takewhile(
+            lambda item: item[1][1] < now, self._tokens.items())]
+        for token in expired:
+            del self._tokens[token]
+        while len(self._tokens) >= self.max_tokens:
+            del self._tokens[next(iter(self._tokens))]
+
+    def username(self, token):
+        """The token's user, or None if it is unknown or expired"""
+        if not token:
+            return None
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._tokens[token]
+                return None
+            return entry[0]
+
+    def revoke(self, token):
+        with self._lock:
+            self._tokens.pop(token, None)
+
+    def revoke_user(self, username):
+        with self._lock:
+            for token in [t for t, (u, _) in self._tokens.items() if u == username]:
+                del self._tokens[token]
+
+
+_tokens = SessionTokens()
+
+
+def get_session_tokens():
+    return _tokens
+
+
+def _rehash(cursor, username, old_hash, new_hash):
+    # Compare-and-set, so a password changed meanwhile is never overwritten
+    cursor.execute(
+        "UPDATE users SET password = %s WHERE username = %s AND password = %s",
+        (new_hash, username, old_hash))
+
+
+def authenticate(username, password):
+    """Check credentials and issue a session token; None if they don't match.
+
+    Raises ``mysql.connector.Error`` if the database is unavailable.
+    """
+    profile_completed = check_credentials(username, password)
+    if profile_completed is None:
+        return None
+    return LoginResult(username, profile_completed, _tokens.issue(username))
+
+
+def check_credentials(username, password):
+    """Whether the user has a profile, or None if the credentials don't match.
+
+    Upgrades an outdated password hash on success. Raises
+    ``mysql.connector.Error`` if the database is unavailable. The slow KDF
+    runs with no pooled connection held, so logins cannot drain the pool.
+    """
+    with get_db_connection(username) as conn:
+        if conn is None:
+            raise Error(msg="Failed to connect to database")
+        row = statements.fetchone(conn, 'login', (username,), dictionary=True)
+    if row is None:
+        verify_password(password, _DUMMY_HASH)
+        return None
+    matches, needs_rehash = verify_password(password, row['password'])
+    if not matches:
+        return None
+    if needs_rehash:
+        new_hash = hash_password(password)
+        with get_db_connection(username) as conn:
+            if conn is None:
+                raise Error(msg="Failed to connect to database")
+            with conn.cursor() as cursor:
+                _rehash(cursor, username, row['password'], new_hash)
+            conn.commit()
+    return bool(row['has_profile'])
+
+
+def register(username, password):
+    """Create a user and return a token for them.
+
+    Raises ``mysql.connector.IntegrityError`` if the username is taken.
+    """
+    password_hash = hash_password(password)
+    with get_db_connection(username) as conn:
+        if conn is None:
+            raise Error(msg="Failed to connect to database")
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO users (username, password) VALUES (%s, %s)",
+                (username, password_hash))
+            conn.commit()
+    return _tokens.issue(username)
+
+
+def session_user(token):
+    """Username for a session token without touching the database"""
+    return _tokens.username(token)
+
+
+def logout(token):
+    _tokens.revoke(token)
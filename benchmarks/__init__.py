@@ -0,0 +1,25 @@
+"""Benchmarks for the data-access and rendering hot paths.
+
+Seed a dedicated database, then run the suite from the repository root:
+
+    python -m benchmarks.seed --users 1000 --funds 50
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.compare baseline.json results.json
+    python -m benchmarks.explain    # fail on scans or filesorts in hot queries
+
+Both commands target ``FOLIO_BENCH_DB`` (default ``folio_fetch_bench``) so the
+application database is never touched.
+"""
+import os
+
+BENCH_DB = os.environ.get('FOLIO_BENCH_DB', 'folio_fetch_bench')
+BENCH_PASSWORD = 'bench-password'
+
+
+def use_bench_database():
+    """Point the app's DB_CONFIG at the benchmark database before it is imported"""
+    os.environ['FOLIO_DB_NAME'] = BENCH_DB
+
+
+def bench_username(index):
+    return f"bench_user_{index:06d}"
@@ -0,0 +1,142 @@
+"""Sustained-load test for the JSON API against the seeded database.
+
+    FOLIO_DB_NAME=folio_fetch_bench uvicorn api:app --workers 4 --port 8000
+    python -m benchmarks.api_load --url http://127.0.0.1:8000 --duration 60 --concurrency 32
+
+Logs in as the first ``--users`` seeded users, then keeps ``--concurrency``
+keep-alive connections busy with GETs spread over the endpoints for
+``--duration`` seconds. With ``--conditional`` each client resends the ETag
+it last saw, the way a caching mobile client does. The report has overall
+and per-second throughput (to show the rate is sustained), latency
+percentiles and status counts.
+"""
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from benchmarks import BENCH_PASSWORD, bench_username
+from benchmarks.run import summarize
+
+ENDPOINTS = ('/v1/summary', '/v1/banks', '/v1/funds', '/v1/cards', '/v1/user')
+
+
+def connect(url):
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    return connection_class(parts.hostname, parts.port, timeout=30)
+
+
+def login(url, username):
+    conn = connect(url)
+    try:
+        body = json.dumps({'username': username, 'password': BENCH_PASSWORD})
+        conn.request('POST', '/v1/sessions', body, {'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        payload = response.read()
+        if response.status != 201:
+            raise RuntimeError(f"Login as {username} failed: {response.status} {payload[:200]!r}")
+        return json.loads(payload)['token']
+    finally:
+        conn.close()
+
+
+def worker(url, tokens, deadline, conditional, results, lock):
+    conn = connect(url)
+    etags = {}
+    latencies, statuses, per_second, received = [], Counter(), Counter(), 0
+    while time.monotonic() < deadline:
+        token = random.choice(tokens)
+        path = random.choice(ENDPOINTS)
+        headers = {'Authorization': f'Bearer {token}', 'Accept-Encoding': 'gzip'}
+        if conditional and (token, path) in etags:
+            headers['If-None-Match'] = etags[(token, path)]
+        started = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            statuses['connection error'] += 1
+            conn.close()
+            conn = connect(url)
+            continue
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status] += 1
+        per_second[int(time.monotonic())] += 1
+        received += len(body)
+        if response.getheader('ETag'):
+            etags[(token, path)] = response.getheader('ETag')
+    conn.close()
+    with lock:
+        results['latencies'].extend(latencies)
+        results['statuses'].update(statuses)
+        results['per_second'].update(per_second)
+        results['bytes'] += received
+
+
+def run(args):
+    tokens = [login(args.url, bench_username(i)) for i in range(args.users)]
+    results = {'latencies': [], 'statuses': Counter(), 'per_second': Counter(), 'bytes': 0}
+    lock = threading.Lock()
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=worker,
+                                args=(args.url, tokens, deadline, args.conditional, results, lock))
+               for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    # Whole seconds only: the first and last ones are partly idle
+    seconds = sorted(results['per_second'].items())[1:-1]
+    rates = sorted(count for _, count in seconds)
+    return {
+        'url': args.url,
+        'duration_seconds': round(elapsed, 1),
+        'concurrency': args.concurrency,
+        'users': args.users,
+        'conditional': args.conditional,
+        'requests': len(results['latencies']),
+        'requests_per_second': round(len(results['latencies']) / elapsed, 1),
+        'per_second': {
+            'min': rates[0] if rates else None,
+            'median': rates[len(rates) // 2] if rates else None,
+            'max': rates[-1] if rates else None,
+        },
+        'bytes_received': results['bytes'],
+        'statuses': {str(k): v for k, v in sorted(results['statuses'].items(), key=str)},
+        'latency_ms': summarize(results['latencies']) if results['latencies'] else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--duration', type=float, default=30, help="seconds of load")
+    parser.add_argument('--concurrency', type=int, default=16, help="parallel keep-alive clients")
+    parser.add_argument('--users', type=int, default=100, help="seeded users to log in as")
+    parser.add_argument('--conditional', action='store_true', help="send If-None-Match")
+    parser.add_argument('--output', help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    failed = any(not status.startswith(('2', '3')) for status in report['statuses'])
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
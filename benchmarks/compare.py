@@ -0,0 +1,61 @@
+"""Compare two benchmark result files and flag regressions.
+
+    python -m benchmarks.compare baseline.json results.json --threshold 10
+
+Exits with status 1 when any benchmark's chosen percentile got slower by
+more than the threshold, so it can gate a CI job.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)['results']
+
+
+def compare(baseline, current, metric='p95', threshold=10.0):
+    """Return ``(rows, regressed)`` where each row is name, before, after, change %"""
+    rows = []
+    regressed = False
+    for name in sorted(set(baseline) | set(current)):
+        before = baseline.get(name, {}).get(metric)
+        after = current.get(name, {}).get(metric)
+        change = (after - before) / before * 100 if before and after is not None else None
+        if change is not None and change > threshold:
+            regressed = True
+        rows.append((name, before, after, change))
+    return rows, regressed
+
+
+def format_row(name, before, after, change, threshold):
+    def ms(value):
+        return f"{value:10.2f}" if value is not None else f"{'-':>10}"
+    if change is None:
+        status = "new" if before is None else "removed" if after is None else ""
+        delta = f"{'-':>9}"
+    else:
+        status = "REGRESSED" if change > threshold else "improved" if change < -threshold else ""
+        delta = f"{change:+8.1f}%"
+    return f"{name:<32} {ms(before)} {ms(after)} {delta}  {status}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--metric', default='p95', help="summary field to compare (default p95)")
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help="percent slowdown treated as a regression")
+    args = parser.parse_args(argv)
+
+    rows, regressed = compare(load(args.baseline), load(args.current), args.metric, args.threshold)
+    print(f"{'benchmark':<32} {'before ms':>10} {'after ms':>10} {'change':>9}  ({args.metric})")
+    for row in rows:
+        print(format_row(*row, args.threshold))
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
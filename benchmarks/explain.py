@@ -0,0 +1,138 @@
+"""Query-plan regression check for every registered hot statement.
+
+    python -m benchmarks.seed --users 1000 --funds 50
+    python -m benchmarks.explain [--user bench_user_000000] [--analyze]
+
+Runs ``EXPLAIN`` (``EXPLAIN QUERY PLAN`` on SQLite) for each statement in
+the ``statements`` registry with sample parameters for a seeded user. It
+fails if any plan reads a whole table or index, or sorts or groups through
+a temporary table (MySQL's "Using filesort" / "Using temporary"). Run it
+against a seeded database: on near-empty tables a scan is the planner's
+right answer and the check would be meaningless. ``--analyze`` also prints
+MySQL's ``EXPLAIN ANALYZE`` timings. A newly registered statement needs an
+entry in ``sample_params`` before it passes.
+"""
+import argparse
+import json
+import sys
+
+from benchmarks import bench_username, use_bench_database
+
+use_bench_database()
+
+import api  # noqa: E402,F401  (registers its statements)
+import auth  # noqa: E402,F401
+import database  # noqa: E402
+import returns  # noqa: E402,F401
+import sharding  # noqa: E402
+import statements  # noqa: E402
+
+FULL_SCAN_TYPES = ('ALL', 'index')  # whole table, whole index
+
+
+def sample_params(cursor, username):
+    """Parameters for each registered statement, as the app would send them"""
+    cursor.execute("SELECT id FROM user_mutual_funds WHERE username = %s ORDER BY id LIMIT 1",
+                   (username,))
+    row = cursor.fetchone()
+    fund_id = row[0] if row else 0
+    page = database.PAGE_SIZE + 1
+    return {
+        'banks.list': (username,),
+        'funds.list': (username,),
+        'banks.page': (username, 0, page),
+        'funds.page': (username, 0, page),
+        'cards.list': (username,),
+        'profile': (username,),
+        'summary': (username,),
+        'aggregates': (username, username),
+        'transactions.user': (username,),
+        'transactions.fund': (username, fund_id),
+        'login': (username,),
+        'session': ('0' * 64,),
+    }
+
+
+def mysql_plan(cursor, sql, params):
+    """(plan lines, problems) from MySQL's tabular EXPLAIN"""
+    cursor.execute(f"EXPLAIN {sql}", params)
+    columns = [c[0] for c in cursor.description]
+    lines, problems = [], []
+    for row in (dict(zip(columns, values)) for values in cursor.fetchall()):
+        extra = row.get('Extra') or ''
+        lines.append(f"{row['select_type']} {row['table']} type={row['type']} "
+                     f"key={row['key']} rows={row['rows']} {extra}".rstrip())
+        if row['type'] in FULL_SCAN_TYPES:
+            kind = 'table' if row['type'] == 'ALL' else 'index'
+            problems.append(f"full {kind} scan of {row['table']}")
+        if 'Using filesort' in extra:
+            problems.append(f"filesort on {row['table']}")
+        if 'Using temporary' in extra:
+            problems.append(f"temporary table for {row['table']}")
+    return lines, problems
+
+
+def sqlite_plan(cursor, sql, params):
+    """(plan lines, problems) from SQLite's EXPLAIN QUERY PLAN"""
+    cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+    lines = [row[3] for row in cursor.fetchall()]
+    problems = [f"full scan: {line}" for line in lines
+                if line.startswith('SCAN ') and line != 'SCAN CONSTANT ROW']
+    problems += [f"temporary b-tree: {line}" for line in lines if 'TEMP B-TREE' in line]
+    return lines, problems
+
+
+def explain_analyze(cursor, sql, params):
+    cursor.execute(f"EXPLAIN ANALYZE {sql}", params)
+    return [line for row in cursor.fetchall() for line in row[0].splitlines()]
+
+
+def run(username, analyze=False):
+    # Planned on the shard holding the user
+    backend = sharding.backends()[sharding.shard_of(username)].name
+    plan = mysql_plan if backend == 'mysql' else sqlite_plan
+    results = []
+    with database.get_db_connection(username) as conn:
+        if conn is None:
+            raise SystemExit("Failed to connect to the benchmark database")
+        with conn.cursor() as cursor:
+            params = sample_params(cursor, username)
+            for name in statements.names():
+                if name not in params:
+                    results.append({'statement': name, 'ok': False, 'plan': [],
+                                    'problems': ["no sample parameters in benchmarks.explain"]})
+                    continue
+                sql = statements.sql(name)
+                lines, problems = plan(cursor, sql, params[name])
+                result = {'statement': name, 'ok': not problems, 'plan': lines, 'problems': problems}
+                if analyze and backend == 'mysql':
+                    result['analyze'] = explain_analyze(cursor, sql, params[name])
+                results.append(result)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--user', default=bench_username(0), help="seeded user to plan for")
+    parser.add_argument('--analyze', action='store_true', help="also run EXPLAIN ANALYZE (MySQL)")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = run(args.user, args.analyze)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print(f"{'ok  ' if result['ok'] else 'FAIL'} {result['statement']}")
+            for line in result['plan'] + result.get('analyze', []):
+                print(f"       {line}")
+            for problem in result['problems']:
+                print(f"     ! {problem}")
+    failed = [r['statement'] for r in results if not r['ok']]
+    print(f"{len(results) - len(failed)}/{len(results)} statements use index access only",
+          file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Pick scrypt cost parameters that keep login latency within budget.
+
+    python -m benchmarks.kdf --budget-ms 250 --peak-logins 20 --workers 4
+
+Each candidate ``n`` is timed by running password verifications from
+``--workers`` threads at once, the way concurrent logins hit one app
+process. A candidate passes if its p99 is within the budget and the peak
+login rate keeps the CPUs below ``--max-utilisation``. The largest passing
+``n`` is recommended, as the value for ``FOLIO_SCRYPT_N``.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from auth import hash_password, verify_password
+from benchmarks.run import summarize
+
+PASSWORD = "correct horse battery staple"
+
+
+def time_verifications(n, r, p, samples, workers):
+    stored = hash_password(PASSWORD, n=n, r=r, p=p)
+
+    def verify(_):
+        started = time.perf_counter()
+        if not verify_password(PASSWORD, stored)[0]:
+            raise RuntimeError("verification failed")
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(verify, range(samples)))
+
+
+def evaluate(args):
+    cpus = args.cpus or os.cpu_count() or 1
+    results = []
+    for log_n in range(args.min_log_n, args.max_log_n + 1):
+        n = 2 ** log_n
+        samples = time_verifications(n, args.r, args.p, args.samples, args.workers)
+        summary = summarize(samples)
+        # CPU-seconds per second spent hashing at the peak rate, per core
+        utilisation = args.peak_logins * summary['mean'] / 1000 / cpus
+        passed = summary['p99'] <= args.budget_ms and utilisation <= args.max_utilisation
+        results.append({
+            'n': n, 'r': args.r, 'p': args.p,
+            'memory_mib': round(128 * n * args.r / 2 ** 20, 1),
+            **summary,
+            'cpu_utilisation': round(utilisation, 3),
+            'within_budget': passed,
+        })
+        print(f"  n=2^{log_n}: p99 {summary['p99']:.1f} ms, cpu {utilisation:.0%}"
+              f"{'' if passed else '  (over budget)'}", file=sys.stderr)
+    passing = [row for row in results if row['within_budget']]
+    return {
+        'budget_ms': args.budget_ms,
+        'peak_logins_per_second': args.peak_logins,
+        'cpus': cpus,
+        'workers': args.workers,
+        'recommended_n': passing[-1]['n'] if passing else None,
+        'candidates': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=250, help="p99 login hashing budget")
+    parser.add_argument('--peak-logins', type=float, default=10, help="logins per second at peak")
+    parser.add_argument('--max-utilisation', type=float, default=0.5,
+                        help="share of CPU that hashing may use at peak")
+    parser.add_argument('--workers', type=int, default=4, help="concurrent verifications")
+    parser.add_argument('--cpus', type=int, help="cores available to the app (default: all)")
+    parser.add_argument('--samples', type=int, default=40)
+    parser.add_argument('--min-log-n', type=int, default=12)
+    parser.add_argument('--max-log-n', type=int, default=17)
+    parser.add_argument('-r', type=int, default=8)
+    parser.add_argument('-p', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    report = evaluate(args)
+    print(json.dumps(report, indent=2))
+    return 0 if report['recommended_n'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
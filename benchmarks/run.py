@@ -0,0 +1,194 @@
+"""Time the data-access and rendering hot paths against the seeded database.
+
+    python -m benchmarks.run --iterations 50 --output results.json
+
+Every benchmark picks a random seeded user per sample. Readers are timed
+twice: ``cold`` bypasses the in-process cache, ``warm`` reads through it.
+Renders go through Streamlit's ``AppTest`` harness with the cache cleared
+before each sample, so they include the database round trips.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from mysql.connector import Error
+from streamlit.testing.v1 import AppTest
+
+from benchmarks import BENCH_DB, BENCH_PASSWORD, bench_username, use_bench_database
+
+use_bench_database()
+
+import cache  # noqa: E402  (must follow use_bench_database)
+import database  # noqa: E402
+import dashboard  # noqa: E402
+import export  # noqa: E402
+import querylog  # noqa: E402
+import sharding  # noqa: E402
+
+APP_PATH = str(Path(__file__).resolve().parent.parent / "app.py")
+PERCENTILES = (50, 90, 95, 99)
+RENDER_TIMEOUT = 60
+
+
+def summarize(samples):
+    """Milliseconds summary of a list of durations in seconds"""
+    ms = np.asarray(samples, dtype=float) * 1000
+    summary = {
+        'count': int(ms.size),
+        'mean': float(ms.mean()),
+        'min': float(ms.min()),
+        'max': float(ms.max()),
+        'stdev': float(ms.std()),
+    }
+    summary.update({f'p{p}': float(v) for p, v in zip(PERCENTILES, np.percentile(ms, PERCENTILES))})
+    return {k: round(v, 3) if isinstance(v, float) else v for k, v in summary.items()}
+
+
+def measure(step, users, iterations, warmup, setup=None):
+    """Run ``step(username)`` and return per-sample wall times in seconds"""
+    samples = []
+    for i in range(warmup + iterations):
+        username = random.choice(users)
+        if setup is not None:
+            setup(username)
+        started = time.perf_counter()
+        step(username)
+        elapsed = time.perf_counter() - started
+        if i >= warmup:
+            samples.append(elapsed)
+    return samples
+
+
+def cold(username):
+    cache.get_cache().clear()
+
+
+def check_render(at):
+    """Fail the benchmark rather than time an error page"""
+    problems = [e.value for e in at.exception] + [e.value for e in at.error]
+    if problems:
+        raise RuntimeError(f"Render failed: {problems[0]}")
+    return at
+
+
+# AppTest scripts run as standalone modules, so they import what they need.
+def dashboard_script(username):
+    import database
+    import dashboard
+    prefetch = database.prefetch_portfolio_snapshot(username, *dashboard.get_page_params())
+    dashboard.financial_dashboard(username, prefetch.result())
+
+
+def card_details_script(username):
+    import app
+    app.view_card_details(username)
+
+
+def export_options_script(username):
+    import export
+    export.display_export_options(username)
+
+
+def render(script):
+    def step(username):
+        at = AppTest.from_function(script, default_timeout=RENDER_TIMEOUT, args=(username,))
+        check_render(at.run())
+    return step
+
+
+def login(username):
+    at = AppTest.from_file(APP_PATH, default_timeout=RENDER_TIMEOUT).run()
+    at.text_input[0].input(username)
+    at.text_input[1].input(BENCH_PASSWORD)
+    at.button[0].click().run()
+    check_render(at)
+    if not at.session_state['logged_in']:
+        raise RuntimeError(f"Login failed for {username}")
+
+
+def prefetch_snapshot(username):
+    database.prefetch_portfolio_snapshot(username).result()
+
+
+def export_workbook(username):
+    export.build_export(username, list(export.DATASETS), 'Excel').close()
+
+
+BENCHMARKS = {
+    'get_bank_data.cold': (dashboard.get_bank_data.uncached, cold),
+    'get_bank_data.warm': (dashboard.get_bank_data, None),
+    'get_mf_data.cold': (dashboard.get_mf_data.uncached, cold),
+    'get_mf_data.warm': (dashboard.get_mf_data, None),
+    'get_portfolio_snapshot.cold': (database.get_portfolio_snapshot.uncached, cold),
+    'prefetch_portfolio_snapshot.cold': (prefetch_snapshot, cold),
+    'view_card_details.render': (render(card_details_script), cold),
+    'display_export_options.render': (render(export_options_script), cold),
+    'build_export.xlsx': (export_workbook, None),
+    'login': (login, cold),
+    'financial_dashboard.render': (render(dashboard_script), cold),
+}
+
+
+def seeded_users(limit):
+    try:
+        counts = sharding.gather("SELECT COUNT(*) FROM users WHERE username LIKE 'bench\\_user\\_%'")
+    except Error as e:
+        raise SystemExit(f"Failed to read the benchmark database: {e}")
+    count = sum(row[0] for row in counts)
+    if not count:
+        raise SystemExit("No benchmark users found; run `python -m benchmarks.seed` first")
+    return [bench_username(i) for i in range(min(count, limit))]
+
+
+def run(args):
+    random.seed(args.seed)
+    users = seeded_users(args.users)
+    selected = [name for name in BENCHMARKS if not args.only or any(o in name for o in args.only)]
+    results = {}
+    for name in selected:
+        step, setup = BENCHMARKS[name]
+        iterations = max(1, args.iterations // 5) if name.endswith(('.render', 'login')) else args.iterations
+        print(f"  {name} ({iterations} samples)", file=sys.stderr)
+        results[name] = summarize(measure(step, users, iterations, args.warmup, setup))
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'database': BENCH_DB,
+            'users': len(users),
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'pool': {shard: backend.stats() for shard, backend in sharding.backends().items()},
+            'cache': cache.get_cache_stats(),
+            'queries': querylog.get_query_stats().top(10),
+        },
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50,
+                        help="samples per reader; renders and login take a fifth of this")
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--users', type=int, default=1000, help="sample from the first N seeded users")
+    parser.add_argument('--only', nargs='*', help="run benchmarks whose name contains any of these")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = json.dumps(run(args), indent=2, default=str)
+    if args.output:
+        Path(args.output).write_text(report + "\n", encoding="utf-8")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Seed the benchmark database with synthetic users and holdings.
+
+    python -m benchmarks.seed --users 10000 --banks 5 --funds 500 --cards 4
+
+Existing benchmark rows are removed first unless ``--append`` is given.
+"""
+import argparse
+import random
+import sys
+import time
+
+from mysql.connector import Error
+
+from benchmarks import BENCH_PASSWORD, bench_username, use_bench_database
+
+use_bench_database()
+
+import migrations  # noqa: E402  (must follow use_bench_database)
+import sharding  # noqa: E402
+from auth import hash_password  # noqa: E402
+
+BATCH_SIZE = 2000
+BANKS = ["SBI", "HDFC Bank", "ICICI Bank", "Axis Bank", "Kotak Mahindra Bank", "Bank of Baroda"]
+FUND_TYPES = ["Equity", "Debt", "Hybrid", "ELSS", "Other"]
+CARD_NETWORKS = ["Visa", "Mastercard", "RuPay", "Amex", "Other"]
+
+
+def insert_batches(cursor, sql, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        cursor.executemany(sql, rows[start:start + BATCH_SIZE])
+
+
+def user_rows(index, rng, args):
+    username = bench_username(index)
+    banks = [(
+        username, rng.choice(BANKS), f"{index:08d}{b:04d}", f"BENC0{index % 1000000:06d}",
+        round(rng.uniform(0, 500000), 2), None,
+    ) for b in range(args.banks)]
+    funds = []
+    for f in range(args.funds):
+        invested = round(rng.uniform(1000, 200000), 2)
+        funds.append((
+            username, f"F{index:07d}/{f:05d}", f"Benchmark Fund {f % 200}",
+            rng.choice(FUND_TYPES), invested, round(invested * rng.uniform(0.7, 1.6), 2), None,
+        ))
+    cards = [(
+        username, f"4{index:09d}{c:06d}", f"Card {c}", rng.choice(["Debit", "Credit"]),
+        rng.choice(CARD_NETWORKS), f"{rng.randint(1, 12):02d}", str(rng.randint(2026, 2035)), "123",
+    ) for c in range(args.cards)]
+    profile = (username, f"Bench User {index}", f"{username}@example.com", "Other",
+               "1990-01-01", None, None, None, None, "1 Bench Street", "Mumbai",
+               "Maharashtra", "400001", "India")
+    return username, banks, funds, cards, profile
+
+
+def clear(conn, shard):
+    with conn.cursor() as cursor:
+        for table in ("user_cards", "user_mutual_funds", "user_banks", "user_profiles", "users"):
+            cursor.execute(f"DELETE FROM {table} WHERE username LIKE 'bench!_user!_%' ESCAPE '!'")
+    conn.commit()
+
+
+def write(shard, pending):
+    """Insert one shard's pending rows in a transaction on that shard"""
+    def insert(conn, _):
+        with conn.cursor() as cursor:
+            flush(cursor, pending)
+        conn.commit()
+    sharding.scatter(insert, [shard])
+
+
+def seed(args):
+    if not migrations.ensure_schema():
+        raise SystemExit("Could not bring the benchmark schema up to date")
+    password_hash = database_password_hash()
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+
+    try:
+        if not args.append:
+            sharding.scatter(clear)
+
+        pending = {}  # shard -> rows waiting to be inserted there
+        for index in range(args.users):
+            username, banks, funds, cards, profile = user_rows(index, rng, args)
+            shard = sharding.shard_of(username)
+            rows = pending.setdefault(shard, {'users': [], 'banks': [], 'funds': [],
+                                              'cards': [], 'profiles': []})
+            rows['users'].append((username, password_hash))
+            rows['banks'] += banks
+            rows['funds'] += funds
+            rows['cards'] += cards
+            rows['profiles'].append(profile)
+            if len(rows['funds']) + len(rows['banks']) >= 50000:
+                write(shard, rows)
+                print(f"  seeded {index + 1}/{args.users} users", file=sys.stderr)
+        for shard, rows in pending.items():
+            write(shard, rows)
+    except Error as e:
+        raise SystemExit(f"Failed to seed the benchmark database: {e}")
+
+    elapsed = time.perf_counter() - started
+    print(f"Seeded {args.users} users in {elapsed:.1f}s", file=sys.stderr)
+
+
+def flush(cursor, pending):
+    insert_batches(cursor, "INSERT INTO users (username, password) VALUES (%s, %s)", pending['users'])
+    insert_batches(cursor, """
+        INSERT INTO user_profiles (
+            username, full_name, email, gender, date_of_birth,
+            pan_card, aadhar_card, mobile_number, profile_photo_path,
+            address, city, state, pincode, country
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, pending['profiles'])
+    insert_batches(cursor, """
+        INSERT INTO user_banks (
+            username, bank_name, account_number,
+            ifsc_code, account_balance, nominee_name
+        ) VALUES (%s, %s, %s, %s, %s, %s)
+    """, pending['banks'])
+    insert_batches(cursor, """
+        INSERT INTO user_mutual_funds (
+            username, folio_number, fund_name,
+            fund_type, investment_amount,
+            current_value, nominee_name
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, pending['funds'])
+    insert_batches(cursor, """
+        INSERT INTO user_cards (
+            username, card_number, card_name,
+            card_classification, card_type,
+            expiry_month, expiry_year, cvv
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, pending['cards'])
+    for rows in pending.values():
+        rows.clear()
+
+
+def database_password_hash():
+    """Hash shared by every benchmark user, computed the same way signup does"""
+    return hash_password(BENCH_PASSWORD)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--banks', type=int, default=5, help="bank accounts per user")
+    parser.add_argument('--funds', type=int, default=50, help="mutual funds per user")
+    parser.add_argument('--cards', type=int, default=3, help="cards per user")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--append', action='store_true', help="keep existing benchmark rows")
+    seed(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
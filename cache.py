@@ -0,0 +1,168 @@
+# cache.py
+"""Per-user read-through cache for data that only changes on form submission.
+
+Entries are keyed by ``(username, entity, args)`` and expire after a TTL. When the
+entry count or the estimated memory use goes over its cap, the least recently
+used entries are evicted first. Write paths call ``invalidate(username, entity)``,
+which also drops every entity derived from it (for example the snapshot).
+"""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+CACHE_TTL = float(os.environ.get('FOLIO_CACHE_TTL', 300))
+CACHE_MAX_ENTRIES = int(os.environ.get('FOLIO_CACHE_MAX_ENTRIES', 2048))
+CACHE_MAX_BYTES = int(os.environ.get('FOLIO_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# Entities whose cached values are built from another entity's rows
+DEPENDENTS = {
+    'banks': ('snapshot', 'aggregates', 'history', 'summary'),
+    'funds': ('snapshot', 'aggregates', 'history', 'returns', 'summary'),
+    'transactions': ('returns',),
+    'cards': ('snapshot', 'summary'),
+    'profile': ('snapshot',),
+}
+
+
+def estimate_size(value):
+    """Rough deep size in bytes of rows made of dicts, lists and scalars"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimate_size(v) for v in value)
+    elif hasattr(value, '__dict__'):
+        size += estimate_size(vars(value))
+    return size
+
+
+class UserCache:
+    """Thread-safe TTL + LRU cache with an approximate memory cap"""
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (username, entity) -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, username, entity, args=()):
+        """Return ``(True, value)`` on a fresh hit, ``(False, None)`` otherwise"""
+        key = (username, entity, args)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return True, entry[2]
+                self._drop(key)
+                self._stats['expired'] += 1
+            self._stats['misses'] += 1
+            return False, None
+
+    def set(self, username, entity, value, args=()):
+        key = (username, entity, args)
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def invalidate(self, username, *entities):
+        """Drop the given entities (and their dependents) for one user.
+
+        Pass ``username=None`` to drop them for every user, e.g. after a
+        bulk job that touched many accounts.
+        """
+        targets = set(entities)
+        for entity in entities:
+            targets.update(DEPENDENTS.get(entity, ()))
+        with self._lock:
+            keys = [k for k in self._entries
+                    if k[1] in targets and (username is None or k[0] == username)]
+            for key in keys:
+                self._drop(key)
+            self._stats['invalidations'] += len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+_cache = UserCache()
+
+
+def get_cache():
+    """The process-wide cache shared by every Streamlit session"""
+    return _cache
+
+
+_invalidate_listeners = []
+
+
+def on_invalidate(listener):
+    """Also call ``listener(username)`` on every ``invalidate``, i.e. after each write"""
+    _invalidate_listeners.append(listener)
+
+
+def invalidate(username, *entities):
+    _cache.invalidate(username, *entities)
+    for listener in _invalidate_listeners:
+        listener(username)
+
+
+def get_cache_stats():
+    """Hit/miss/eviction counters, for measuring the DB load saved"""
+    return _cache.stats()
+
+
+def cached(entity):
+    """Read-through decorator for ``func(username, ...)`` readers.
+
+    Extra positional arguments (such as page cursors) become part of the key;
+    invalidating an entity drops it for every argument combination. ``None``
+    results (failed fetches) are never cached, and neither are calls that
+    pass keyword arguments.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(username, *args, **kwargs):
+            if kwargs:
+                return func(username, *args, **kwargs)
+            hit, value = _cache.get(username, entity, args)
+            if hit:
+                return value
+            value = func(username, *args)
+            if value is not None:
+                _cache.set(username, entity, value, args)
+            return value
+        wrapper.uncached = func
+        return wrapper
+    return decorator
@@ -1,6 +1,8 @@
 import streamlit as st
-from database import get_db_connection
+from database import get_db_connection, get_cards
 from mysql.connector import Error
+from cache import invalidate
+from writes import form_idempotency_key, insert_row, reset_form_key, show_write_result, update_row
 
 def card_details_form(username):
     st.subheader("Add Card Details")
@@ -24,100 +26,66 @@ def card_details_form(username):
                 st.error("Please fill all required fields (*)")
                 return
             
-            conn = get_db_connection()
-            if conn is not None:
-                cursor = conn.cursor()
-                try:
-                    cursor.execute("""
-                        INSERT INTO user_cards (
-                            username, card_name, card_number, 
-                            card_classification, card_type,
-                            expiry_month, expiry_year, cvv
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        username, card_name, card_number, 
-                        card_classification, card_type,
-                        expiry_month, expiry_year, cvv
-                    ))
-                    conn.commit()
-                    st.success("Card details saved successfully!")
-                except Error as e:
-                    st.error(f"Error saving card details: {e}")
-                finally:
-                    cursor.close()
-                    conn.close()
+            values = {
+                'username': username, 'card_name': card_name, 'card_number': card_number,
+                'card_classification': card_classification, 'card_type': card_type,
+                'expiry_month': expiry_month, 'expiry_year': expiry_year, 'cvv': cvv,
+            }
+            result = insert_row('user_cards', values,
+                                form_idempotency_key('card_form', username, values))
+            if show_write_result(result, "card", "Card details saved successfully!"):
+                reset_form_key('card_form')
 
 def view_card_details(username):
-    conn = get_db_connection()
-    if conn is not None:
-        cursor = conn.cursor(dictionary=True)
-        try:
-            cursor.execute("""
-                SELECT id, card_name, card_number, card_classification,
-                       card_type, expiry_month, expiry_year, is_active
-                FROM user_cards 
-                WHERE username = %s
-                ORDER BY is_active DESC, card_classification
-            """, (username,))
-            
-            cards = cursor.fetchall()
-            
-            if cards:
-                st.subheader("Your Card Details")
+    cards = get_cards(username)
+    if cards is None:
+        return
+
+    if cards:
+        st.subheader("Your Card Details")
+        
+        for card in cards:
+            with st.expander(f"{card['card_type']} {card['card_classification']} Card"):
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.write(f"**Card Name:** {card['card_name'] or 'Not specified'}")
+                    st.write(f"**Number:** **** **** **** {card['card_number'][-4:]}")
+                    st.write(f"**Status:** {'✅ Active' if card['is_active'] else '❌ Inactive'}")
+                with col2:
+                    st.write(f"**Type:** {card['card_type']}")
+                    st.write(f"**Expiry:** {card['expiry_month']}/{card['expiry_year']}")
                 
-                for card in cards:
-                    with st.expander(f"{card['card_type']} {card['card_classification']} Card"):
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            st.write(f"**Card Name:** {card['card_name'] or 'Not specified'}")
-                            st.write(f"**Number:** **** **** **** {card['card_number'][-4:]}")
-                            st.write(f"**Status:** {'✅ Active' if card['is_active'] else '❌ Inactive'}")
-                        with col2:
-                            st.write(f"**Type:** {card['card_type']}")
-                            st.write(f"**Expiry:** {card['expiry_month']}/{card['expiry_year']}")
-                        
-                        # Add toggle and delete buttons
-                        col1, col2, _ = st.columns([1,1,2])
-                        with col1:
-                            if st.button("Toggle Status", key=f"toggle_{card['id']}"):
-                                toggle_card_status(card['id'], not card['is_active'])
-                        with col2:
-                            if st.button("Delete", key=f"delete_{card['id']}"):
-                                delete_card(card['id'])
-            else:
-                st.info("No card details added yet")
-        except Error as e:
-            st.error(f"Error fetching card details: {e}")
-        finally:
-            cursor.close()
-            conn.close()
+                # Add toggle and delete buttons
+                col1, col2, _ = st.columns([1,1,2])
+                with col1:
+                    if st.button("Toggle Status", key=f"toggle_{card['id']}"):
+                        toggle_card_status(card, username)
+                with col2:
+                    if st.button("Delete", key=f"delete_{card['id']}"):
+                        delete_card(card['id'], username)
+    else:
+        st.info("No card details added yet")
 
-def toggle_card_status(card_id, new_status):
-    try:
-        conn = get_db_connection()
-        if conn is not None:
-            with conn.cursor() as cursor:
-                cursor.execute("""
-                    UPDATE user_cards 
-                    SET is_active = %s 
-                    WHERE id = %s
-                """, (new_status, card_id))
-                conn.commit()
-                st.success("Card status updated!")
-                st.experimental_rerun()
-    except Error as e:
-        st.error(f"Error updating card status: {e}")
+def toggle_card_status(card, username):
+    result = update_row('user_cards', card['id'], username, card['row_version'],
+                        {'is_active': not card['is_active']})
+    if show_write_result(result, "card", "Card status updated!"):
+        st.experimental_rerun()
 
-def delete_card(card_id):
+def delete_card(card_id, username):
     try:
-        conn = get_db_connection()
-        if conn is not None:
+        with get_db_connection(username) as conn:
+            if conn is None:
+                st.error("Failed to connect to database")
+                return
+
             with conn.cursor() as cursor:
                 cursor.execute("""
                     DELETE FROM user_cards 
-                    WHERE id = %s
-                """, (card_id,))
+                    WHERE id = %s AND username = %s
+                """, (card_id, username))
                 conn.commit()
+                invalidate(username, 'cards')
                 st.success("Card deleted successfully!")
                 st.experimental_rerun()
     except Error as e:
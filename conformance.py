@@ -0,0 +1,397 @@
+# conformance.py
+"""Behaviour every storage backend must share, checked against a live database.
+
+Runs the app's own data-layer functions against a throwaway user and
+compares the results with what the MySQL deployment guarantees: unique keys,
+row versions, trigger-maintained totals, multi-statement snapshots, cascades
+and so on. Both backends must pass::
+
+    python conformance.py --backend sqlite --path /tmp/folio_check.db
+    FOLIO_DB_NAME=folio_fetch_check python conformance.py --backend mysql
+    python conformance.py --shard-map /tmp/folio_shards.json
+
+With a shard map the checks run through the router, and the user is also
+moved to another shard and checked again there.
+
+Exits non-zero if any check fails. The user's rows are removed afterwards.
+``pytest conformance.py`` runs every check against a fresh SQLite file.
+"""
+import argparse
+import contextlib
+import io
+import logging
+import secrets
+import sys
+import time
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+from mysql.connector import IntegrityError
+
+import api
+import auth
+import database
+import export
+import importer
+import migrations
+import returns
+import sharding
+import statements
+import summary
+import writes
+from cache import get_cache
+
+CHECKS = []
+
+
+def check(func):
+    CHECKS.append(func)
+    return func
+
+
+def expect(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def _summary(username):
+    return database.get_portfolio_summary.uncached(username)
+
+
+def _bank(username, number, balance):
+    return {'username': username, 'bank_name': f"Bank {number}", 'account_number': number,
+            'ifsc_code': 'TEST0000001', 'account_balance': balance, 'nominee_name': None}
+
+
+def _fund(username, folio, invested, value):
+    return {'username': username, 'folio_number': folio, 'fund_name': f"Fund {folio}",
+            'fund_type': 'Equity', 'investment_amount': invested, 'current_value': value}
+
+
+def _card(username, number, classification, active):
+    return {'username': username, 'card_number': number, 'card_name': f"Card {number[-4:]}",
+            'card_classification': classification, 'card_type': 'Visa', 'expiry_month': '12',
+            'expiry_year': '2030', 'cvv': '123', 'is_active': active}
+
+
+@check
+def connect(username, state):
+    with database.get_db_connection(username) as conn:
+        expect(conn is not None, "could not connect to the database")
+
+
+@check
+def schema(username, state):
+    expect(migrations.ensure_schema(), "ensure_schema() did not report a current schema")
+
+
+@check
+def register_and_login(username, state):
+    auth.register(username, 'correct horse')
+    expect(auth.check_credentials(username, 'correct horse') is False,
+           "new user should log in without a profile")
+    expect(auth.check_credentials(username, 'wrong') is None, "wrong password accepted")
+    try:
+        auth.register(username, 'again')
+    except IntegrityError:
+        pass
+    else:
+        raise AssertionError("registering a taken username did not raise IntegrityError")
+
+
+@check
+def insert_and_duplicate(username, state):
+    result = writes.insert_row('user_banks', _bank(username, '1001', Decimal('1500.50')))
+    expect(result.ok and result.row_id, f"bank insert failed: {result}")
+    state['bank_id'] = result.row_id
+    duplicate = writes.insert_row('user_banks', _bank(username, '1001', 1))
+    expect(duplicate.status == writes.DUPLICATE, f"duplicate account gave {duplicate.status}")
+    rows = database.get_bank_accounts.uncached(username)
+    expect(len(rows) == 1 and rows[0]['account_balance'] == Decimal('1500.50'),
+           f"bank read back as {rows}")
+    expect(rows[0]['row_version'] == 1, "new rows start at row_version 1")
+
+
+@check
+def idempotent_insert(username, state):
+    values = _fund(username, 'F-1', Decimal('1000'), Decimal('1250'))
+    key = f"{username}:conformance"
+    first = writes.insert_row('user_mutual_funds', values, key)
+    again = writes.insert_row('user_mutual_funds', values, key)
+    expect(first.ok and again.replayed and again.row_id == first.row_id,
+           f"idempotent insert ran twice: {first} {again}")
+    state['fund_id'] = first.row_id
+
+
+@check
+def versioned_update(username, state):
+    changed = writes.update_row('user_banks', state['bank_id'], username, 1,
+                                {'account_balance': Decimal('2000.00')})
+    expect(changed.ok and changed.row_version == 2, f"update failed: {changed}")
+    stale = writes.update_row('user_banks', state['bank_id'], username, 1,
+                              {'account_balance': Decimal('1.00')})
+    expect(stale.status == writes.CONFLICT and stale.row_version == 2,
+           f"stale update gave {stale}")
+    missing = writes.update_row('user_banks', -1, username, 1, {'account_balance': 0})
+    expect(missing.status == writes.NOT_FOUND, f"missing row gave {missing}")
+
+
+@check
+def rename_changes_etag(username, state):
+    token = api.open_session(username)
+    etag, _ = api._read_resource(api.list_banks, token, {}, None)
+    renamed = writes.update_row('user_banks', state['bank_id'], username, 2,
+                                {'bank_name': "Renamed Bank"})
+    expect(renamed.ok, f"rename failed: {renamed}")
+    after, body = api._read_resource(api.list_banks, token, {}, etag)
+    expect(after != etag and body is not None and b"Renamed Bank" in body[0],
+           f"rename kept ETag {etag} and served {body}")
+    api.close_session(token)
+
+
+@check
+def summary_triggers(username, state):
+    writes.insert_row('user_cards', _card(username, '4000000000000002', 'Credit', False))
+    writes.insert_row('user_cards', _card(username, '4000000000000001', 'Debit', True))
+    totals = _summary(username)
+    expect((totals.bank_count, totals.fund_count, totals.card_count, totals.active_cards)
+           == (1, 1, 2, 1), f"summary counts are {totals}")
+    expect(Decimal(str(totals.total_balance)) == Decimal('2000.00'), f"balance {totals}")
+    expect(Decimal(str(totals.fund_value)) == Decimal('1250.00'), f"fund value {totals}")
+
+
+@check
+def card_order(username, state):
+    cards = database.get_cards.uncached(username)
+    expect([card['is_active'] for card in cards] == [1, 0],
+           f"active cards should sort first: {cards}")
+
+
+@check
+def prepared_statement_reuse(username, state):
+    if not statements.ENABLED:
+        return
+
+    def hits():
+        return {row['statement']: row['hits'] for row in statements.get_statement_stats()}
+    before = hits().get('cards.list', 0)
+    for _ in range(3):
+        database.get_cards.uncached(username)
+    expect(hits()['cards.list'] - before >= 2, "cards.list was not reused on its connection")
+
+
+@check
+def snapshot_matches_prefetch(username, state):
+    get_cache().clear()
+    single = database.get_portfolio_snapshot.uncached(username, 0, 0, 1)
+    parallel = database.prefetch_portfolio_snapshot(username, 0, 0, 1).result()
+    expect(single is not None and single == parallel,
+           f"multi-statement snapshot {single} differs from prefetch {parallel}")
+    writes.insert_row('user_banks', _bank(username, '1002', 10))
+    page = database.get_portfolio_snapshot.uncached(username, 0, 0, 1)
+    expect(page.has_more_banks and len(page.banks) == 1, "keyset page missed has_more_banks")
+
+
+@check
+def profile_version(username, state):
+    before = api.resolve_session(state.setdefault('token', api.open_session(username)))
+    expect(before and before[0] == username, f"session lookup gave {before}")
+    with database.get_db_connection(username) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("INSERT INTO user_profiles (username, full_name) VALUES (%s, %s)",
+                           (username, "Conformance"))
+            conn.commit()
+    after = api.resolve_session(state['token'])
+    expect(after[1] > before[1], f"profile write did not bump data_version: {before} {after}")
+    profile = database.get_profile.uncached(username)
+    expect(profile['full_name'] == "Conformance", f"profile read back as {profile}")
+    api.close_session(state['token'])
+    expect(api.resolve_session(state['token']) is None, "closed session still resolves")
+
+
+@check
+def transactions_and_returns(username, state):
+    expect(returns.add_transaction(username, state['fund_id'], date(2023, 1, 1),
+                                   'purchase', Decimal('1000')), "transaction insert failed")
+    expect(not returns.add_transaction(f"{username}_other", state['fund_id'], date(2023, 1, 1),
+                                       'purchase', Decimal('1000')),
+           "transaction attached to another user's folio")
+    flows = returns.get_transactions(username, state['fund_id'])
+    expect(len(flows) == 1 and flows[0]['txn_date'] == date(2023, 1, 1),
+           f"transactions read back as {flows}")
+    result = returns.get_fund_returns.uncached(username, date(2024, 1, 1))
+    xirr = result[state['fund_id']].xirr
+    expect(xirr is not None and abs(xirr - 25.0) < 0.01, f"XIRR was {xirr}")
+
+
+@check
+def importer_upsert(username, state):
+    rows = pd.DataFrame([
+        {'bank_name': "Bank 1001", 'account_number': '1001', 'ifsc_code': 'TEST0000001',
+         'account_balance': 3000.0, 'nominee_name': "Nominee"},
+        {'bank_name': "Bank 1003", 'account_number': '1003', 'ifsc_code': 'TEST0000001',
+         'account_balance': 5.0, 'nominee_name': None},
+    ])
+    expect(importer.upsert_rows(username, 'banks', rows) == (1, 1), "import counts wrong")
+    banks = {row['account_number']: row for row in database.get_bank_accounts.uncached(username)}
+    expect(banks['1001']['account_balance'] == Decimal('3000.00')
+           and banks['1001']['nominee_name'] == "Nominee", f"upsert left {banks['1001']}")
+    expect(Decimal(str(_summary(username).total_balance)) == Decimal('3015.00'),
+           "summary missed the imported balances")
+    # A file without a balance column renames but keeps balances
+    valid, errors = importer.validate(pd.DataFrame([
+        {'bank_name': "Renamed 1001", 'account_number': '1001', 'ifsc_code': 'TEST0000001'},
+        {'bank_name': "Bank 1004", 'account_number': '1004', 'ifsc_code': 'TEST0000001'},
+    ]), 'banks')
+    expect(errors.empty and importer.upsert_rows(username, 'banks', valid) == (1, 1),
+           f"import without balances failed: {errors}")
+    banks = {row['account_number']: row for row in database.get_bank_accounts.uncached(username)}
+    expect(banks['1001']['bank_name'] == "Renamed 1001"
+           and banks['1001']['account_balance'] == Decimal('3000.00')
+           and banks['1004']['account_balance'] == Decimal('0.00'),
+           f"import without balances left {banks['1001']} and {banks['1004']}")
+
+
+@check
+def summary_rebuild(username, state):
+    expected = _summary(username)
+    token = api.open_session(username)
+    version = api.resolve_session(token)[1]
+    with database.get_db_connection(username) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("UPDATE user_portfolio_summary SET total_balance = 0, card_count = 0 "
+                           "WHERE username = %s", (username,))
+            conn.commit()
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        expect(summary.main(['check', '--user', username]) == 1, "check missed the drifted totals")
+        rebuilt = summary.main(['rebuild', '--user', username])
+    expect(rebuilt == 0, f"summary.py rebuild failed: {output.getvalue().strip()}")
+    expect(_summary(username) == expected, f"rebuild left {_summary(username)}, not {expected}")
+    expect(api.resolve_session(token)[1] > version, "rebuild kept the old data_version")
+    api.close_session(token)
+
+
+@check
+def move_between_shards(username, state):
+    router = sharding.get_router()
+    if router is None or len(router.map.shards) < 2:
+        return  # only meaningful with a shard map
+    source = router.shard_for(username)
+    target = next(shard for shard in router.map.shards if shard != source)
+    before = {'summary': _summary(username), 'banks': database.get_bank_accounts.uncached(username),
+              'funds': database.get_mutual_funds.uncached(username),
+              'flows': returns.get_transactions(username, state['fund_id'])}
+    token = api.open_session(username)
+    version = api.resolve_session(token)[1]
+
+    sharding.update_map(router.path, lambda m: m.frozen.add(username))
+    router.refresh(force=True)
+    frozen = writes.insert_row('user_banks', _bank(username, '1009', 1))
+    expect(frozen.status == writes.MOVING, f"write while frozen gave {frozen.status}")
+    sharding.update_map(router.path, lambda m: m.frozen.discard(username))
+
+    expect(sharding.move_user(router, username, target, log=lambda message: None),
+           "move_user did not move the user")
+    expect(router.shard_for(username) == target, "user is not routed to the target shard")
+    after = database.get_mutual_funds.uncached(username)
+    state['fund_id'] = after[0]['id']
+    expect(_summary(username) == before['summary'], "summary changed across the move")
+    expect([{k: v for k, v in row.items() if k != 'id'} for row in before['banks']]
+           == [{k: v for k, v in row.items() if k != 'id'}
+               for row in database.get_bank_accounts.uncached(username)], "banks changed")
+    expect(len(after) == len(before['funds']), "funds changed across the move")
+    flows = returns.get_transactions(username, state['fund_id'])
+    expect([f['amount'] for f in flows] == [f['amount'] for f in before['flows']],
+           "transactions did not follow their fund")
+    moved = api.resolve_session(token)
+    expect(moved and moved[1] > version, f"session or data_version lost in the move: {moved}")
+    with router.backend(source).connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM users WHERE username = %s", (username,))
+            expect(cursor.fetchone()[0] == 0, "rows were left on the source shard")
+
+
+@check
+def export_masks_cards(username, state):
+    chunk = next(export.iter_chunks(username, 'cards'))
+    expect(all(number.startswith('**** ') for number in chunk['card_number']),
+           f"card numbers not masked: {list(chunk['card_number'])}")
+
+
+@check
+def delete_cascades(username, state):
+    expect(database.delete_mutual_fund(state['fund_id'], username), "fund delete failed")
+    expect(returns.get_transactions(username, state['fund_id']) == [],
+           "transactions survived their fund")
+    expect(_summary(username).fund_count == 0, "summary kept the deleted fund")
+
+
+def cleanup(username):
+    with database.get_db_connection(username) as conn:
+        if conn is None:
+            return  # nothing was written; the connect check reports why
+        with conn.cursor() as cursor:
+            for table in ('fund_transactions', 'user_mutual_funds', 'user_banks', 'user_cards',
+                          'api_sessions', 'user_profiles', 'user_portfolio_summary', 'users'):
+                cursor.execute(f"DELETE FROM {table} WHERE username = %s", (username,))
+            conn.commit()
+    router = sharding.get_router()
+    if router is not None and username in router.map.users:
+        sharding.update_map(router.path, lambda m: m.users.pop(username))
+
+
+def run(verbose=True):
+    """Run every check in order; returns the names of those that failed"""
+    username = f"conformance_{secrets.token_hex(4)}"
+    state, failed = {}, []
+    try:
+        for func in CHECKS:
+            started = time.perf_counter()
+            try:
+                func(username, state)
+                outcome = "ok"
+            except Exception as e:  # report every failure, not just the first
+                failed.append(func.__name__)
+                outcome = f"FAIL  {type(e).__name__}: {e}"
+            if verbose:
+                print(f"{func.__name__:<28} {(time.perf_counter() - started) * 1000:7.1f} ms  {outcome}")
+            if failed and func is connect:
+                break  # every other check needs the database
+    finally:
+        cleanup(username)
+    return failed
+
+
+def test_sqlite_backend(tmp_path):
+    database.use_backend(database.create_backend('sqlite', path=str(tmp_path / 'check.db')))
+    assert run() == []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', choices=('mysql', 'sqlite'), default=database.DB_BACKEND)
+    parser.add_argument('--path', help="SQLite database file")
+    parser.add_argument('--shard-map', help="route through this shard map instead of one backend")
+    args = parser.parse_args(argv)
+
+    # Outside a Streamlit session the UI calls in the readers only log warnings
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    if args.shard_map:
+        router = sharding.ShardRouter.from_file(args.shard_map)
+        sharding.use_router(router)
+        print(f"Shards: {', '.join(router.map.shards)}")
+    else:
+        options = {'path': args.path} if args.backend == 'sqlite' and args.path else {}
+        database.use_backend(database.create_backend(args.backend, **options))
+        print(f"Storage backend: {args.backend}")
+    failed = run()
+    if 'connect' in failed:
+        print("Database unreachable; remaining checks skipped")
+    else:
+        print(f"{len(CHECKS) - len(failed)}/{len(CHECKS)} checks passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
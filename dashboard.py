@@ -1,7 +1,18 @@
 import streamlit as st
 import pandas as pd
+from datetime import date
 from io import BytesIO
-from database import get_db_connection
+from database import get_db_connection, get_portfolio_aggregates, get_portfolio_snapshot, get_read_connection
+from cache import cached, invalidate
+from aggregates import PortfolioSummary, aggregate_rows
+from auth import logout as logout_session
+from export import display_export_options
+from history import display_history
+from importer import display_bulk_import
+from returns import display_fund_transactions, get_fund_returns
+from profiler import stage
+import statements
+from writes import form_idempotency_key, insert_row, reset_form_key, show_write_result, update_row
 from mysql.connector import Error
 from database import delete_bank_account
 from database import delete_mutual_fund
@@ -36,6 +47,8 @@ CARD_STYLE = """
 </style>
 """
 
+PAGE_SIZES = [10, 25, 50, 100]
+
 def format_currency(value):
     """Format numeric values as currency with ₹ symbol"""
     return f"₹{value:,.2f}"
@@ -44,80 +57,66 @@ def format_percentage(value):
     """Format numeric values as percentage with 2 decimal places"""
     return f"{value:.2f}%"
 
+@cached('banks')
 def get_bank_data(username):
     """Fetch bank account data for the given username including ID and nominee"""
     try:
-        with get_db_connection() as conn:
+        with get_read_connection(username) as conn:
             if conn is None:
                 st.error("Failed to connect to database")
-                return []
+                return None
             
-            with conn.cursor(dictionary=True) as cursor:
-                cursor.execute("""
-                    SELECT id, bank_name, account_number, ifsc_code, 
-                           account_balance, nominee_name
-                    FROM user_banks 
-                    WHERE username = %s
-                """, (username,))
-                return cursor.fetchall()
+            return statements.fetchall(conn, 'banks.list', (username,), dictionary=True)
     except Error as e:
         st.error(f"Error fetching bank details: {e}")
-        return []
+        return None
 
+@cached('funds')
 def get_mf_data(username):
     """Fetch mutual fund data for the given username including ID and ROI"""
     try:
-        with get_db_connection() as conn:
+        with get_read_connection(username) as conn:
             if conn is None:
                 st.error("Failed to connect to database")
-                return []
+                return None
             
-            with conn.cursor(dictionary=True) as cursor:
-                cursor.execute("""
-                    SELECT id, folio_number, fund_name, fund_type,
-                           investment_amount, current_value, nominee_name
-                    FROM user_mutual_funds 
-                    WHERE username = %s
-                """, (username,))
-                funds = cursor.fetchall()
-                
-                # Calculate ROI for each fund
-                for fund in funds:
-                    fund['roi'] = ((fund['current_value'] - fund['investment_amount']) / 
-                                  fund['investment_amount']) * 100 if fund['investment_amount'] else 0
-                return funds
+            return statements.fetchall(conn, 'funds.list', (username,), dictionary=True)
     except Error as e:
         st.error(f"Error fetching mutual funds: {e}")
-        return []
+        return None
 
-def delete_bank_account(account_id):
+def delete_bank_account(account_id, username):
     """Delete a bank account from database"""
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(username) as conn:
             if conn is None:
                 st.error("Failed to connect to database")
                 return False
                 
             with conn.cursor() as cursor:
-                cursor.execute("DELETE FROM user_banks WHERE id = %s", (account_id,))
+                cursor.execute("DELETE FROM user_banks WHERE id = %s AND username = %s",
+                               (account_id, username))
                 conn.commit()
+                invalidate(username, 'banks')
                 st.success("Bank account deleted successfully!")
                 return True
     except Error as e:
         st.error(f"Error deleting bank account: {e}")
         return False
 
-def delete_mutual_fund(fund_id):
+def delete_mutual_fund(fund_id, username):
     """Delete a mutual fund from database"""
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(username) as conn:
             if conn is None:
                 st.error("Failed to connect to database")
                 return False
                 
             with conn.cursor() as cursor:
-                cursor.execute("DELETE FROM user_mutual_funds WHERE id = %s", (fund_id,))
+                cursor.execute("DELETE FROM user_mutual_funds WHERE id = %s AND username = %s",
+                               (fund_id, username))
                 conn.commit()
+                invalidate(username, 'funds')
                 st.success("Mutual fund deleted successfully!")
                 return True
     except Error as e:
@@ -143,6 +142,26 @@ def display_summary_metrics(total_balance, total_invested, current_value, net_wo
             </div>
             """, unsafe_allow_html=True)
 
+def display_fund_type_breakdown(username):
+    """Per-fund-type totals and weighted ROI across all of the user's funds"""
+    aggregates = get_portfolio_aggregates(username)
+    if not aggregates or not aggregates.by_fund_type:
+        return
+    with st.expander("📊 Funds by type"):
+        df = pd.DataFrame([{
+            'fund_type': breakdown.fund_type, 'holdings': breakdown.holdings,
+            'invested': float(breakdown.invested), 'current_value': float(breakdown.current_value),
+            'roi': breakdown.roi,
+        } for breakdown in aggregates.by_fund_type.values()])
+        st.dataframe(df, hide_index=True, use_container_width=True, column_config={
+            'fund_type': "Type",
+            'holdings': "Funds",
+            'invested': st.column_config.NumberColumn("Invested (₹)", format="%.2f"),
+            'current_value': st.column_config.NumberColumn("Current Value (₹)", format="%.2f"),
+            'roi': st.column_config.NumberColumn("Weighted ROI", format="%.2f%%"),
+        })
+        st.caption(f"Weighted ROI across all funds: {format_percentage(aggregates.roi)}")
+
 def add_bank_account_form(username, edit_data=None):
     """Form to add/edit bank account"""
     st.header("✏️ Edit Bank Account" if edit_data else "➕ Add New Bank Account")
@@ -165,47 +184,26 @@ def add_bank_account_form(username, edit_data=None):
             if not all([bank_name, account_number, ifsc_code]):
                 st.error("Please fill all required fields (*)")
             else:
-                try:
-                    with get_db_connection() as conn:
-                        if conn is None:
-                            st.error("Failed to connect to database")
-                            return False
-                            
-                        with conn.cursor() as cursor:
-                            if edit_data:
-                                cursor.execute("""
-                                    UPDATE user_banks SET
-                                        bank_name = %s,
-                                        account_number = %s,
-                                        ifsc_code = %s,
-                                        account_balance = %s,
-                                        nominee_name = %s
-                                    WHERE id = %s
-                                """, (
-                                    bank_name, account_number, ifsc_code,
-                                    account_balance, nominee_name,
-                                    edit_data['id']
-                                ))
-                            else:
-                                cursor.execute("""
-                                    INSERT INTO user_banks (
-                                        username, bank_name, account_number, 
-                                        ifsc_code, account_balance, nominee_name
-                                    ) VALUES (%s, %s, %s, %s, %s, %s)
-                                """, (
-                                    username, bank_name, account_number, 
-                                    ifsc_code, account_balance, nominee_name
-                                ))
-                            conn.commit()
-                            st.session_state.show_bank_form = False
-                            if edit_data:
-                                st.session_state.editing_bank = None
-                            st.success("Bank details saved successfully!")
-                            return True
-                except Error as e:
-                    st.error(f"Error saving bank details: {e}")
+                values = {
+                    'bank_name': bank_name, 'account_number': account_number, 'ifsc_code': ifsc_code,
+                    'account_balance': account_balance, 'nominee_name': nominee_name,
+                }
+                if edit_data:
+                    result = update_row('user_banks', edit_data['id'], username,
+                                        edit_data['row_version'], values)
+                else:
+                    values['username'] = username
+                    result = insert_row('user_banks', values,
+                                        form_idempotency_key('bank_form', username, values))
+                if show_write_result(result, "bank account", "Bank details saved successfully!"):
+                    reset_form_key('bank_form')
+                    st.session_state.show_bank_form = False
+                    if edit_data:
+                        st.session_state.editing_bank = None
+                    return True
         
         if cancel_clicked:
+            reset_form_key('bank_form')
             st.session_state.show_bank_form = False
             if edit_data:
                 st.session_state.editing_bank = None
@@ -225,6 +223,14 @@ def add_mutual_fund_form(username, edit_data=None):
                                           value=float(edit_data['investment_amount']) if edit_data else 0.0)
         current_value = st.number_input("Current Value (₹)", min_value=0.0, format="%.2f",
                                       value=float(edit_data['current_value']) if edit_data else 0.0)
+        col1, col2 = st.columns(2)
+        with col1:
+            scheme_code = st.text_input("AMFI Scheme Code",
+                                        value=str(edit_data.get('scheme_code') or '') if edit_data else "")
+        with col2:
+            units = st.number_input("Units Held", min_value=0.0, format="%.4f",
+                                    value=float(edit_data.get('units') or 0) if edit_data else 0.0)
+        st.caption("With a scheme code and units, the current value follows the daily NAV import.")
         nominee_name = st.text_input("Nominee Name", value=edit_data.get('nominee_name', '') if edit_data else "")
         
         col1, col2 = st.columns(2)
@@ -236,58 +242,39 @@ def add_mutual_fund_form(username, edit_data=None):
         if save_clicked:
             if not all([folio_number, fund_name]):
                 st.error("Please fill all required fields (*)")
+            elif scheme_code and not scheme_code.strip().isdigit():
+                st.error("Scheme code must be a number")
             else:
-                try:
-                    with get_db_connection() as conn:
-                        if conn is None:
-                            st.error("Failed to connect to database")
-                            return False
-                            
-                        with conn.cursor() as cursor:
-                            if edit_data:
-                                cursor.execute("""
-                                    UPDATE user_mutual_funds SET
-                                        folio_number = %s,
-                                        fund_name = %s,
-                                        fund_type = %s,
-                                        investment_amount = %s,
-                                        current_value = %s,
-                                        nominee_name = %s
-                                    WHERE id = %s
-                                """, (
-                                    folio_number, fund_name, fund_type,
-                                    investment_amount, current_value, nominee_name,
-                                    edit_data['id']
-                                ))
-                            else:
-                                cursor.execute("""
-                                    INSERT INTO user_mutual_funds (
-                                        username, folio_number, fund_name,
-                                        fund_type, investment_amount,
-                                        current_value, nominee_name
-                                    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                                """, (
-                                    username, folio_number, fund_name,
-                                    fund_type, investment_amount,
-                                    current_value, nominee_name
-                                ))
-                            conn.commit()
-                            st.session_state.show_mf_form = False
-                            if edit_data:
-                                st.session_state.editing_mf = None
-                            st.success("Mutual fund details saved successfully!")
-                            return True
-                except Error as e:
-                    st.error(f"Error saving mutual fund details: {e}")
+                scheme_code = int(scheme_code) if scheme_code.strip() else None
+                values = {
+                    'folio_number': folio_number, 'fund_name': fund_name, 'fund_type': fund_type,
+                    'investment_amount': investment_amount, 'current_value': current_value,
+                    'nominee_name': nominee_name, 'scheme_code': scheme_code,
+                    'units': units if scheme_code else None,
+                }
+                if edit_data:
+                    result = update_row('user_mutual_funds', edit_data['id'], username,
+                                        edit_data['row_version'], values)
+                else:
+                    values['username'] = username
+                    result = insert_row('user_mutual_funds', values,
+                                        form_idempotency_key('mf_form', username, values))
+                if show_write_result(result, "mutual fund", "Mutual fund details saved successfully!"):
+                    reset_form_key('mf_form')
+                    st.session_state.show_mf_form = False
+                    if edit_data:
+                        st.session_state.editing_mf = None
+                    return True
         
         if cancel_clicked:
+            reset_form_key('mf_form')
             st.session_state.show_mf_form = False
             if edit_data:
                 st.session_state.editing_mf = None
     return False
 
-def display_bank_accounts(bank_data, username):
-    """Display bank accounts section with Add/Edit/Delete functionality"""
+def display_bank_accounts(bank_data, username, has_more=False, total=None):
+    """Display one page of bank accounts with Add/Edit/Delete functionality"""
     col1, col2 = st.columns([3, 1])
     with col1:
         st.header("🏦 Bank Accounts")
@@ -306,10 +293,21 @@ def display_bank_accounts(bank_data, username):
         return
     
     if not bank_data:
+        if len(st.session_state.bank_cursors) > 1:
+            # The last row of a later page was deleted; step back a page
+            st.session_state.bank_cursors.pop()
+            st.experimental_rerun()
         st.info("No bank accounts added yet")
         return
     
-    # Display bank accounts with edit/delete options
+    if st.session_state.list_view == "Table":
+        display_bank_table(bank_data, username)
+    else:
+        display_bank_cards(bank_data, username)
+    display_pager("bank", bank_data, has_more, total)
+
+def display_bank_cards(bank_data, username):
+    """Render bank accounts as HTML cards with edit/delete buttons"""
     for account in bank_data:
         with st.container():
             st.markdown(f"""
@@ -335,14 +333,42 @@ def display_bank_accounts(bank_data, username):
                         confirm_col1, confirm_col2 = st.columns(2)
                         with confirm_col1:
                             if st.button("Yes, delete", key=f"confirm_delete_bank_{account['id']}"):
-                                if delete_bank_account(account['id']):
+                                if delete_bank_account(account['id'], username):
                                     st.experimental_rerun()
                         with confirm_col2:
                             if st.button("Cancel", key=f"cancel_delete_bank_{account['id']}"):
                                 pass
 
-def display_mutual_funds(mf_data, username):
-    """Display mutual funds section with Add/Edit/Delete functionality"""
+def display_bank_table(bank_data, username):
+    """Render bank accounts as a compact table with row selection"""
+    df = pd.DataFrame(bank_data, columns=['id', 'bank_name', 'account_number', 'ifsc_code',
+                                          'account_balance', 'nominee_name'])
+    df['account_number'] = '****' + df['account_number'].str[-4:]
+    df['account_balance'] = pd.to_numeric(df['account_balance'])
+    selected = select_rows(df, f"bank_table_{st.session_state.bank_cursors[-1]}", {
+        'bank_name': "Bank",
+        'account_number': "Account",
+        'ifsc_code': "IFSC",
+        'account_balance': st.column_config.NumberColumn("Balance (₹)", format="%.2f"),
+        'nominee_name': "Nominee",
+    })
+    rows_by_id = {row['id']: row for row in bank_data}
+    
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        if st.button("Edit", key="edit_bank_selected", disabled=len(selected) != 1):
+            st.session_state.editing_bank = rows_by_id[selected[0]]
+            st.experimental_rerun()
+    with col3:
+        confirmed = st.checkbox("Confirm delete", key="confirm_delete_bank_selected",
+                                disabled=not selected)
+    with col2:
+        if st.button("Delete", key="delete_bank_selected", disabled=not (selected and confirmed)):
+            if all([delete_bank_account(account_id, username) for account_id in selected]):
+                st.experimental_rerun()
+
+def display_mutual_funds(mf_data, username, has_more=False, total=None):
+    """Display one page of mutual funds with Add/Edit/Delete functionality"""
     col1, col2 = st.columns([3, 1])
     with col1:
         st.header("📈 Mutual Funds")
@@ -358,13 +384,33 @@ def display_mutual_funds(mf_data, username):
     if st.session_state.get('editing_mf', None):
         if add_mutual_fund_form(username, st.session_state.editing_mf):
             st.experimental_rerun()
+        display_fund_transactions(username, st.session_state.editing_mf)
         return
     
     if not mf_data:
+        if len(st.session_state.fund_cursors) > 1:
+            # The last row of a later page was deleted; step back a page
+            st.session_state.fund_cursors.pop()
+            st.experimental_rerun()
         st.info("No mutual funds added yet")
         return
     
-    # Display mutual funds with edit/delete options
+    # Memoized per folio, so only folios with new transactions or values are re-solved
+    returns = get_fund_returns(username, date.today()) or {}
+    if st.session_state.list_view == "Table":
+        display_fund_table(mf_data, username, returns)
+    else:
+        display_fund_cards(mf_data, username, returns)
+    display_pager("fund", mf_data, has_more, total)
+
+def format_xirr(fund_return):
+    """XIRR as a percentage, or N/A until the folio has transactions"""
+    if fund_return is None or fund_return.xirr is None:
+        return "N/A"
+    return format_percentage(fund_return.xirr)
+
+def display_fund_cards(mf_data, username, returns):
+    """Render mutual funds as HTML cards with edit/delete buttons"""
     cols = st.columns(1 if len(mf_data) == 1 else min(2, len(mf_data)))
     
     for idx, fund in enumerate(mf_data):
@@ -377,6 +423,7 @@ def display_mutual_funds(mf_data, username):
                 <p><b>Invested:</b> {format_currency(fund['investment_amount'])}</p>
                 <p><b>Current Value:</b> {format_currency(fund['current_value'])}</p>
                 <p><b>ROI:</b> {format_percentage(fund['roi'])}</p>
+                <p><b>XIRR:</b> {format_xirr(returns.get(fund['id']))}</p>
                 {f"<p><b>Nominee:</b> {fund['nominee_name']}</p>" if fund['nominee_name'] else ""}
             </div>
             """, unsafe_allow_html=True)
@@ -393,53 +440,123 @@ def display_mutual_funds(mf_data, username):
                         col1, col2 = st.columns(2)
                         with col1:
                             if st.button("Yes, delete", key=f"confirm_delete_mf_{fund['id']}"):
-                                if delete_mutual_fund(fund['id']):
+                                if delete_mutual_fund(fund['id'], username):
                                     st.experimental_rerun()
                         with col2:
                             if st.button("Cancel", key=f"cancel_delete_mf_{fund['id']}"):
                                 pass
 
-def display_export_options(bank_data, mf_data):
-    """Display data export options"""
-    st.header("📤 Export Data")
-    export_col1, export_col2 = st.columns(2)
-    
-    with export_col1:
-        if bank_data:
-            bank_df = pd.DataFrame(bank_data)
-            bank_df['account_balance'] = bank_df['account_balance'].apply(format_currency)
-            csv = bank_df.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                "Export Bank Data (CSV)",
-                data=csv,
-                file_name="bank_accounts.csv",
-                mime="text/csv"
-            )
+def display_fund_table(mf_data, username, returns):
+    """Render mutual funds as a compact table with row selection"""
+    df = pd.DataFrame(mf_data, columns=['id', 'fund_name', 'fund_type', 'folio_number',
+                                        'investment_amount', 'current_value', 'roi', 'nominee_name'])
+    df.insert(7, 'xirr', [getattr(returns.get(fund_id), 'xirr', None) for fund_id in df['id']])
+    for column in ('investment_amount', 'current_value', 'roi', 'xirr'):
+        df[column] = pd.to_numeric(df[column])
+    selected = select_rows(df, f"fund_table_{st.session_state.fund_cursors[-1]}", {
+        'fund_name': "Fund",
+        'fund_type': "Type",
+        'folio_number': "Folio",
+        'investment_amount': st.column_config.NumberColumn("Invested (₹)", format="%.2f"),
+        'current_value': st.column_config.NumberColumn("Current Value (₹)", format="%.2f"),
+        'roi': st.column_config.NumberColumn("ROI", format="%.2f%%"),
+        'xirr': st.column_config.NumberColumn("XIRR", format="%.2f%%"),
+        'nominee_name': "Nominee",
+    })
+    # Subtotal of the rows already on this page; no extra query
+    page = aggregate_rows([], mf_data)
+    st.caption(f"This page: {page.fund_count} funds · invested {format_currency(page.total_invested)}"
+               f" · value {format_currency(page.current_value)}"
+               f" · weighted ROI {format_percentage(page.roi)}")
+    rows_by_id = {row['id']: row for row in mf_data}
     
-    with export_col2:
-        if mf_data:
-            mf_df = pd.DataFrame(mf_data)
-            mf_df['investment_amount'] = mf_df['investment_amount'].apply(format_currency)
-            mf_df['current_value'] = mf_df['current_value'].apply(format_currency)
-            mf_df['roi'] = mf_df['roi'].apply(format_percentage)
-            csv = mf_df.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                "Export MF Data (CSV)",
-                data=csv,
-                file_name="mutual_funds.csv",
-                mime="text/csv"
-            )
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        if st.button("Edit", key="edit_mf_selected", disabled=len(selected) != 1):
+            st.session_state.editing_mf = rows_by_id[selected[0]]
+            st.experimental_rerun()
+    with col3:
+        confirmed = st.checkbox("Confirm delete", key="confirm_delete_mf_selected",
+                                disabled=not selected)
+    with col2:
+        if st.button("Delete", key="delete_mf_selected", disabled=not (selected and confirmed)):
+            if all([delete_mutual_fund(fund_id, username) for fund_id in selected]):
+                st.experimental_rerun()
+
+def select_rows(df, key, column_config):
+    """Show a read-only table with a checkbox column and return the selected ids"""
+    df.insert(0, 'selected', False)
+    edited = st.data_editor(
+        df,
+        key=key,
+        hide_index=True,
+        use_container_width=True,
+        disabled=[column for column in df.columns if column != 'selected'],
+        column_config={'selected': st.column_config.CheckboxColumn(""), 'id': None, **column_config},
+    )
+    return [int(row_id) for row_id in edited.loc[edited['selected'], 'id']]
+
+def init_pagination_state():
+    """Keyset cursor stacks for the bank and fund lists plus view settings"""
+    if 'page_size' not in st.session_state:
+        st.session_state.page_size = PAGE_SIZES[1]
+    if 'list_view' not in st.session_state:
+        st.session_state.list_view = "Table"
+    for kind in ("bank", "fund"):
+        # Each entry is the id the page starts after; the last one is the current page
+        if f'{kind}_cursors' not in st.session_state:
+            st.session_state[f'{kind}_cursors'] = [0]
+
+def reset_pagination():
+    st.session_state.bank_cursors = [0]
+    st.session_state.fund_cursors = [0]
+
+def get_page_params():
+    """(bank_after, fund_after, page_size) for the pages this rerun displays"""
+    init_pagination_state()
+    return (st.session_state.bank_cursors[-1], st.session_state.fund_cursors[-1],
+            st.session_state.page_size)
+
+def display_list_controls():
+    """Page size and table/card view controls shared by both lists"""
+    col1, col2, _ = st.columns([1, 1, 2])
+    with col1:
+        st.selectbox("Rows per page", PAGE_SIZES, key="page_size", on_change=reset_pagination)
+    with col2:
+        st.radio("View", ["Table", "Cards"], key="list_view", horizontal=True)
+
+def display_pager(kind, page_rows, has_more, total=None):
+    """Previous/next buttons walking the keyset cursor stack"""
+    cursors = st.session_state[f'{kind}_cursors']
+    page = len(cursors)
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("◀ Previous", key=f"{kind}_prev_page", disabled=page == 1):
+            cursors.pop()
+            st.experimental_rerun()
+    with col2:
+        if total is not None:
+            pages = max(1, -(-total // st.session_state.page_size))
+            st.caption(f"Page {page} of {pages} · {total} total")
+        else:
+            st.caption(f"Page {page}")
+    with col3:
+        if st.button("Next ▶", key=f"{kind}_next_page", disabled=not has_more):
+            cursors.append(page_rows[-1]['id'])
+            st.experimental_rerun()
 
 def logout():
     """Handle user logout process"""
+    logout_session(st.session_state.get('auth_token'))
     st.session_state.logged_in = False
     st.session_state.username = None
+    st.session_state.auth_token = None
     st.session_state.profile_completed = False
     st.session_state.just_signed_up = False
     st.experimental_rerun()
 
-def financial_dashboard(username):
-    """Main dashboard function"""
+def financial_dashboard(username, snapshot=None):
+    """Main dashboard function; pass the rerun's PortfolioSnapshot to avoid refetching"""
     st.markdown(CARD_STYLE, unsafe_allow_html=True)
     
     # Initialize session state variables if they don't exist
@@ -461,27 +578,41 @@ def financial_dashboard(username):
         if st.button("🚪 Logout"):
             logout()
     
-    # Fetch data
-    bank_data = get_bank_data(username)
-    mf_data = get_mf_data(username)
+    # Fetch data; only the visible page of each list is loaded
+    if snapshot is None:
+        with stage("dashboard.fetch"):
+            snapshot = get_portfolio_snapshot(username, *get_page_params())
+    bank_data = snapshot.banks if snapshot else []
+    mf_data = snapshot.funds if snapshot else []
     
-    # Calculate summary metrics
-    total_balance = sum(acc['account_balance'] for acc in bank_data) if bank_data else 0
-    total_invested = sum(mf['investment_amount'] for mf in mf_data) if mf_data else 0
-    current_value = sum(mf['current_value'] for mf in mf_data) if mf_data else 0
-    net_worth = total_balance + current_value
+    # Summary metrics are the user's user_portfolio_summary row, read in the same round trip
+    totals = snapshot.summary if snapshot else PortfolioSummary()
+    with stage("dashboard.summary"):
+        display_summary_metrics(totals.total_balance, totals.total_invested,
+                                totals.current_value, totals.net_worth)
+        display_fund_type_breakdown(username)
+    display_list_controls()
     
-    if st.session_state.show_bank_form:
-        add_bank_account_form(username)
-    else:
-        display_bank_accounts(bank_data, username)
+    with stage("dashboard.banks"):
+        if st.session_state.show_bank_form:
+            add_bank_account_form(username)
+        else:
+            display_bank_accounts(bank_data, username, snapshot.has_more_banks if snapshot else False,
+                                  totals.bank_count)
     
     # Display mutual funds or form
-    if st.session_state.show_mf_form:
-        add_mutual_fund_form(username)
-    else:
-        display_mutual_funds(mf_data, username)
+    with stage("dashboard.funds"):
+        if st.session_state.show_mf_form:
+            add_mutual_fund_form(username)
+        else:
+            display_mutual_funds(mf_data, username, snapshot.has_more_funds if snapshot else False,
+                                 totals.fund_count)
     
-    # Display export options if not showing forms
+    # Display import and export options if not showing forms
     if not st.session_state.show_bank_form and not st.session_state.show_mf_form:
-        display_export_options(bank_data, mf_data)
\ No newline at end of file
+        with stage("dashboard.history"):
+            display_history(username, mf_data)
+        with stage("dashboard.import"):
+            display_bulk_import(username)
+        with stage("dashboard.export"):
+            display_export_options(username)
\ No newline at end of file
@@ -1,211 +1,905 @@
 # database.py
+import contextvars
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+
 import mysql.connector
 from mysql.connector import Error
 import streamlit as st
 
-def get_db_connection():
-    try:
-        conn = mysql.connector.connect(
-            host='localhost',
-            user='root',
-            password='Maniyar@18',
-            database='folio_fetch'
-        )
-        if conn.is_connected():
-            return conn
-    except Error as e:
-        print(f"Error connecting to MySQL: {e}")
-        return None
+from aggregates import AGGREGATE_QUERY, SUMMARY_QUERY, PortfolioSummary, build_aggregates, build_summary
+from cache import cached, get_cache, invalidate, on_invalidate
+from profiler import current_trace, stage
+from querylog import instrument
+import sharding
+import statements
+
+# Connection settings, overridable from the environment for other deployments
+DB_CONFIG = {
+    'host': os.environ.get('FOLIO_DB_HOST', 'localhost'),
+    'port': int(os.environ.get('FOLIO_DB_PORT', 3306)),
+    'user': os.environ.get('FOLIO_DB_USER', 'root'),
+    'password': os.environ.get('FOLIO_DB_PASSWORD', 'Maniyar@18'),
+    'database': os.environ.get('FOLIO_DB_NAME', 'folio_fetch'),
+}
+
+# Pool tuning
+POOL_SIZE = int(os.environ.get('FOLIO_POOL_SIZE', 5))
+POOL_MAX_OVERFLOW = int(os.environ.get('FOLIO_POOL_MAX_OVERFLOW', 10))
+POOL_TIMEOUT = float(os.environ.get('FOLIO_POOL_TIMEOUT', 10))
+POOL_RECYCLE = float(os.environ.get('FOLIO_POOL_RECYCLE', 1800))
+POOL_PING_AFTER = float(os.environ.get('FOLIO_POOL_PING_AFTER', 5))
+
+# Concurrent snapshot fetches; kept within the pool so overflow stays free for script threads
+FETCH_WORKERS = int(os.environ.get('FOLIO_FETCH_WORKERS', POOL_SIZE))
+
+# Read replicas (``host[:port],...``, same credentials and database as the primary)
+DB_REPLICAS = os.environ.get('FOLIO_DB_REPLICAS', '')
+REPLICA_MAX_LAG = float(os.environ.get('FOLIO_REPLICA_MAX_LAG', 2))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('FOLIO_REPLICA_CHECK_INTERVAL', 1))
+# After a write the user reads from the primary for this long; keep it above the lag limit
+READ_YOUR_WRITES_SECONDS = float(os.environ.get('FOLIO_READ_YOUR_WRITES', 10))
+
+
+class PoolTimeoutError(Error):
+    """Raised when no pooled connection becomes free within the wait timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of MySQL connections shared by the whole process.
+
+    Up to ``size`` connections are kept open between checkouts; a further
+    ``max_overflow`` may be opened under load and are closed again when they
+    are returned. When every slot is busy, ``acquire`` waits up to ``timeout``
+    seconds for a connection to come back. Connections older than ``recycle``
+    seconds are replaced, and connections that sat idle for longer than
+    ``ping_after`` seconds are pinged before being handed out.
+    """
+
+    def __init__(self, size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW, timeout=POOL_TIMEOUT,
+                 recycle=POOL_RECYCLE, ping_after=POOL_PING_AFTER, **connect_args):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self._connect_args = connect_args or dict(DB_CONFIG)
+        self._cond = threading.Condition()
+        self._idle = []  # LIFO stack of (conn, created_at, idle_since)
+        self._created = {}  # id(conn) -> created_at for checked-out connections
+        self._open = 0  # idle + checked-out connections (and slots being connected)
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'handshakes': 0,
+            'handshakes_avoided': 0,
+            'recycled': 0,
+            'invalidated': 0,
+        }
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self._connect_args)
+        with self._cond:
+            self._stats['handshakes'] += 1
+        return conn
+
+    def _is_healthy(self, conn, idle_since):
+        if time.monotonic() - idle_since < self.ping_after:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Error:
+            pass
+
+    def acquire(self):
+        """Check a connection out, reusing an idle one whenever possible"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        entry = None
+        with self._cond:
+            self._stats['checkouts'] += 1
+            waited = False
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available after {self.timeout:.1f}s")
+                if not waited:
+                    self._stats['waits'] += 1
+                    waited = True
+                self._cond.wait(remaining)
+            if waited:
+                self._stats['wait_time'] += time.monotonic() - started
+
+        if entry is not None:
+            conn, created_at, idle_since = entry
+            if self.recycle and time.monotonic() - created_at > self.recycle:
+                self._close_quietly(conn)
+                with self._cond:
+                    self._stats['recycled'] += 1
+            elif not self._is_healthy(conn, idle_since):
+                self._close_quietly(conn)
+                with self._cond:
+                    self._stats['invalidated'] += 1
+            else:
+                with self._cond:
+                    self._stats['handshakes_avoided'] += 1
+                    self._created[id(conn)] = created_at
+                return conn
+
+        # The slot is ours; open a fresh connection for it
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created[id(conn)] = time.monotonic()
+        return conn
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, closing it if broken or surplus"""
+        if not discard:
+            try:
+                # Never hand an open transaction to the next borrower
+                if conn.in_transaction:
+                    conn.rollback()
+            except Error:
+                discard = True
+        with self._cond:
+            created_at = self._created.pop(id(conn), time.monotonic())
+            keep = not discard and len(self._idle) < self.size
+            if keep:
+                self._idle.append((conn, created_at, time.monotonic()))
+            else:
+                self._open -= 1
+            self._cond.notify()
+        if not keep:
+            self._close_quietly(conn)
+
+    def dispose(self):
+        """Close every idle connection (checked-out ones close on release)"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        """Snapshot of the pool counters and current occupancy"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._open - len(self._idle)
+            stats['size'] = self.size
+            stats['max_overflow'] = self.max_overflow
+        return stats
 
-def create_database_and_tables():
+
+_pool = None
+_pool_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def get_pool_stats():
+    """Checkout, wait and handshake counters for the process-wide pool"""
+    return get_pool().stats()
+
+
+def parse_replicas(text):
+    """``host[:port],...`` (``FOLIO_DB_REPLICAS``) as a list of replica options"""
+    replicas = []
+    for entry in filter(None, (part.strip() for part in text.split(','))):
+        host, _, port = entry.partition(':')
+        replicas.append({'host': host, 'port': int(port)} if port else {'host': host})
+    return replicas
+
+
+class Replica:
+    """One read replica, its pool and the replication lag last measured on it"""
+
+    def __init__(self, config):
+        self.config = config
+        self.pool = ConnectionPool(**config)
+        self.lag = None  # seconds behind the primary; None until checked or when stopped
+        self.error = None
+        self.checked_at = None
+
+    def check(self):
+        """Measure replication lag; a stopped or unreachable replica has no lag value"""
+        try:
+            conn = self.pool.acquire()
+        except Error as e:
+            self.lag, self.error = None, str(e)
+            self.checked_at = time.time()
+            return
+        broken = False
+        try:
+            with conn.cursor(dictionary=True) as cursor:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                    row = cursor.fetchone()
+                    lag = row['Seconds_Behind_Source'] if row else None
+                except mysql.connector.errors.ProgrammingError:
+                    # Before MySQL 8.0.22
+                    cursor.execute("SHOW SLAVE STATUS")
+                    row = cursor.fetchone()
+                    lag = row['Seconds_Behind_Master'] if row else None
+            if row is None:
+                self.lag, self.error = None, "not configured as a replica"
+            elif lag is None:
+                self.lag, self.error = None, "replication is stopped"
+            else:
+                self.lag, self.error = float(lag), None
+        except Error as e:
+            broken = True
+            self.lag, self.error = None, str(e)
+        finally:
+            self.checked_at = time.time()
+            self.pool.release(conn, discard=broken)
+
+    def mark_down(self, error):
+        """Stop reading here until the next check finds it healthy again"""
+        self.lag, self.error = None, str(error)
+
+
+class ReplicaSet:
+    """Read replicas of one primary, health-checked by a background thread.
+
+    A replica takes reads while its measured lag is at most ``max_lag``
+    seconds. Healthy replicas are used in turn. Before the first check, and
+    whenever none is healthy, reads go to the primary.
+    """
+
+    def __init__(self, configs, max_lag=REPLICA_MAX_LAG, interval=REPLICA_CHECK_INTERVAL):
+        self.replicas = [Replica(config) for config in configs]
+        self.max_lag = max_lag
+        self.interval = interval
+        self._turn = itertools.count()
+        self._monitor = None
+        self._lock = threading.Lock()
+
+    def _watch(self):
+        while True:
+            for replica in self.replicas:
+                replica.check()
+            time.sleep(self.interval)
+
+    def choose(self):
+        """A replica within the lag limit, or None to read from the primary"""
+        if self._monitor is None:
+            with self._lock:
+                if self._monitor is None:
+                    self._monitor = threading.Thread(target=self._watch, daemon=True,
+                                                     name='folio-replica-monitor')
+                    self._monitor.start()
+        healthy = [r for r in self.replicas if r.lag is not None and r.lag <= self.max_lag]
+        if not healthy:
+            return None
+        return healthy[next(self._turn) % len(healthy)]
+
+    def stats(self):
+        return [{'host': r.config['host'], 'port': r.config.get('port'), 'lag': r.lag,
+                 'healthy': r.lag is not None and r.lag <= self.max_lag, 'error': r.error,
+                 'pool': r.pool.stats()} for r in self.replicas]
+
+    def dispose(self):
+        for replica in self.replicas:
+            replica.pool.dispose()
+
+
+@contextmanager
+def _lease(pool, conn, wait, read_only=False, on_broken=None):
+    """Yield a checked-out connection, returning it to ``pool`` afterwards"""
+    broken = False
     try:
-        # Connect to MySQL server without specifying database
-        connection = mysql.connector.connect(
-            host='localhost',
-            user='root',
-            password='Maniyar@18'
-        )
-
-        if connection.is_connected():
-            cursor = connection.cursor()
-            # Create database if not exists
-            cursor.execute("CREATE DATABASE IF NOT EXISTS folio_fetch")
-            cursor.execute("USE folio_fetch")
-
-            # Create users table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    username VARCHAR(255) PRIMARY KEY,
-                    password VARCHAR(255) NOT NULL,
-                    registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-
-            # Create user_profiles table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS user_profiles (
-                    username VARCHAR(255) PRIMARY KEY,
-                    full_name VARCHAR(255),
-                    email VARCHAR(255) UNIQUE,
-                    gender ENUM('Male', 'Female', 'Other'),
-                    date_of_birth DATE,
-                    pan_card VARCHAR(10) UNIQUE,
-                    aadhar_card VARCHAR(12) UNIQUE,
-                    mobile_number VARCHAR(10) UNIQUE,
-                    profile_photo_path VARCHAR(255),
-                    address TEXT,
-                    city VARCHAR(100),
-                    state VARCHAR(100),
-                    pincode VARCHAR(10),
-                    country VARCHAR(100),
-                    FOREIGN KEY (username) REFERENCES users(username)
-                )
-            """)
-
-            # Create bank accounts table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS user_banks (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    username VARCHAR(255),
-                    bank_name VARCHAR(255) NOT NULL,
-                    account_number VARCHAR(20) NOT NULL,
-                    ifsc_code VARCHAR(11) NOT NULL,
-                    account_balance DECIMAL(15, 2) DEFAULT 0.00,
-                    FOREIGN KEY (username) REFERENCES users(username),
-                    UNIQUE(username, account_number)
-                )
-            """)
-
-            # Add nominee_name column to user_banks table (with error handling)
+        if read_only:
+            with conn.cursor() as cursor:
+                cursor.execute("SET SESSION TRANSACTION READ ONLY")
+        yield instrument(conn, wait)
+    except (mysql.connector.errors.InterfaceError, mysql.connector.errors.OperationalError) as e:
+        broken = True
+        if on_broken is not None:
+            on_broken(e)
+        raise
+    finally:
+        if read_only and not broken:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+                with conn.cursor() as cursor:
+                    cursor.execute("SET SESSION TRANSACTION READ WRITE")
+            except Error:
+                broken = True
+        pool.release(conn, discard=broken)
+
+
+class MySQLBackend:
+    """A MySQL database behind a ``ConnectionPool``.
+
+    A storage backend has a ``name``, a set of ``features`` the app may
+    check before using engine-specific jobs, ``connection()`` (a context
+    manager yielding a connection or None), ``read_connection()`` for reads
+    that may lag behind writes, ``ensure_schema()``, ``stats()`` and
+    ``dispose()``. See ``sqlite_backend.SQLiteBackend`` for the embedded
+    one. Without ``config`` this is ``DB_CONFIG`` on the process-wide pool;
+    shards pass their own settings and get a pool each. ``replicas`` are
+    option dicts merged over the config, one per read replica.
+    """
+
+    name = 'mysql'
+    features = frozenset({'history', 'nav_revaluation'})
+
+    def __init__(self, config=None, replicas=()):
+        self.config = config or DB_CONFIG
+        self.schema_ready = False
+        self._pool = ConnectionPool(**config) if config else None
+        self.replicas = ReplicaSet([{**self.config, **replica} for replica in replicas]) \
+            if replicas else None
+
+    @property
+    def pool(self):
+        return self._pool or get_pool()
+
+    @contextmanager
+    def connection(self, read_only=False):
+        """A pooled primary connection; ``read_only`` refuses writes (a user being moved)"""
+        pool = self.pool
+        started = time.perf_counter()
+        try:
+            conn = pool.acquire()
+        except Error as e:
+            print(f"Error connecting to MySQL: {e}")
+            yield None
+            return
+        with _lease(pool, conn, time.perf_counter() - started, read_only) as leased:
+            yield leased
+
+    @contextmanager
+    def read_connection(self):
+        """A replica connection when one is within the lag limit, else the primary"""
+        replica = self.replicas.choose() if self.replicas else None
+        if replica is not None:
+            started = time.perf_counter()
             try:
-                cursor.execute("""
-                    ALTER TABLE user_banks 
-                    ADD COLUMN nominee_name VARCHAR(255)
-                """)
+                conn = replica.pool.acquire()
             except Error as e:
-                if "Duplicate column name" in str(e):
-                    print("Column nominee_name already exists in user_banks table")
-                else:
-                    raise
-
-            # Create mutual funds table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS user_mutual_funds (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    username VARCHAR(255),
-                    folio_number VARCHAR(50) NOT NULL,
-                    fund_name VARCHAR(255) NOT NULL,
-                    fund_type ENUM('Equity', 'Debt', 'Hybrid', 'ELSS', 'Other') NOT NULL,
-                    investment_amount DECIMAL(15, 2),
-                    current_value DECIMAL(15, 2),
-                    nominee_name VARCHAR(255),
-                    FOREIGN KEY (username) REFERENCES users(username),
-                    UNIQUE(username, folio_number)
-                )
-            """)
-
-            # Add to create_database_and_tables() function
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS user_cards (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    username VARCHAR(255),
-                    card_number VARCHAR(16) NOT NULL,
-                    card_name VARCHAR(255),
-                    card_classification ENUM('Debit', 'Credit') NOT NULL,
-                    card_type ENUM('Visa', 'Mastercard', 'RuPay', 'Amex', 'Other') NOT NULL,
-                    expiry_month VARCHAR(2) NOT NULL,
-                    expiry_year VARCHAR(4) NOT NULL,
-                    cvv VARCHAR(3) NOT NULL,
-                    is_active BOOLEAN DEFAULT TRUE,
-                    FOREIGN KEY (username) REFERENCES users(username),
-                    UNIQUE(username, card_number)
-    )
-""")         
+                replica.mark_down(e)
+            else:
+                with _lease(replica.pool, conn, time.perf_counter() - started,
+                            on_broken=replica.mark_down) as leased:
+                    yield leased
+                return
+        with self.connection() as conn:
+            yield conn
 
-            connection.commit()
-            print("Database setup completed successfully")
-            
-    except Error as e:
-        print(f"Error creating database/tables: {e}")
+    def ensure_schema(self):
+        import migrations  # migrations imports this module
+        return migrations.ensure_mysql_schema(self)
+
+    def stats(self):
+        stats = self.pool.stats()
+        if self.replicas:
+            stats['replicas'] = self.replicas.stats()
+        return stats
+
+    def dispose(self):
+        self.pool.dispose()
+        if self.replicas:
+            self.replicas.dispose()
+
+
+# Storage engine: 'mysql' (default) or 'sqlite' for single-node and test installs
+DB_BACKEND = os.environ.get('FOLIO_DB_BACKEND', 'mysql')
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(name, replicas=(), **options):
+    """A backend by name; MySQL ``options`` are merged over ``DB_CONFIG``"""
+    if name == 'mysql':
+        return MySQLBackend({**DB_CONFIG, **options} if options else None, replicas)
+    if name == 'sqlite':
+        from sqlite_backend import SQLiteBackend
+        return SQLiteBackend(**options)
+    raise ValueError(f"Unknown storage backend {name!r} (expected 'mysql' or 'sqlite')")
+
+
+def get_backend():
+    """Return the process-wide storage backend chosen by ``FOLIO_DB_BACKEND``"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(DB_BACKEND, replicas=parse_replicas(DB_REPLICAS))
+    return _backend
+
+
+def use_backend(backend):
+    """Swap the process-wide backend (conformance runs, tests); returns the old one"""
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+    return previous
+
+
+def get_features():
+    """Features every shard supports (the single backend's when unsharded)"""
+    return frozenset.intersection(*(frozenset(b.features) for b in sharding.backends().values()))
+
+
+def get_db_connection(username=None):
+    """Borrow a connection from the storage backend for a ``with`` block.
+
+    With a shard map (``FOLIO_SHARD_MAP``) the connection is to the shard
+    holding ``username``, which is then required. Yields ``None`` when no
+    connection could be obtained so callers can keep their ``if conn is None``
+    guard.
+    """
+    router = sharding.get_router()
+    if router is not None:
+        return router.connection(username)
+    return get_backend().connection()
+
+
+_last_writes = {}  # username -> when this process last saw them write
+_last_writes_lock = threading.Lock()
+_primary_reads = contextvars.ContextVar('folio_primary_reads', default=False)
+
+
+def note_write(username):
+    """Send ``username``'s reads to the primary for the next READ_YOUR_WRITES_SECONDS"""
+    if username is None:
+        return
+    now = time.monotonic()
+    with _last_writes_lock:
+        _last_writes[username] = now
+        if len(_last_writes) > 10000:
+            for name, at in list(_last_writes.items()):
+                if now - at > READ_YOUR_WRITES_SECONDS:
+                    del _last_writes[name]
+
+
+# Every write path invalidates the user's cached rows once it has committed
+on_invalidate(note_write)
+
+
+def _wrote_recently(username):
+    at = _last_writes.get(username)
+    return at is not None and time.monotonic() - at < READ_YOUR_WRITES_SECONDS
+
+
+@contextmanager
+def primary_reads():
+    """Serve every ``get_read_connection`` in this block from the primary"""
+    token = _primary_reads.set(True)
+    try:
+        yield
     finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
+        _primary_reads.reset(token)
+
+
+def get_read_connection(username=None):
+    """``get_db_connection`` for reads that a read replica may answer.
+
+    A replica can be up to ``REPLICA_MAX_LAG`` seconds behind, so users who
+    wrote in the last ``READ_YOUR_WRITES_SECONDS`` read from the primary and
+    see their own changes at once, as does code inside ``primary_reads()``.
+    Without replicas this is the primary connection.
+    """
+    if _primary_reads.get() or _wrote_recently(username):
+        return get_db_connection(username)
+    router = sharding.get_router()
+    if router is not None:
+        return router.read_connection(username)
+    return get_backend().read_connection()
 
-def delete_bank_account(account_id):
+def delete_bank_account(account_id, username):
     """Delete a bank account from database"""
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(username) as conn:
             if conn is None:
                 st.error("Failed to connect to database")
                 return False
                 
             with conn.cursor() as cursor:
-                cursor.execute("DELETE FROM user_banks WHERE id = %s", (account_id,))
+                cursor.execute("DELETE FROM user_banks WHERE id = %s AND username = %s",
+                               (account_id, username))
                 conn.commit()
+                invalidate(username, 'banks')
                 st.success("Bank account deleted successfully!")
                 return True
     except Error as e:
         st.error(f"Error deleting bank account: {e}")
         return False  
 
-def delete_mutual_fund(fund_id):
+def delete_mutual_fund(fund_id, username):
     """Delete a mutual fund from database"""
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(username) as conn:
             if conn is None:
                 st.error("Failed to connect to database")
                 return False
                 
             with conn.cursor() as cursor:
-                cursor.execute("DELETE FROM user_mutual_funds WHERE id = %s", (fund_id,))
+                cursor.execute("DELETE FROM user_mutual_funds WHERE id = %s AND username = %s",
+                               (fund_id, username))
                 conn.commit()
+                invalidate(username, 'funds')
                 st.success("Mutual fund deleted successfully!")
                 return True
     except Error as e:
         st.error(f"Error deleting mutual fund: {e}")
         return False
 
+@cached('banks')
 def get_bank_accounts(username):
-    """Get all bank accounts for a user"""
+    """Get all bank accounts for a user (None if the fetch failed)"""
     try:
-        with get_db_connection() as conn:
+        with get_read_connection(username) as conn:
             if conn is None:
                 st.error("Failed to connect to database")
-                return []
-                
-            with conn.cursor(dictionary=True) as cursor:
-                cursor.execute("""
-                    SELECT id, bank_name, account_number, ifsc_code, 
-                           account_balance, nominee_name
-                    FROM user_banks 
-                    WHERE username = %s
-                """, (username,))
-                return cursor.fetchall()
+                return None
+
+            return statements.fetchall(conn, 'banks.list', (username,), dictionary=True)
     except Error as e:
         st.error(f"Error fetching bank accounts: {e}")
-        return []
+        return None
 
+@cached('funds')
 def get_mutual_funds(username):
-    """Get all mutual funds for a user"""
+    """Get all mutual funds for a user with their ROI (None if the fetch failed)"""
     try:
-        with get_db_connection() as conn:
+        with get_read_connection(username) as conn:
             if conn is None:
                 st.error("Failed to connect to database")
-                return []
-                
+                return None
+
+            return statements.fetchall(conn, 'funds.list', (username,), dictionary=True)
+    except Error as e:
+        st.error(f"Error fetching mutual funds: {e}")
+        return None
+
+@cached('cards')
+def get_cards(username):
+    """Get all cards for a user, active ones first (None if the fetch failed)"""
+    try:
+        with get_read_connection(username) as conn:
+            if conn is None:
+                st.error("Failed to connect to database")
+                return None
+
+            return statements.fetchall(conn, 'cards.list', (username,), dictionary=True)
+    except Error as e:
+        st.error(f"Error fetching card details: {e}")
+        return None
+
+
+PAGE_SIZE = 25
+
+BANK_LIST_QUERY = """
+    SELECT id, bank_name, account_number, ifsc_code,
+           account_balance, nominee_name, row_version
+    FROM user_banks
+    WHERE username = %s
+"""
+
+# ROI is computed by MySQL rather than in a per-row Python loop. The 100.0 comes
+# first so SQLite, which keeps whole amounts as integers, does not truncate.
+FUND_LIST_QUERY = """
+    SELECT id, folio_number, fund_name, fund_type,
+           investment_amount, current_value, nominee_name, scheme_code, units, row_version,
+           CASE WHEN investment_amount > 0
+                THEN (current_value - investment_amount) * 100.0 / investment_amount
+                ELSE 0 END AS roi
+    FROM user_mutual_funds
+    WHERE username = %s
+"""
+
+# Keyset pages: rows after a given id, one extra row to detect a next page
+BANK_PAGE_QUERY = """
+    SELECT id, bank_name, account_number, ifsc_code,
+           account_balance, nominee_name, row_version
+    FROM user_banks
+    WHERE username = %s AND id > %s
+    ORDER BY id
+    LIMIT %s
+"""
+
+FUND_PAGE_QUERY = """
+    SELECT id, folio_number, fund_name, fund_type,
+           investment_amount, current_value, nominee_name, scheme_code, units, row_version,
+           CASE WHEN investment_amount > 0
+                THEN (current_value - investment_amount) * 100.0 / investment_amount
+                ELSE 0 END AS roi
+    FROM user_mutual_funds
+    WHERE username = %s AND id > %s
+    ORDER BY id
+    LIMIT %s
+"""
+
+CARD_QUERY = """
+    SELECT id, card_name, card_number, card_classification,
+           card_type, expiry_month, expiry_year, is_active, row_version
+    FROM user_cards
+    WHERE username = %s
+    ORDER BY is_active DESC, card_classification
+"""
+
+PROFILE_QUERY = """
+    SELECT username, full_name, email, gender, date_of_birth,
+           pan_card, aadhar_card, mobile_number, profile_photo_path,
+           address, city, state, pincode, country
+    FROM user_profiles
+    WHERE username = %s
+"""
+
+
+# Prepared once per connection; see statements.py
+statements.register('banks.list', BANK_LIST_QUERY)
+statements.register('funds.list', FUND_LIST_QUERY)
+statements.register('banks.page', BANK_PAGE_QUERY)
+statements.register('funds.page', FUND_PAGE_QUERY)
+statements.register('cards.list', CARD_QUERY)
+statements.register('profile', PROFILE_QUERY)
+statements.register('summary', SUMMARY_QUERY)
+statements.register('aggregates', AGGREGATE_QUERY)
+
+
+@dataclass
+class PortfolioSnapshot:
+    """Everything one page render needs for a user, fetched together.
+
+    ``banks`` and ``funds`` hold only the requested keyset page; the
+    ``has_more_*`` flags say whether another page follows it.
+    """
+    username: str
+    banks: list = field(default_factory=list)
+    funds: list = field(default_factory=list)
+    cards: list = field(default_factory=list)
+    profile: Optional[dict] = None
+    summary: PortfolioSummary = field(default_factory=PortfolioSummary)
+    has_more_banks: bool = False
+    has_more_funds: bool = False
+
+
+def _snapshot_statements(username, bank_after, fund_after, page_size):
+    """(name, registered statement, params) for every SELECT a snapshot is built from"""
+    return (
+        ('banks', 'banks.page', (username, bank_after, page_size + 1)),
+        ('funds', 'funds.page', (username, fund_after, page_size + 1)),
+        ('cards', 'cards.list', (username,)),
+        ('profile', 'profile', (username,)),
+        ('summary', 'summary', (username,)),
+    )
+
+
+def _build_snapshot(username, results, page_size):
+    banks = results.get('banks', [])
+    funds = results.get('funds', [])
+    profile_rows = results.get('profile') or []
+    return PortfolioSnapshot(
+        username=username,
+        banks=banks[:page_size],
+        funds=funds[:page_size],
+        cards=results.get('cards', []),
+        profile=profile_rows[0] if profile_rows else None,
+        summary=build_summary(results.get('summary', [])),
+        has_more_banks=len(banks) > page_size,
+        has_more_funds=len(funds) > page_size,
+    )
+
+
+@cached('snapshot')
+def get_portfolio_snapshot(username, bank_after=0, fund_after=0, page_size=PAGE_SIZE):
+    """Fetch a page of banks and funds, cards, profile and totals in one round trip.
+
+    The SELECTs are sent as one multi-statement query and their result sets
+    read back in order. Returns None if the database is unreachable. Results
+    are cached per user and page until a write invalidates them.
+    """
+    selects = _snapshot_statements(username, bank_after, fund_after, page_size)
+    sql = ";".join(statements.sql(statement).strip() for _, statement, _ in selects)
+    params = tuple(p for _, _, stmt_params in selects for p in stmt_params)
+    try:
+        with get_read_connection(username) as conn:
+            if conn is None:
+                st.error("Failed to connect to database")
+                return None
+
             with conn.cursor(dictionary=True) as cursor:
-                cursor.execute("""
-                    SELECT id, folio_number, fund_name, fund_type,
-                           investment_amount, current_value, nominee_name
-                    FROM user_mutual_funds 
-                    WHERE username = %s
-                """, (username,))
-                return cursor.fetchall()
+                results = {}
+                names = iter(name for name, _, _ in selects)
+                for result in cursor.execute(sql, params, multi=True):
+                    if result.with_rows:
+                        results[next(names)] = result.fetchall()
+    except Error as e:
+        st.error(f"Error fetching portfolio: {e}")
+        return None
+
+    return _build_snapshot(username, results, page_size)
+
+
+def get_executor():
+    """Process-wide thread pool for concurrent reads, sized to the connection pool"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS,
+                                               thread_name_prefix='folio-fetch')
+    return _executor
+
+
+def _fetch_rows(username, name, statement, params, trace=None):
+    """Worker: run one SELECT on its own pooled connection (no Streamlit calls here)"""
+    with stage(f"fetch.{name}", trace):
+        with get_read_connection(username) as conn:
+            if conn is None:
+                raise Error(msg="Failed to connect to database")
+            return statements.fetchall(conn, statement, params, dictionary=True)
+
+
+class SnapshotPrefetch:
+    """Snapshot queries in flight on the fetch pool; ``result()`` joins them"""
+
+    def __init__(self, username, args, futures=None, snapshot=None):
+        self.username = username
+        self.args = args
+        self._futures = futures
+        self._snapshot = snapshot
+
+    def result(self):
+        """The PortfolioSnapshot, or None (after showing an error) if a query failed"""
+        if self._snapshot is None and self._futures:
+            futures, self._futures = self._futures, None
+            try:
+                results = {name: future.result() for name, future in futures.items()}
+            except Error as e:
+                st.error(f"Error fetching portfolio: {e}")
+                return None
+            self._snapshot = _build_snapshot(self.username, results, self.args[-1])
+            get_cache().set(self.username, 'snapshot', self._snapshot, self.args)
+        return self._snapshot
+
+
+def prefetch_portfolio_snapshot(username, bank_after=0, fund_after=0, page_size=PAGE_SIZE):
+    """Start every snapshot query in parallel and return without waiting.
+
+    Each SELECT runs on its own pooled connection, so the wait is that of
+    the slowest query rather than the sum of all of them. A cached snapshot
+    is returned already resolved.
+    """
+    args = (bank_after, fund_after, page_size)
+    hit, snapshot = get_cache().get(username, 'snapshot', args)
+    if hit:
+        return SnapshotPrefetch(username, args, snapshot=snapshot)
+    executor = get_executor()
+    trace = current_trace()
+    futures = {
+        name: executor.submit(_fetch_rows, username, name, statement, params, trace)
+        for name, statement, params in _snapshot_statements(username, *args)
+    }
+    return SnapshotPrefetch(username, args, futures)
+
+
+@cached('banks')
+def get_bank_accounts_page(username, after_id=0, limit=PAGE_SIZE):
+    """One keyset page of a user's bank accounts, ordered by id"""
+    try:
+        with get_read_connection(username) as conn:
+            if conn is None:
+                st.error("Failed to connect to database")
+                return None
+
+            return statements.fetchall(conn, 'banks.page', (username, after_id, limit),
+                                       dictionary=True)
+    except Error as e:
+        st.error(f"Error fetching bank accounts: {e}")
+        return None
+
+
+@cached('funds')
+def get_mutual_funds_page(username, after_id=0, limit=PAGE_SIZE):
+    """One keyset page of a user's mutual funds, ordered by id"""
+    try:
+        with get_read_connection(username) as conn:
+            if conn is None:
+                st.error("Failed to connect to database")
+                return None
+
+            return statements.fetchall(conn, 'funds.page', (username, after_id, limit),
+                                       dictionary=True)
     except Error as e:
         st.error(f"Error fetching mutual funds: {e}")
-        return []
+        return None
+
+
+@cached('aggregates')
+def get_portfolio_aggregates(username):
+    """Totals, per-fund-type breakdown and weighted ROI from one grouped query"""
+    try:
+        with get_read_connection(username) as conn:
+            if conn is None:
+                st.error("Failed to connect to database")
+                return None
+
+            return build_aggregates(statements.fetchall(conn, 'aggregates', (username, username),
+                                                        dictionary=True))
+    except Error as e:
+        st.error(f"Error fetching portfolio totals: {e}")
+        return None
+
+
+@cached('profile')
+def get_profile(username):
+    """A user's profile row, or {} if they have not completed it"""
+    try:
+        with get_read_connection(username) as conn:
+            if conn is None:
+                st.error("Failed to connect to database")
+                return None
+
+            return statements.fetchone(conn, 'profile', (username,), dictionary=True) or {}
+    except Error as e:
+        st.error(f"Error fetching profile: {e}")
+        return None
+
+
+@cached('summary')
+def get_portfolio_summary(username):
+    """The user's ``user_portfolio_summary`` row as a PortfolioSummary"""
+    try:
+        with get_read_connection(username) as conn:
+            if conn is None:
+                st.error("Failed to connect to database")
+                return None
+
+            return build_summary(statements.fetchall(conn, 'summary', (username,), dictionary=True))
+    except Error as e:
+        st.error(f"Error fetching portfolio summary: {e}")
+        return None
 
 
 if __name__ == "__main__":
-    create_database_and_tables()
\ No newline at end of file
+    import sys
+    import migrations
+    sys.exit(migrations.main(sys.argv[1:]))
\ No newline at end of file
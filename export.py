@@ -0,0 +1,250 @@
+# export.py
+"""On-demand export of a user's holdings to CSV, XLSX or Parquet.
+
+Nothing is built until the user asks for a file. Rows are streamed from an
+unbuffered cursor in chunks, formatted column-at-a-time with NumPy and
+written straight to a spooled temporary file, so memory use stays flat no
+matter how many rows are exported.
+"""
+import tempfile
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from mysql.connector import Error
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+
+from database import get_read_connection
+from profiler import stage
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+CHUNK_SIZE = 5000
+SPOOL_LIMIT = 8 * 1024 * 1024  # bytes kept in memory before spilling to disk
+
+DATASETS = {
+    'banks': {
+        'label': "Bank Accounts",
+        'query': """
+            SELECT id, bank_name, account_number, ifsc_code,
+                   account_balance, nominee_name
+            FROM user_banks
+            WHERE username = %s
+            ORDER BY id
+        """,
+        'currency': ['account_balance'],
+        'percent': [],
+    },
+    'funds': {
+        'label': "Mutual Funds",
+        'query': """
+            SELECT id, folio_number, fund_name, fund_type,
+                   investment_amount, current_value, nominee_name,
+                   CASE WHEN investment_amount > 0
+                        THEN (current_value - investment_amount) * 100.0 / investment_amount
+                        ELSE 0 END AS roi
+            FROM user_mutual_funds
+            WHERE username = %s
+            ORDER BY id
+        """,
+        'currency': ['investment_amount', 'current_value'],
+        'percent': ['roi'],
+    },
+    'cards': {
+        'label': "Cards",
+        # Never export full card numbers or CVVs
+        'query': """
+            SELECT id, card_name, CONCAT('**** ', RIGHT(card_number, 4)) AS card_number,
+                   card_classification, card_type, expiry_month, expiry_year, is_active
+            FROM user_cards
+            WHERE username = %s
+            ORDER BY id
+        """,
+        'currency': [],
+        'percent': [],
+    },
+}
+
+FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+if pq is not None:
+    FORMATS['Parquet'] = ('parquet', 'application/vnd.apache.parquet')
+
+XLSX_CURRENCY_FORMAT = '"₹"#,##0.00'
+XLSX_PERCENT_FORMAT = '0.00"%"'
+
+
+def format_currency_column(values):
+    """Vectorized equivalent of ``f"₹{value:,.2f}"`` over a whole column"""
+    numbers = pd.to_numeric(pd.Series(values), errors='coerce').fillna(0).to_numpy(dtype=float)
+    cents = np.round(np.abs(numbers) * 100).astype(np.int64)
+    whole, frac = np.divmod(cents, 100)
+
+    # Build the thousands groups from the most significant one down
+    text = np.full(len(whole), '', dtype=object)
+    groups = (len(str(int(whole.max(initial=0)))) - 1) // 3
+    for k in range(groups, -1, -1):
+        group = ((whole // 1000 ** k) % 1000).astype(str)
+        leading = (whole >= 1000 ** k) | (k == 0)
+        text = np.where(text != '', text + ',' + np.char.zfill(group, 3).astype(object),
+                        np.where(leading, group.astype(object), text))
+
+    sign = np.where(numbers < 0, '-', '')
+    cents_text = np.char.zfill(frac.astype(str), 2).astype(object)
+    return '₹' + sign.astype(object) + text + '.' + cents_text
+
+
+def format_percentage_column(values):
+    """Vectorized equivalent of ``f"{value:.2f}%"`` over a whole column"""
+    numbers = pd.to_numeric(pd.Series(values), errors='coerce').fillna(0).to_numpy(dtype=float)
+    return np.char.mod('%.2f%%', numbers)
+
+
+def iter_chunks(username, dataset, chunk_size=CHUNK_SIZE):
+    """Stream a dataset as DataFrames of at most ``chunk_size`` rows.
+
+    The cursor is unbuffered, so MySQL sends rows as they are fetched rather
+    than materialising the whole result set in the client first.
+    """
+    spec = DATASETS[dataset]
+    with get_read_connection(username) as conn:
+        if conn is None:
+            raise Error(msg="Failed to connect to database")
+        cursor = conn.cursor(buffered=False)
+        try:
+            cursor.execute(spec['query'], (username,))
+            columns = [c[0] for c in cursor.description]
+            first = True
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows and not first:
+                    break
+                # An empty dataset still yields one empty frame carrying the columns
+                yield pd.DataFrame.from_records(rows, columns=columns)
+                if not rows:
+                    break
+                first = False
+        finally:
+            if conn.unread_result:
+                conn.consume_results()
+            cursor.close()
+
+
+def _numeric_chunk(chunk, spec):
+    for column in spec['currency'] + spec['percent']:
+        chunk[column] = pd.to_numeric(chunk[column], errors='coerce')
+    return chunk
+
+
+def write_csv(username, dataset, out):
+    spec = DATASETS[dataset]
+    header = True
+    for chunk in iter_chunks(username, dataset):
+        for column in spec['currency']:
+            chunk[column] = format_currency_column(chunk[column])
+        for column in spec['percent']:
+            chunk[column] = format_percentage_column(chunk[column])
+        out.write(chunk.to_csv(index=False, header=header).encode('utf-8'))
+        header = False
+
+
+def write_xlsx(username, datasets, out):
+    """One sheet per dataset, with numeric cells kept numeric"""
+    workbook = Workbook(write_only=True)
+    for dataset in datasets:
+        spec = DATASETS[dataset]
+        sheet = workbook.create_sheet(spec['label'])
+        formats = {c: XLSX_CURRENCY_FORMAT for c in spec['currency']}
+        formats.update({c: XLSX_PERCENT_FORMAT for c in spec['percent']})
+        for index, chunk in enumerate(iter_chunks(username, dataset)):
+            if index == 0:
+                sheet.append(list(chunk.columns))
+            chunk = _numeric_chunk(chunk, spec)
+            positions = {chunk.columns.get_loc(c): f for c, f in formats.items()}
+            for row in chunk.itertuples(index=False, name=None):
+                cells = []
+                for position, value in enumerate(row):
+                    if position in positions:
+                        value = WriteOnlyCell(sheet, value=None if pd.isna(value) else float(value))
+                        value.number_format = positions[position]
+                    cells.append(value)
+                sheet.append(cells)
+    workbook.save(out)
+
+
+def write_parquet(username, dataset, out):
+    spec = DATASETS[dataset]
+    writer = None
+    try:
+        for chunk in iter_chunks(username, dataset):
+            chunk = _numeric_chunk(chunk, spec)
+            # Pin text columns to strings so an all-NULL first chunk can't fix a null type
+            for column in chunk.select_dtypes('object').columns:
+                chunk[column] = chunk[column].astype('string')
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(out, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def build_export(username, datasets, fmt):
+    """Write the requested export to a spooled temp file and return it rewound"""
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_LIMIT)
+    if fmt == 'Excel':
+        write_xlsx(username, datasets, out)
+    elif fmt == 'Parquet':
+        write_parquet(username, datasets[0], out)
+    else:
+        write_csv(username, datasets[0], out)
+    out.seek(0)
+    return out
+
+
+def display_export_options(username):
+    """Let the user pick a dataset and format, and build the file only on request"""
+    st.header("📤 Export Data")
+    choices = {spec['label']: [key] for key, spec in DATASETS.items()}
+    choices["Everything (one workbook)"] = list(DATASETS)
+
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        choice = st.selectbox("Data", list(choices), key="export_choice")
+    datasets = choices[choice]
+    formats = ['Excel'] if len(datasets) > 1 else list(FORMATS)
+    with col2:
+        fmt = st.selectbox("Format", formats, key="export_format")
+    with col3:
+        st.markdown("<div style='height: 28px'></div>", unsafe_allow_html=True)
+        prepare = st.button("Prepare export", key="prepare_export")
+
+    request = (username, tuple(datasets), fmt)
+    if prepare:
+        try:
+            with stage("export.build"):
+                st.session_state.export_file = (request, build_export(username, datasets, fmt))
+        except Error as e:
+            st.error(f"Error exporting data: {e}")
+            return
+
+    prepared = st.session_state.get('export_file')
+    if prepared and prepared[0] == request:
+        extension, mime = FORMATS[fmt]
+        name = "portfolio" if len(datasets) > 1 else datasets[0]
+        prepared[1].seek(0)
+        st.download_button(
+            f"Download {choice} ({fmt})",
+            data=prepared[1],
+            file_name=f"{name}.{extension}",
+            mime=mime,
+            key="download_export",
+        )
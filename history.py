@@ -0,0 +1,411 @@
+# history.py
+"""Time series of bank balances and fund values.
+
+Triggers on ``user_banks`` and ``user_mutual_funds`` (migration 4) add a row
+to ``holding_events`` for every insert, delete and value change. The row
+holds the new value and its delta from the old one. ``holding_events`` is
+range-partitioned by month, so old months can be dropped cheaply and range
+scans only touch the months they need.
+
+``rollup()`` folds the events, day by day and incrementally, into two
+tables. ``holding_daily`` holds each holding's closing value on each day it
+changed. ``networth_daily`` holds each user's running totals, which are the
+previous day's totals plus the day's deltas. Rollups run only from the
+scheduled job. A chart reads the rollups plus that user's own events not
+yet folded (the tail past ``history_rollup_state.last_event_id``), so its
+cost depends on the number of changed days in range, not on the number of
+raw events, and reads never wait on a rollup.
+
+    python history.py rollup          # fold new events (run from cron)
+    python history.py partitions      # pre-create upcoming month partitions
+"""
+import sys
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+import streamlit as st
+from mysql.connector import Error
+
+from cache import cached
+from database import get_features, get_read_connection
+from sharding import backends, scatter
+
+PARTITION_MONTHS_AHEAD = 3
+ROLLUP_LOCK = 'folio_fetch_history_rollup'
+
+HOLDING_DAILY_ROLLUP = """
+    INSERT INTO holding_daily (username, kind, holding_id, day, value, invested)
+    SELECT username, kind, holding_id, %s, value, invested
+    FROM (
+        SELECT username, kind, holding_id, value, invested,
+               ROW_NUMBER() OVER (PARTITION BY kind, holding_id
+                                  ORDER BY recorded_at DESC, id DESC) AS latest
+        FROM holding_events
+        WHERE recorded_at >= %s AND recorded_at < %s AND id <= %s
+    ) day_events
+    WHERE latest = 1
+    ON DUPLICATE KEY UPDATE value = VALUES(value), invested = VALUES(invested)
+"""
+
+# Previous totals plus the day's deltas; params are (day, start, end, last_id, day)
+NETWORTH_DAILY_ROLLUP = """
+    INSERT INTO networth_daily (username, day, bank_balance, fund_value, fund_invested)
+    SELECT d.username, %s,
+           COALESCE(prev.bank_balance, 0) + d.bank_delta,
+           COALESCE(prev.fund_value, 0) + d.fund_delta,
+           COALESCE(prev.fund_invested, 0) + d.invested_delta
+    FROM (
+        SELECT username,
+               SUM(CASE WHEN kind = 'bank' THEN delta_value ELSE 0 END) AS bank_delta,
+               SUM(CASE WHEN kind = 'fund' THEN delta_value ELSE 0 END) AS fund_delta,
+               SUM(delta_invested) AS invested_delta
+        FROM holding_events
+        WHERE recorded_at >= %s AND recorded_at < %s AND id <= %s
+        GROUP BY username
+    ) d
+    LEFT JOIN networth_daily prev
+        ON prev.username = d.username
+        AND prev.day = (SELECT MAX(p.day) FROM networth_daily p
+                        WHERE p.username = d.username AND p.day < %s)
+    ON DUPLICATE KEY UPDATE
+        bank_balance = VALUES(bank_balance),
+        fund_value = VALUES(fund_value),
+        fund_invested = VALUES(fund_invested)
+"""
+
+# A user's events not folded yet, as per-day deltas on top of networth_daily
+NETWORTH_TAIL = """
+    SELECT DATE(recorded_at) AS day,
+           SUM(CASE WHEN kind = 'bank' THEN delta_value ELSE 0 END) AS bank_delta,
+           SUM(CASE WHEN kind = 'fund' THEN delta_value ELSE 0 END) AS fund_delta,
+           SUM(delta_invested) AS invested_delta
+    FROM holding_events
+    WHERE username = %s
+      AND id > (SELECT COALESCE(MAX(last_event_id), 0) FROM history_rollup_state)
+    GROUP BY DATE(recorded_at)
+    ORDER BY day
+"""
+
+NETWORTH_COLUMNS = {'bank_balance': 'bank_delta', 'fund_value': 'fund_delta',
+                    'fund_invested': 'invested_delta'}
+
+
+def partition_name(month):
+    return f"p{month:%Y%m}"
+
+
+def next_month(month):
+    return (month.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def partition_definitions(first_month, count):
+    """``PARTITION ... VALUES LESS THAN`` clauses for ``count`` months"""
+    clauses = []
+    month = first_month.replace(day=1)
+    for _ in range(count):
+        following = next_month(month)
+        clauses.append(f"PARTITION {partition_name(month)} "
+                       f"VALUES LESS THAN (TO_DAYS('{following.isoformat()}'))")
+        month = following
+    return clauses
+
+
+def ensure_partitions(cursor, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Split the catch-all partition so upcoming months get their own"""
+    cursor.execute("""
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'holding_events'
+    """)
+    existing = {row[0] for row in cursor.fetchall()}
+    monthly = sorted(name for name in existing if name and name != 'p_future')
+    if not monthly:
+        return []
+    last = date(int(monthly[-1][1:5]), int(monthly[-1][5:7]), 1)
+    target = date.today().replace(day=1)
+    for _ in range(months_ahead):
+        target = next_month(target)
+    missing = 0
+    month = next_month(last)
+    while month <= target:
+        missing += 1
+        month = next_month(month)
+    if not missing:
+        return []
+    clauses = partition_definitions(next_month(last), missing)
+    cursor.execute(f"""
+        ALTER TABLE holding_events REORGANIZE PARTITION p_future INTO (
+            {', '.join(clauses)},
+            PARTITION p_future VALUES LESS THAN MAXVALUE
+        )
+    """)
+    return clauses
+
+
+def drop_partitions_before(cursor, month):
+    """Drop raw events for months before ``month``; rollups keep their totals"""
+    cursor.execute("""
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'holding_events'
+    """)
+    cutoff = partition_name(month)
+    old = sorted(row[0] for row in cursor.fetchall()
+                 if row[0] and row[0] != 'p_future' and row[0] < cutoff)
+    if old:
+        cursor.execute(f"ALTER TABLE holding_events DROP PARTITION {', '.join(old)}")
+    return old
+
+
+def _rollup_day(cursor, day, last_id):
+    start, end = day, day + timedelta(days=1)
+    cursor.execute(HOLDING_DAILY_ROLLUP, (day, start, end, last_id))
+    cursor.execute(NETWORTH_DAILY_ROLLUP, (day, start, end, last_id, day))
+
+
+def rollup(conn):
+    """Fold events past the last folded id into the daily tables.
+
+    Folds events up to the highest id seen by the previous run, so a
+    transaction that took an id then has a whole interval to commit. Every
+    day from the earliest of those events on is redone, as each day starts
+    from the previous day's totals, so an event committed late for an earlier
+    day is still folded. The rollups and ``last_event_id`` are committed
+    together, so readers adding the tail never count an event twice.
+    Returns the days processed, or None without waiting if another process
+    holds the rollup lock.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (ROLLUP_LOCK,))
+        if cursor.fetchone()[0] != 1:
+            return None
+        try:
+            cursor.execute("SELECT last_event_id, seen_event_id FROM history_rollup_state WHERE id = 1")
+            folded, seen = cursor.fetchone() or (0, 0)
+            last_id = max(folded, seen)
+            cursor.execute("""
+                SELECT DATE(MIN(recorded_at)) FROM holding_events WHERE id > %s AND id <= %s
+            """, (folded, last_id))
+            first = cursor.fetchone()[0]
+            days = []
+            if first is not None:
+                cursor.execute("""
+                    SELECT DISTINCT DATE(recorded_at) AS day FROM holding_events
+                    WHERE recorded_at >= %s AND id <= %s ORDER BY day
+                """, (first, last_id))
+                days = [r[0] for r in cursor.fetchall()]
+            # Days must be folded in order: each starts from the previous totals
+            for day in days:
+                _rollup_day(cursor, day, last_id)
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM holding_events")
+            latest = cursor.fetchone()[0]
+            cursor.execute("""
+                INSERT INTO history_rollup_state (id, last_day, last_event_id, seen_event_id)
+                VALUES (1, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE last_day = COALESCE(VALUES(last_day), last_day),
+                    last_event_id = VALUES(last_event_id), seen_event_id = VALUES(seen_event_id)
+            """, (days[-1] if days else None, last_id, latest))
+            conn.commit()
+            return days
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (ROLLUP_LOCK,))
+            cursor.fetchone()
+
+
+def with_tail(rows, tail):
+    """Rolled-up net worth rows with the user's unfolded deltas added, by day"""
+    if not tail:
+        return rows
+    rolled = {row['day']: row for row in rows}
+    deltas = {row['day']: row for row in tail}
+    base = dict.fromkeys(NETWORTH_COLUMNS, 0)
+    carried = dict.fromkeys(NETWORTH_COLUMNS, 0)
+    merged = []
+    for day in sorted(rolled.keys() | deltas.keys()):
+        if day in rolled:
+            base = rolled[day]
+        if day in deltas:
+            for column, delta in NETWORTH_COLUMNS.items():
+                carried[column] += deltas[day][delta] or 0
+        merged.append({'day': day, **{c: base[c] + carried[c] for c in NETWORTH_COLUMNS}})
+    return merged
+
+
+@cached('history')
+def get_net_worth_history(username, start, end):
+    """Daily rollup rows in ``[start, end]`` plus the last row before ``start``.
+
+    The user's events not rolled up yet are added on top.
+    """
+    try:
+        with get_read_connection(username) as conn:
+            if conn is None:
+                st.error("Failed to connect to database")
+                return None
+            with conn.cursor(dictionary=True) as cursor:
+                # The opening row carries the totals into the start of the range
+                cursor.execute("""
+                    (SELECT day, bank_balance, fund_value, fund_invested
+                     FROM networth_daily
+                     WHERE username = %s AND day < %s
+                     ORDER BY day DESC LIMIT 1)
+                    UNION ALL
+                    (SELECT day, bank_balance, fund_value, fund_invested
+                     FROM networth_daily
+                     WHERE username = %s AND day BETWEEN %s AND %s)
+                    ORDER BY day
+                """, (username, start, username, start, end))
+                rows = cursor.fetchall()
+                cursor.execute(NETWORTH_TAIL, (username,))
+                return with_tail(rows, cursor.fetchall())
+    except Error as e:
+        st.error(f"Error fetching net worth history: {e}")
+        return None
+
+
+@cached('history')
+def get_fund_value_history(username, start, end, fund_ids=None):
+    """Per-fund closing values in ``[start, end]``, with each fund's opening row.
+
+    The user's fund events not rolled up yet follow as rows of their own.
+    """
+    fund_filter = ""
+    params = [username, start]
+    if fund_ids:
+        fund_filter = f"AND holding_id IN ({', '.join(['%s'] * len(fund_ids))})"
+        params += list(fund_ids)
+    try:
+        with get_read_connection(username) as conn:
+            if conn is None:
+                st.error("Failed to connect to database")
+                return None
+            with conn.cursor(dictionary=True) as cursor:
+                cursor.execute(f"""
+                    SELECT h.holding_id, h.day, h.value, h.invested
+                    FROM holding_daily h
+                    JOIN (
+                        SELECT holding_id, MAX(day) AS day
+                        FROM holding_daily
+                        WHERE username = %s AND kind = 'fund' AND day < %s {fund_filter}
+                        GROUP BY holding_id
+                    ) opening ON opening.holding_id = h.holding_id AND opening.day = h.day
+                    WHERE h.username = %s AND h.kind = 'fund'
+                    UNION ALL
+                    SELECT holding_id, day, value, invested
+                    FROM holding_daily
+                    WHERE username = %s AND kind = 'fund' AND day BETWEEN %s AND %s {fund_filter}
+                    ORDER BY day
+                """, params + [username, username, start, end] + list(fund_ids or ()))
+                rows = cursor.fetchall()
+                # Closing values, not deltas: later rows win in fund_value_curves
+                cursor.execute(f"""
+                    SELECT holding_id, DATE(recorded_at) AS day, value, invested
+                    FROM holding_events
+                    WHERE username = %s AND kind = 'fund' {fund_filter}
+                      AND id > (SELECT COALESCE(MAX(last_event_id), 0) FROM history_rollup_state)
+                    ORDER BY recorded_at, id
+                """, [username] + list(fund_ids or ()))
+                return sorted(rows + cursor.fetchall(), key=lambda row: row['day'])
+    except Error as e:
+        st.error(f"Error fetching fund history: {e}")
+        return None
+
+
+def _daily_index(start, end):
+    return pd.date_range(start, end, freq='D', name='day')
+
+
+def net_worth_curve(rows, start, end):
+    """Forward-filled daily net worth between ``start`` and ``end``"""
+    columns = ['bank_balance', 'fund_value', 'fund_invested']
+    df = pd.DataFrame(rows or [], columns=['day'] + columns)
+    df['day'] = pd.to_datetime(df['day'])
+    df[columns] = df[columns].apply(pd.to_numeric, errors='coerce')
+    # Rows exist only for days with changes; carry values forward between them
+    index = _daily_index(start, end).union(pd.DatetimeIndex(df['day']))
+    daily = df.set_index('day').reindex(index).ffill().fillna(0)
+    daily = daily.loc[pd.Timestamp(start):pd.Timestamp(end)]
+    daily['net_worth'] = daily['bank_balance'] + daily['fund_value']
+    return daily
+
+
+def fund_value_curves(rows, start, end, names=None):
+    """Daily closing value per fund (one column each), forward-filled"""
+    df = pd.DataFrame(rows or [], columns=['holding_id', 'day', 'value', 'invested'])
+    df['day'] = pd.to_datetime(df['day'])
+    df['value'] = pd.to_numeric(df['value'], errors='coerce')
+    wide = df.pivot_table(index='day', columns='holding_id', values='value', aggfunc='last')
+    wide = wide.reindex(_daily_index(start, end).union(wide.index)).ffill()
+    wide = wide.loc[pd.Timestamp(start):pd.Timestamp(end)]
+    if names:
+        wide = wide.rename(columns=names)
+    return wide
+
+
+RANGES = {"1M": 30, "3M": 91, "1Y": 365, "3Y": 3 * 365, "5Y": 5 * 365}
+
+
+def display_history(username, funds=None):
+    """Net worth and per-fund value charts for a chosen range"""
+    with st.expander("📈 History"):
+        if 'history' not in get_features():
+            st.info("Holding history needs the MySQL storage backend.")
+            return
+        label = st.radio("Range", list(RANGES), index=2, horizontal=True, key="history_range")
+        end = date.today()
+        start = end - timedelta(days=RANGES[label])
+
+        rows = get_net_worth_history(username, start, end)
+        if rows is None:
+            return
+        if not rows:
+            st.info("No history recorded yet.")
+            return
+        curve = net_worth_curve(rows, start, end)
+        st.line_chart(curve[['net_worth', 'bank_balance', 'fund_value']])
+
+        names = {f['id']: f['fund_name'] for f in funds or []}
+        if names:
+            chosen = st.multiselect("Funds", list(names), format_func=names.get,
+                                    key="history_funds")
+            if chosen:
+                fund_rows = get_fund_value_history(username, start, end, tuple(chosen))
+                if fund_rows:
+                    st.line_chart(fund_value_curves(fund_rows, start, end, names))
+
+
+def _run_command(command, conn):
+    if command == 'partitions':
+        with conn.cursor() as cursor:
+            added = ensure_partitions(cursor)
+        return f"Added {len(added)} partition(s)"
+    with conn.cursor() as cursor:
+        ensure_partitions(cursor)
+    started = time.perf_counter()
+    days = rollup(conn)
+    if days is None:
+        raise Error(msg="Another rollup is already running")
+    return f"Rolled up {len(days)} day(s) in {time.perf_counter() - started:.2f}s"
+
+
+def main(argv):
+    command = argv[0] if argv else 'rollup'
+    if command not in ('partitions', 'rollup'):
+        print(f"Unknown command: {command}")
+        return 2
+    # Each shard keeps the history of its own users
+    shards = [shard for shard, backend in backends().items() if 'history' in backend.features]
+    if not shards:
+        print("Holding history needs the MySQL storage backend")
+        return 1
+    try:
+        results = scatter(lambda conn, shard: _run_command(command, conn), shards)
+    except Error as e:
+        print(f"History {command} failed: {e}")
+        return 1
+    for shard, message in results.items():
+        print(message if shard == 'default' else f"{shard}: {message}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,67 @@
+# images.py
+"""Profile photo pipeline: resize once at upload, serve cached thumbnails.
+
+Uploads are decoded a single time, rotated according to their EXIF
+orientation, downscaled to the display width and re-encoded without any
+metadata. Files are named after a hash of the uploaded content, so
+re-uploading the same photo reuses the existing thumbnail.
+"""
+import hashlib
+import io
+import os
+from functools import lru_cache
+
+from PIL import Image, ImageOps, features
+
+PHOTO_DIR = "profile_photos"
+# st.image has no srcset, so a single size is generated and served
+DISPLAY_WIDTH = 200
+THUMBNAIL_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+THUMBNAIL_EXTENSION = '.webp' if THUMBNAIL_FORMAT == 'WEBP' else '.jpg'
+THUMBNAIL_QUALITY = 80
+
+
+def thumbnail_path(digest):
+    return os.path.join(PHOTO_DIR, f"{digest}_{DISPLAY_WIDTH}{THUMBNAIL_EXTENSION}")
+
+
+def is_thumbnail(path):
+    return bool(path) and path.endswith(f"_{DISPLAY_WIDTH}{THUMBNAIL_EXTENSION}")
+
+
+def encode_thumbnail(image, size):
+    """Downscale to fit ``size`` x ``size`` and encode without EXIF"""
+    thumb = image.copy()
+    thumb.thumbnail((size, size), Image.LANCZOS)
+    out = io.BytesIO()
+    thumb.save(out, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def save_profile_thumbnail(data):
+    """Write the display-size thumbnail for an uploaded photo's bytes.
+
+    Returns its path, which is what gets stored in
+    ``user_profiles.profile_photo_path``.
+    """
+    path = thumbnail_path(hashlib.sha256(data).hexdigest()[:32])
+    if os.path.exists(path):
+        return path
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        os.makedirs(PHOTO_DIR, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(encode_thumbnail(image, DISPLAY_WIDTH))
+        os.replace(tmp_path, path)
+    return path
+
+
+@lru_cache(maxsize=256)
+def load_thumbnail(path):
+    """Encoded thumbnail bytes; files are immutable so caching by path is safe"""
+    with open(path, "rb") as f:
+        return f.read()
@@ -0,0 +1,254 @@
+# importer.py
+"""Bulk import of bank accounts and mutual funds from CSV/XLSX statements.
+
+The whole file is validated in one vectorized pass with pandas. Valid rows
+are upserted in batches with ``executemany`` and ``INSERT ... ON DUPLICATE
+KEY UPDATE``, using the existing ``UNIQUE(username, account_number)`` and
+``UNIQUE(username, folio_number)`` keys, all inside a single transaction.
+A blank or missing amount never overwrites a stored one; new rows get 0.
+"""
+import time
+import zipfile
+from dataclasses import dataclass, field
+
+import pandas as pd
+import streamlit as st
+from mysql.connector import Error
+
+from cache import invalidate
+from database import get_db_connection
+
+BATCH_SIZE = 500
+IFSC_PATTERN = r'[A-Z]{4}0[A-Z0-9]{6}'
+FUND_TYPES = ["Equity", "Debt", "Hybrid", "ELSS", "Other"]
+
+DATASETS = {
+    'banks': {
+        'label': "Bank accounts",
+        'entity': 'banks',
+        'key': 'account_number',
+        'columns': ['bank_name', 'account_number', 'ifsc_code', 'account_balance', 'nominee_name'],
+        'required': ['bank_name', 'account_number', 'ifsc_code'],
+        'numeric': ['account_balance'],
+        'max_length': {'bank_name': 255, 'account_number': 20, 'ifsc_code': 11, 'nominee_name': 255},
+        'upsert': """
+            INSERT INTO user_banks (
+                username, bank_name, account_number,
+                ifsc_code, account_balance, nominee_name
+            ) VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                bank_name = VALUES(bank_name),
+                ifsc_code = VALUES(ifsc_code),
+                account_balance = COALESCE(VALUES(account_balance), account_balance),
+                nominee_name = VALUES(nominee_name)
+        """,
+        'existing': "SELECT account_number FROM user_banks WHERE username = %s",
+    },
+    'funds': {
+        'label': "Mutual funds",
+        'entity': 'funds',
+        'key': 'folio_number',
+        'columns': ['folio_number', 'fund_name', 'fund_type', 'investment_amount',
+                    'current_value', 'nominee_name'],
+        'required': ['folio_number', 'fund_name', 'fund_type'],
+        'numeric': ['investment_amount', 'current_value'],
+        'max_length': {'folio_number': 50, 'fund_name': 255, 'nominee_name': 255},
+        'upsert': """
+            INSERT INTO user_mutual_funds (
+                username, folio_number, fund_name,
+                fund_type, investment_amount,
+                current_value, nominee_name
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                fund_name = VALUES(fund_name),
+                fund_type = VALUES(fund_type),
+                investment_amount = COALESCE(VALUES(investment_amount), investment_amount),
+                current_value = COALESCE(VALUES(current_value), current_value),
+                nominee_name = VALUES(nominee_name)
+        """,
+        'existing': "SELECT folio_number FROM user_mutual_funds WHERE username = %s",
+    },
+}
+
+# Header spellings seen in bank statements and CAS exports
+COLUMN_ALIASES = {
+    'bank': 'bank_name',
+    'account': 'account_number',
+    'account_no': 'account_number',
+    'a/c_no': 'account_number',
+    'ifsc': 'ifsc_code',
+    'balance': 'account_balance',
+    'closing_balance': 'account_balance',
+    'nominee': 'nominee_name',
+    'folio': 'folio_number',
+    'folio_no': 'folio_number',
+    'scheme': 'fund_name',
+    'scheme_name': 'fund_name',
+    'fund': 'fund_name',
+    'type': 'fund_type',
+    'category': 'fund_type',
+    'invested': 'investment_amount',
+    'cost_value': 'investment_amount',
+    'purchase_value': 'investment_amount',
+    'market_value': 'current_value',
+    'valuation': 'current_value',
+}
+
+
+@dataclass
+class ImportReport:
+    dataset: str
+    total_rows: int = 0
+    inserted: int = 0
+    updated: int = 0
+    errors: pd.DataFrame = field(default_factory=lambda: pd.DataFrame(columns=['row', 'error']))
+    seconds: float = 0.0
+
+    @property
+    def imported(self):
+        return self.inserted + self.updated
+
+    @property
+    def rows_per_second(self):
+        return self.total_rows / self.seconds if self.seconds else 0.0
+
+
+def read_upload(upload):
+    """Load an uploaded CSV/XLSX file as all-text columns"""
+    if upload.name.lower().endswith(('.xlsx', '.xls')):
+        df = pd.read_excel(upload, dtype=str)
+    else:
+        df = pd.read_csv(upload, dtype=str, keep_default_na=False)
+    return df
+
+
+def normalise_columns(df):
+    names = (df.columns.astype(str).str.strip().str.lower()
+             .str.replace(r'[\s\.\-]+', '_', regex=True).str.strip('_'))
+    df.columns = [COLUMN_ALIASES.get(name, name) for name in names]
+    return df
+
+
+def validate(df, dataset):
+    """Return ``(valid_rows, errors)`` for a raw upload, checked column-wise.
+
+    Row numbers in ``errors`` are spreadsheet rows (the header is row 1).
+    """
+    spec = DATASETS[dataset]
+    df = normalise_columns(df.copy())
+    missing = [c for c in spec['required'] if c not in df.columns]
+    if missing:
+        errors = pd.DataFrame({'row': [1], 'error': [f"Missing column(s): {', '.join(missing)}"]})
+        return df.iloc[0:0], errors
+
+    for column in spec['columns']:
+        if column not in df.columns:
+            df[column] = None
+    df = df[spec['columns']]
+    df.index = pd.RangeIndex(2, len(df) + 2)
+
+    text = [c for c in spec['columns'] if c not in spec['numeric']]
+    for column in text:
+        df[column] = df[column].astype('string').str.strip().replace('', pd.NA)
+
+    problems = pd.Series('', index=df.index, dtype=object)
+
+    def flag(mask, message):
+        mask = mask.fillna(False).astype(bool)
+        problems[mask] = problems[mask] + message + '; '
+
+    for column in spec['required']:
+        flag(df[column].isna(), f"{column} is required")
+    for column, limit in spec['max_length'].items():
+        flag(df[column].str.len() > limit, f"{column} is longer than {limit} characters")
+    for column in spec['numeric']:
+        raw = df[column].astype('string').str.replace(r'[₹,\s]', '', regex=True).replace('', pd.NA)
+        values = pd.to_numeric(raw, errors='coerce')
+        flag(raw.notna() & values.isna(), f"{column} is not a number")
+        flag(values < 0, f"{column} cannot be negative")
+        df[column] = values.round(2)  # NaN when absent: the stored amount is kept
+
+    if dataset == 'banks':
+        df['ifsc_code'] = df['ifsc_code'].str.upper()
+        flag(df['ifsc_code'].notna() & ~df['ifsc_code'].str.fullmatch(IFSC_PATTERN),
+             "ifsc_code is not a valid IFSC")
+    else:
+        df['fund_type'] = df['fund_type'].str.title().replace({'Elss': 'ELSS'})
+        flag(df['fund_type'].notna() & ~df['fund_type'].isin(FUND_TYPES),
+             f"fund_type must be one of {', '.join(FUND_TYPES)}")
+
+    key = spec['key']
+    flag(df[key].notna() & df.duplicated(key, keep='last'),
+         f"duplicate {key} in file (a later row replaces it)")
+
+    bad = problems != ''
+    errors = pd.DataFrame({'row': df.index[bad], 'error': problems[bad].str.rstrip('; ').values})
+    return df[~bad], errors
+
+
+def upsert_rows(username, dataset, rows):
+    """Upsert validated rows in one transaction; returns ``(inserted, updated)``"""
+    spec = DATASETS[dataset]
+
+    with get_db_connection(username) as conn:
+        if conn is None:
+            raise Error(msg="Failed to connect to database")
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(spec['existing'], (username,))
+                existing = {row[0] for row in cursor.fetchall()}
+                # Missing amounts start at 0 on new rows and stay NULL (kept) on updates
+                new = ~rows[spec['key']].isin(existing)
+                rows = rows.copy()
+                rows.loc[new, spec['numeric']] = rows.loc[new, spec['numeric']].fillna(0)
+                # Python scalars only: the connector cannot bind NumPy or pandas NA types
+                values = rows.astype(object).where(rows.notna(), None).values.tolist()
+                params = [(username, *row) for row in values]
+                for start in range(0, len(params), BATCH_SIZE):
+                    cursor.executemany(spec['upsert'], params[start:start + BATCH_SIZE])
+            conn.commit()
+        except Error:
+            conn.rollback()
+            raise
+
+    invalidate(username, spec['entity'])
+    updated = int(rows[spec['key']].isin(existing).sum())
+    return len(rows) - updated, updated
+
+
+def import_file(username, upload, dataset):
+    """Parse, validate and upsert an uploaded statement, timing the whole run"""
+    started = time.perf_counter()
+    raw = read_upload(upload)
+    valid, errors = validate(raw, dataset)
+    report = ImportReport(dataset=dataset, total_rows=len(raw), errors=errors)
+    if len(valid):
+        report.inserted, report.updated = upsert_rows(username, dataset, valid)
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def display_bulk_import(username):
+    """Upload form for importing many holdings at once"""
+    with st.expander("📥 Bulk import from CSV/XLSX"):
+        labels = {spec['label']: key for key, spec in DATASETS.items()}
+        dataset = labels[st.radio("Import", list(labels), horizontal=True, key="import_dataset")]
+        st.caption("Columns: " + ", ".join(
+            f"{c}*" if c in DATASETS[dataset]['required'] else c for c in DATASETS[dataset]['columns']))
+        upload = st.file_uploader("Statement file", type=['csv', 'xlsx'], key="import_file")
+
+        if upload is not None and st.button("Import", key="run_import"):
+            try:
+                report = import_file(username, upload, dataset)
+            except (Error, ValueError, zipfile.BadZipFile) as e:
+                st.error(f"Error importing file: {e}")
+                return
+
+            if report.imported:
+                st.success(
+                    f"Imported {report.imported} of {report.total_rows} rows "
+                    f"({report.inserted} new, {report.updated} updated) in {report.seconds:.2f}s "
+                    f"· {report.rows_per_second:,.0f} rows/s")
+            if len(report.errors):
+                st.warning(f"{len(report.errors)} row(s) were skipped")
+                st.dataframe(report.errors, hide_index=True, use_container_width=True)
@@ -0,0 +1,604 @@
+# migrations.py
+"""Versioned schema migrations for the folio_fetch database.
+
+Each migration is applied once and recorded in the ``schema_version`` table.
+``ensure_schema()`` is cheap to call on every Streamlit rerun: after the first
+successful check in a process it returns immediately. Run
+``python migrations.py`` to migrate from the command line, or
+``python migrations.py --status`` to list pending migrations.
+"""
+import sys
+import threading
+import time
+from datetime import date
+
+import mysql.connector
+from mysql.connector import Error
+
+import database
+import history
+import sharding
+import summary
+from querylog import instrument
+
+MIGRATION_LOCK = 'folio_fetch_migrations'
+MIGRATION_LOCK_TIMEOUT = 60
+
+
+def _column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone() is not None
+
+
+def _index_exists(cursor, table, index):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        LIMIT 1
+    """, (table, index))
+    return cursor.fetchone() is not None
+
+
+def add_column(table, column, definition):
+    """Migration step adding a column unless an earlier bootstrap already did"""
+    def step(cursor):
+        if not _column_exists(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+
+def add_index(table, index, columns):
+    """Migration step adding a secondary index if it is missing"""
+    def step(cursor):
+        if not _index_exists(cursor, table, index):
+            cursor.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+    return step
+
+
+def _table_exists(cursor, table):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return cursor.fetchone() is not None
+
+
+def add_trigger(name, statement):
+    """Migration step creating a trigger unless it already exists"""
+    def step(cursor):
+        cursor.execute("""
+            SELECT 1 FROM information_schema.TRIGGERS
+            WHERE TRIGGER_SCHEMA = DATABASE() AND TRIGGER_NAME = %s
+        """, (name,))
+        if cursor.fetchone() is None:
+            cursor.execute(f"CREATE TRIGGER {name} {statement}")
+    return step
+
+
+def create_holding_events(cursor):
+    """Month-partitioned event table, starting with the current month"""
+    if _table_exists(cursor, 'holding_events'):
+        return
+    partitions = history.partition_definitions(date.today(), history.PARTITION_MONTHS_AHEAD + 1)
+    cursor.execute(f"""
+        CREATE TABLE holding_events (
+            id BIGINT AUTO_INCREMENT,
+            username VARCHAR(255) NOT NULL,
+            kind ENUM('bank', 'fund') NOT NULL,
+            holding_id INT NOT NULL,
+            recorded_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+            value DECIMAL(15, 2) NOT NULL,
+            invested DECIMAL(15, 2) NOT NULL DEFAULT 0,
+            delta_value DECIMAL(15, 2) NOT NULL,
+            delta_invested DECIMAL(15, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (id, recorded_at),
+            KEY idx_events_recorded_at (recorded_at),
+            KEY idx_events_user_time (username, recorded_at)
+        )
+        PARTITION BY RANGE (TO_DAYS(recorded_at)) (
+            {', '.join(partitions)},
+            PARTITION p_future VALUES LESS THAN MAXVALUE
+        )
+    """)
+
+
+def _holding_triggers(table, kind, value, invested):
+    """Insert/update/delete triggers recording ``table`` changes as events"""
+    new_invested = f"COALESCE(NEW.{invested}, 0)" if invested else "0"
+    old_invested = f"COALESCE(OLD.{invested}, 0)" if invested else "0"
+    changed = f"NOT (NEW.{value} <=> OLD.{value})"
+    if invested:
+        changed += f" OR NOT (NEW.{invested} <=> OLD.{invested})"
+    columns = "(username, kind, holding_id, value, invested, delta_value, delta_invested)"
+    return [
+        add_trigger(f"trg_{table}_history_insert", f"""
+            AFTER INSERT ON {table} FOR EACH ROW
+            INSERT INTO holding_events {columns}
+            VALUES (NEW.username, '{kind}', NEW.id, COALESCE(NEW.{value}, 0), {new_invested},
+                    COALESCE(NEW.{value}, 0), {new_invested})
+        """),
+        add_trigger(f"trg_{table}_history_update", f"""
+            AFTER UPDATE ON {table} FOR EACH ROW
+            INSERT INTO holding_events {columns}
+            SELECT NEW.username, '{kind}', NEW.id, COALESCE(NEW.{value}, 0), {new_invested},
+                   COALESCE(NEW.{value}, 0) - COALESCE(OLD.{value}, 0),
+                   {new_invested} - {old_invested}
+            FROM DUAL WHERE {changed}
+        """),
+        add_trigger(f"trg_{table}_history_delete", f"""
+            AFTER DELETE ON {table} FOR EACH ROW
+            INSERT INTO holding_events {columns}
+            VALUES (OLD.username, '{kind}', OLD.id, 0, 0,
+                    -COALESCE(OLD.{value}, 0), -{old_invested})
+        """),
+    ]
+
+
+def _summary_delta(columns, row, sign):
+    names = ', '.join(columns)
+    values = ', '.join(f"{sign}({expr.format(row=row)})" for expr in columns.values())
+    updates = ', '.join(f"{name} = {name} + VALUES({name})" for name in columns)
+    return (f"INSERT INTO user_portfolio_summary (username, {names}) "
+            f"VALUES ({row}.username, {values}) ON DUPLICATE KEY UPDATE {updates};")
+
+
+def _summary_triggers():
+    """Triggers applying every holding table's changes to ``user_portfolio_summary``"""
+    steps = []
+    for table, columns in summary.CONTRIBUTIONS.items():
+        delta = {name: f"({expr.format(row='NEW')}) - ({expr.format(row='OLD')})"
+                 for name, expr in columns.items()}
+        changed = ' OR '.join(f"NOT ({expr.format(row='NEW')} <=> {expr.format(row='OLD')})"
+                              for expr in columns.values())
+        steps += [
+            add_trigger(f"trg_{table}_summary_insert", f"""
+                AFTER INSERT ON {table} FOR EACH ROW
+                BEGIN
+                    IF NEW.username IS NOT NULL THEN {_summary_delta(columns, 'NEW', '+')} END IF;
+                END
+            """),
+            add_trigger(f"trg_{table}_summary_update", f"""
+                AFTER UPDATE ON {table} FOR EACH ROW
+                BEGIN
+                    IF NOT (NEW.username <=> OLD.username) THEN
+                        IF OLD.username IS NOT NULL THEN {_summary_delta(columns, 'OLD', '-')} END IF;
+                        IF NEW.username IS NOT NULL THEN {_summary_delta(columns, 'NEW', '+')} END IF;
+                    ELSEIF NEW.username IS NOT NULL AND ({changed}) THEN
+                        {_summary_delta(delta, 'NEW', '+')}
+                    END IF;
+                END
+            """),
+            add_trigger(f"trg_{table}_summary_delete", f"""
+                AFTER DELETE ON {table} FOR EACH ROW
+                BEGIN
+                    IF OLD.username IS NOT NULL THEN {_summary_delta(columns, 'OLD', '-')} END IF;
+                END
+            """),
+        ]
+    return steps
+
+
+def _version_triggers(table):
+    """Triggers bumping the owner's data version on every change to ``table``"""
+    bump = ("INSERT INTO user_portfolio_summary (username) VALUES ({row}.username) "
+            "ON DUPLICATE KEY UPDATE data_version = data_version + 1")
+    return [
+        add_trigger(f"trg_{table}_version_{event.lower()}",
+                    f"AFTER {event} ON {table} FOR EACH ROW {bump.format(row=row)}")
+        for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD'))
+    ]
+
+
+def record_opening_balances(cursor):
+    """One event per existing holding so history starts from today's values"""
+    cursor.execute("SELECT 1 FROM holding_events LIMIT 1")
+    if cursor.fetchone() is not None:
+        return
+    cursor.execute("""
+        INSERT INTO holding_events
+            (username, kind, holding_id, value, invested, delta_value, delta_invested)
+        SELECT username, 'bank', id, COALESCE(account_balance, 0), 0,
+               COALESCE(account_balance, 0), 0
+        FROM user_banks
+    """)
+    cursor.execute("""
+        INSERT INTO holding_events
+            (username, kind, holding_id, value, invested, delta_value, delta_invested)
+        SELECT username, 'fund', id, COALESCE(current_value, 0), COALESCE(investment_amount, 0),
+               COALESCE(current_value, 0), COALESCE(investment_amount, 0)
+        FROM user_mutual_funds
+    """)
+
+
+def track_rollup_by_event_id(cursor):
+    """Start ``last_event_id`` at the events before the last rolled-up day.
+
+    That day was only partly folded, so its rollup rows are dropped; readers
+    add its events as the tail until the next rollup redoes the day.
+    """
+    cursor.execute("SELECT last_day FROM history_rollup_state WHERE id = 1")
+    row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM holding_events WHERE recorded_at < %s", row)
+    folded = cursor.fetchone()[0]
+    cursor.execute("DELETE FROM holding_daily WHERE day >= %s", row)
+    cursor.execute("DELETE FROM networth_daily WHERE day >= %s", row)
+    cursor.execute("UPDATE history_rollup_state SET last_event_id = %s, seen_event_id = %s "
+                   "WHERE id = 1", (folded, folded))
+
+
+# (version, description, steps); a step is a SQL string or a callable(cursor).
+# Append new migrations at the end and never edit one that has shipped.
+MIGRATIONS = [
+    (1, "Create users, profiles, banks, mutual funds and cards tables", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            username VARCHAR(255) PRIMARY KEY,
+            password VARCHAR(255) NOT NULL,
+            registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_profiles (
+            username VARCHAR(255) PRIMARY KEY,
+            full_name VARCHAR(255),
+            email VARCHAR(255) UNIQUE,
+            gender ENUM('Male', 'Female', 'Other'),
+            date_of_birth DATE,
+            pan_card VARCHAR(10) UNIQUE,
+            aadhar_card VARCHAR(12) UNIQUE,
+            mobile_number VARCHAR(10) UNIQUE,
+            profile_photo_path VARCHAR(255),
+            address TEXT,
+            city VARCHAR(100),
+            state VARCHAR(100),
+            pincode VARCHAR(10),
+            country VARCHAR(100),
+            FOREIGN KEY (username) REFERENCES users(username)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_banks (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(255),
+            bank_name VARCHAR(255) NOT NULL,
+            account_number VARCHAR(20) NOT NULL,
+            ifsc_code VARCHAR(11) NOT NULL,
+            account_balance DECIMAL(15, 2) DEFAULT 0.00,
+            FOREIGN KEY (username) REFERENCES users(username),
+            UNIQUE(username, account_number)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_mutual_funds (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(255),
+            folio_number VARCHAR(50) NOT NULL,
+            fund_name VARCHAR(255) NOT NULL,
+            fund_type ENUM('Equity', 'Debt', 'Hybrid', 'ELSS', 'Other') NOT NULL,
+            investment_amount DECIMAL(15, 2),
+            current_value DECIMAL(15, 2),
+            nominee_name VARCHAR(255),
+            FOREIGN KEY (username) REFERENCES users(username),
+            UNIQUE(username, folio_number)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_cards (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(255),
+            card_number VARCHAR(16) NOT NULL,
+            card_name VARCHAR(255),
+            card_classification ENUM('Debit', 'Credit') NOT NULL,
+            card_type ENUM('Visa', 'Mastercard', 'RuPay', 'Amex', 'Other') NOT NULL,
+            expiry_month VARCHAR(2) NOT NULL,
+            expiry_year VARCHAR(4) NOT NULL,
+            cvv VARCHAR(3) NOT NULL,
+            is_active BOOLEAN DEFAULT TRUE,
+            FOREIGN KEY (username) REFERENCES users(username),
+            UNIQUE(username, card_number)
+        )
+        """,
+    ]),
+    (2, "Add nominee_name to user_banks", [
+        add_column('user_banks', 'nominee_name', 'VARCHAR(255)'),
+    ]),
+    (3, "Add covering indexes for portfolio aggregates", [
+        add_index('user_mutual_funds', 'idx_mf_user_type_amounts',
+                  'username, fund_type, investment_amount, current_value'),
+        add_index('user_banks', 'idx_banks_user_balance', 'username, account_balance'),
+    ]),
+    (4, "Record holding history with monthly partitions and daily rollups", [
+        create_holding_events,
+        """
+        CREATE TABLE IF NOT EXISTS holding_daily (
+            username VARCHAR(255) NOT NULL,
+            kind ENUM('bank', 'fund') NOT NULL,
+            holding_id INT NOT NULL,
+            day DATE NOT NULL,
+            value DECIMAL(15, 2) NOT NULL,
+            invested DECIMAL(15, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (username, kind, holding_id, day),
+            KEY idx_holding_daily_user_day (username, kind, day)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS networth_daily (
+            username VARCHAR(255) NOT NULL,
+            day DATE NOT NULL,
+            bank_balance DECIMAL(17, 2) NOT NULL,
+            fund_value DECIMAL(17, 2) NOT NULL,
+            fund_invested DECIMAL(17, 2) NOT NULL,
+            PRIMARY KEY (username, day)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS history_rollup_state (
+            id TINYINT PRIMARY KEY,
+            last_day DATE
+        )
+        """,
+        *_holding_triggers('user_banks', 'bank', 'account_balance', None),
+        *_holding_triggers('user_mutual_funds', 'fund', 'current_value', 'investment_amount'),
+        record_opening_balances,
+    ]),
+    (5, "Store scheme NAVs and link folios to schemes by units held", [
+        """
+        CREATE TABLE IF NOT EXISTS scheme_navs (
+            scheme_code INT PRIMARY KEY,
+            isin_growth VARCHAR(12),
+            isin_reinvestment VARCHAR(12),
+            scheme_name VARCHAR(255),
+            nav DECIMAL(15, 4) NOT NULL,
+            nav_date DATE NOT NULL
+        )
+        """,
+        add_column('user_mutual_funds', 'scheme_code', 'INT NULL'),
+        add_column('user_mutual_funds', 'units', 'DECIMAL(18, 4) NULL'),
+        add_index('user_mutual_funds', 'idx_mf_scheme_code', 'scheme_code'),
+    ]),
+    (6, "Store per-folio transactions for XIRR", [
+        """
+        CREATE TABLE IF NOT EXISTS fund_transactions (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(255) NOT NULL,
+            fund_id INT NOT NULL,
+            txn_date DATE NOT NULL,
+            kind ENUM('purchase', 'sip', 'redemption', 'dividend', 'switch_in', 'switch_out') NOT NULL,
+            amount DECIMAL(15, 2) NOT NULL,
+            units DECIMAL(18, 4) NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (fund_id) REFERENCES user_mutual_funds(id) ON DELETE CASCADE,
+            KEY idx_txn_user_fund (username, fund_id, txn_date)
+        )
+        """,
+    ]),
+    (7, "Maintain per-user portfolio totals in a summary table", [
+        """
+        CREATE TABLE IF NOT EXISTS user_portfolio_summary (
+            username VARCHAR(255) PRIMARY KEY,
+            bank_count INT NOT NULL DEFAULT 0,
+            total_balance DECIMAL(17, 2) NOT NULL DEFAULT 0,
+            fund_count INT NOT NULL DEFAULT 0,
+            total_invested DECIMAL(17, 2) NOT NULL DEFAULT 0,
+            fund_value DECIMAL(17, 2) NOT NULL DEFAULT 0,
+            card_count INT NOT NULL DEFAULT 0,
+            active_cards INT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """,
+        *_summary_triggers(),
+        summary.populate,
+    ]),
+    (8, "Add API sessions and version each user's data for conditional requests", [
+        """
+        CREATE TABLE IF NOT EXISTS api_sessions (
+            token_hash CHAR(64) PRIMARY KEY,
+            username VARCHAR(255) NOT NULL,
+            expires_at DATETIME NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_api_sessions_user (username, expires_at),
+            FOREIGN KEY (username) REFERENCES users(username)
+        )
+        """,
+        add_column('user_portfolio_summary', 'data_version', 'BIGINT NOT NULL DEFAULT 1'),
+        # Every change to a summary row, from any holding trigger, is a new version
+        add_trigger('trg_user_portfolio_summary_version', """
+            BEFORE UPDATE ON user_portfolio_summary FOR EACH ROW
+            SET NEW.data_version = IF(NEW.data_version = OLD.data_version,
+                                      OLD.data_version + 1, NEW.data_version)
+        """),
+        *_version_triggers('user_profiles'),
+    ]),
+    (9, "Add row versions for optimistic concurrency", [
+        step
+        for table in ('user_banks', 'user_mutual_funds', 'user_cards', 'user_profiles')
+        for step in (
+            add_column(table, 'row_version', 'INT NOT NULL DEFAULT 1'),
+            # Bumped on every UPDATE, whichever code path (importer, NAV job, forms) ran it
+            add_trigger(f'trg_{table}_row_version', f"""
+                BEFORE UPDATE ON {table} FOR EACH ROW
+                SET NEW.row_version = OLD.row_version + 1
+            """),
+        )
+    ]),
+    (10, "Add per-user listing indexes matched to the hot queries", [
+        # Keyset pages filter on username and walk id in order
+        add_index('user_banks', 'idx_banks_user_id', 'username, id'),
+        add_index('user_mutual_funds', 'idx_mf_user_id', 'username, id'),
+        # The card list's ORDER BY, so it is read in index order without a filesort
+        add_index('user_cards', 'idx_cards_user_listing',
+                  'username, is_active DESC, card_classification'),
+    ]),
+    (11, "Bump the data version on every holding change, not only on totals", [
+        # Renames and other non-monetary edits leave the summary totals alone
+        step for table in ('user_banks', 'user_mutual_funds', 'user_cards')
+        for step in _version_triggers(table)
+    ]),
+    (12, "Track history rollups by event id and index each user's unfolded events", [
+        add_column('history_rollup_state', 'last_event_id', 'BIGINT NOT NULL DEFAULT 0'),
+        add_column('history_rollup_state', 'seen_event_id', 'BIGINT NOT NULL DEFAULT 0'),
+        # Readers add a user's events past last_event_id to the rollups
+        add_index('holding_events', 'idx_events_user_id', 'username, id'),
+        track_rollup_by_event_id,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+_schema_lock = threading.Lock()
+
+
+def _server_connection(config=None):
+    """Connect to the MySQL server without selecting the application database"""
+    config = {k: v for k, v in (config or database.DB_CONFIG).items() if k != 'database'}
+    started = time.perf_counter()
+    connection = mysql.connector.connect(**config)
+    return instrument(connection, time.perf_counter() - started)
+
+
+def current_version(cursor):
+    """Highest applied migration version, or 0 for a fresh database"""
+    cursor.execute("""
+        SELECT 1 FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'schema_version'
+    """)
+    if cursor.fetchone() is None:
+        return 0
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+
+def pending_migrations(version):
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def migrate(verbose=True, config=None):
+    """Create the database if needed and apply every pending migration.
+
+    A MySQL named lock serialises concurrent migrators, so several app
+    processes starting together apply each migration exactly once.
+    ``config`` picks another database (a shard); it defaults to ``DB_CONFIG``.
+    Returns the list of versions applied.
+    """
+    config = config or database.DB_CONFIG
+    db_name = config['database']
+    applied = []
+    connection = _server_connection(config)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{db_name}`")
+        cursor.execute(f"USE `{db_name}`")
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK, MIGRATION_LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            raise Error(msg="Timed out waiting for the schema migration lock")
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INT PRIMARY KEY,
+                    description VARCHAR(255) NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            # Re-read under the lock in case another process just migrated
+            for version, description, steps in pending_migrations(current_version(cursor)):
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                    (version, description))
+                connection.commit()
+                applied.append(version)
+                if verbose:
+                    print(f"Applied migration {version}: {description}")
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+            cursor.fetchone()
+            cursor.close()
+    finally:
+        connection.close()
+    return applied
+
+
+def schema_is_current(backend=None):
+    """Cheap check over a pooled connection; False if the database is missing"""
+    try:
+        with (backend or database.get_backend()).connection() as conn:
+            if conn is None:
+                return False
+            with conn.cursor() as cursor:
+                return current_version(cursor) >= LATEST_VERSION
+    except Error:
+        return False
+
+
+def ensure_mysql_schema(backend):
+    """Migrate one MySQL backend (the app database or a shard) once per process"""
+    if backend.schema_ready:
+        return True
+    with _schema_lock:
+        if backend.schema_ready:
+            return True
+        try:
+            if not schema_is_current(backend):
+                migrate(config=backend.config)
+            backend.schema_ready = True
+        except Error as e:
+            print(f"Error migrating database schema: {e}")
+    return backend.schema_ready
+
+
+def ensure_schema():
+    """Bring the schema up to date once per process, on every shard.
+
+    Later calls return immediately, so this is safe at the top of every
+    Streamlit rerun. Returns True when the schema is known to be current.
+    Other storage backends create their own schema.
+    """
+    return all([backend.ensure_schema() for backend in sharding.backends().values()])
+
+
+def _print_status(config):
+    connection = _server_connection(config)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT 1 FROM information_schema.SCHEMATA WHERE SCHEMA_NAME = %s",
+            (config['database'],))
+        version = 0
+        if cursor.fetchone() is not None:
+            cursor.execute(f"USE `{config['database']}`")
+            version = current_version(cursor)
+        cursor.close()
+    finally:
+        connection.close()
+    print(f"Schema version: {version} (latest {LATEST_VERSION})")
+    for pending, description, _ in pending_migrations(version):
+        print(f"  pending {pending}: {description}")
+
+
+def main(argv):
+    for shard, backend in sharding.backends().items():
+        if sharding.get_router() is not None:
+            print(f"Shard {shard}:")
+        if backend.name != 'mysql':
+            print("Schema is up to date" if backend.ensure_schema() else "Schema creation failed")
+            continue
+        if '--status' in argv:
+            _print_status(backend.config)
+            continue
+        applied = migrate(config=backend.config)
+        if not applied:
+            print(f"Schema is up to date (version {LATEST_VERSION})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,8 +1,14 @@
 import streamlit as st
 import pandas as pd
-from database import get_db_connection
+from database import get_db_connection, get_read_connection
 from mysql.connector import Error
+from datetime import date
+from aggregates import weighted_roi
+from cache import invalidate
+import statements
+from returns import get_fund_returns
 from database import delete_mutual_fund
+from writes import form_idempotency_key, insert_row, reset_form_key, show_write_result, update_row
 
 def mutual_fund_details_form(username, edit_data=None):
     st.subheader("Edit Mutual Fund" if edit_data else "Add Mutual Fund")
@@ -26,113 +32,88 @@ def mutual_fund_details_form(username, edit_data=None):
                 st.error("Please fill all required fields (*)")
                 return
             
-            conn = get_db_connection()
-            if conn is not None:
-                cursor = conn.cursor()
-                try:
-                    if edit_data:
-                        cursor.execute("""
-                            UPDATE user_mutual_funds SET
-                                folio_number = %s,
-                                fund_name = %s,
-                                fund_type = %s,
-                                investment_amount = %s,
-                                current_value = %s,
-                                nominee_name = %s
-                            WHERE id = %s
-                        """, (
-                            folio_number, fund_name, fund_type,
-                            investment_amount, current_value, nominee_name,
-                            edit_data['id']
-                        ))
-                    else:
-                        cursor.execute("""
-                            INSERT INTO user_mutual_funds (
-                                username, folio_number, fund_name,
-                                fund_type, investment_amount,
-                                current_value, nominee_name
-                            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        """, (
-                            username, folio_number, fund_name,
-                            fund_type, investment_amount,
-                            current_value, nominee_name
-                        ))
-                    conn.commit()
-                    st.success("Mutual fund details saved successfully!")
-                    return True
-                except Error as e:
-                    st.error(f"Error saving mutual fund details: {e}")
-                finally:
-                    cursor.close()
-                    conn.close()
+            values = {
+                'folio_number': folio_number, 'fund_name': fund_name, 'fund_type': fund_type,
+                'investment_amount': investment_amount, 'current_value': current_value,
+                'nominee_name': nominee_name,
+            }
+            if edit_data:
+                result = update_row('user_mutual_funds', edit_data['id'], username,
+                                    edit_data['row_version'], values)
+            else:
+                values['username'] = username
+                result = insert_row('user_mutual_funds', values,
+                                    form_idempotency_key('mutual_fund_form', username, values))
+            if show_write_result(result, "mutual fund", "Mutual fund details saved successfully!"):
+                reset_form_key('mutual_fund_form')
+                return True
     return False
 
-def delete_mutual_fund(fund_id):
-    conn = get_db_connection()
-    if conn is not None:
-        cursor = conn.cursor()
-        try:
-            cursor.execute("DELETE FROM user_mutual_funds WHERE id = %s", (fund_id,))
-            conn.commit()
-            st.success("Mutual fund deleted successfully!")
-            return True
-        except Error as e:
-            st.error(f"Error deleting mutual fund: {e}")
-        finally:
-            cursor.close()
-            conn.close()
+def delete_mutual_fund(fund_id, username):
+    try:
+        with get_db_connection(username) as conn:
+            if conn is None:
+                st.error("Failed to connect to database")
+                return False
+
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM user_mutual_funds WHERE id = %s AND username = %s",
+                               (fund_id, username))
+                conn.commit()
+                invalidate(username, 'funds')
+                st.success("Mutual fund deleted successfully!")
+                return True
+    except Error as e:
+        st.error(f"Error deleting mutual fund: {e}")
     return False
 
 def view_mutual_funds(username):
-    conn = get_db_connection()
-    if conn is not None:
-        cursor = conn.cursor(dictionary=True)
-        try:
-            cursor.execute("""
-                SELECT id, folio_number, fund_name, fund_type,
-                       investment_amount, current_value, nominee_name
-                FROM user_mutual_funds 
-                WHERE username = %s
-            """, (username,))
-            
-            funds = cursor.fetchall()
+    try:
+        with get_read_connection(username) as conn:
+            if conn is None:
+                st.error("Failed to connect to database")
+                return
+
+            funds = statements.fetchall(conn, 'funds.list', (username,), dictionary=True)
+    except Error as e:
+        st.error(f"Error fetching mutual funds: {e}")
+        return
+
+    if funds:
+        st.subheader("Your Mutual Funds")
+        returns = get_fund_returns(username, date.today()) or {}
+        
+        for fund in funds:
+            roi = weighted_roi(fund['investment_amount'] or 0, fund['current_value'] or 0)
+            fund_return = returns.get(fund['id'])
             
-            if funds:
-                st.subheader("Your Mutual Funds")
-                
-                for fund in funds:
-                    roi = ((fund['current_value'] - fund['investment_amount']) / fund['investment_amount']) * 100
-                    
-                    with st.expander(f"{fund['fund_name']} ({fund['fund_type']})"):
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            st.write(f"**Folio Number:** {fund['folio_number']}")
-                            st.write(f"**Investment:** ₹{fund['investment_amount']:,.2f}")
-                            st.write(f"**Current Value:** ₹{fund['current_value']:,.2f}")
-                        with col2:
-                            st.write(f"**ROI:** {roi:.2f}%")
-                            if fund['nominee_name']:
-                                st.write(f"**Nominee:** {fund['nominee_name']}")
-                        
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            if st.button(f"Edit {fund['fund_name']}", key=f"edit_{fund['id']}"):
-                                st.session_state['editing_fund'] = fund
-                        with col2:
-                            if st.button(f"Delete {fund['fund_name']}", key=f"delete_{fund['id']}"):
-                                if st.warning("Are you sure you want to delete this fund?"):
-                                    if delete_mutual_fund(fund['id']):
-                                        st.experimental_rerun()
-                
-                if 'editing_fund' in st.session_state:
-                    if mutual_fund_details_form(username, st.session_state['editing_fund']):
-                        del st.session_state['editing_fund']
-                        st.experimental_rerun()
+            with st.expander(f"{fund['fund_name']} ({fund['fund_type']})"):
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.write(f"**Folio Number:** {fund['folio_number']}")
+                    st.write(f"**Investment:** ₹{fund['investment_amount']:,.2f}")
+                    st.write(f"**Current Value:** ₹{fund['current_value']:,.2f}")
+                with col2:
+                    st.write(f"**ROI:** {roi:.2f}%")
+                    if fund_return and fund_return.xirr is not None:
+                        st.write(f"**XIRR:** {fund_return.xirr:.2f}%")
+                    if fund['nominee_name']:
+                        st.write(f"**Nominee:** {fund['nominee_name']}")
                 
-            else:
-                st.info("No mutual funds added yet")
-        except Error as e:
-            st.error(f"Error fetching mutual funds: {e}")
-        finally:
-            cursor.close()
-            conn.close()
\ No newline at end of file
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.button(f"Edit {fund['fund_name']}", key=f"edit_{fund['id']}"):
+                        st.session_state['editing_fund'] = fund
+                with col2:
+                    if st.button(f"Delete {fund['fund_name']}", key=f"delete_{fund['id']}"):
+                        if st.warning("Are you sure you want to delete this fund?"):
+                            if delete_mutual_fund(fund['id'], username):
+                                st.experimental_rerun()
+        
+        if 'editing_fund' in st.session_state:
+            if mutual_fund_details_form(username, st.session_state['editing_fund']):
+                del st.session_state['editing_fund']
+                st.experimental_rerun()
+        
+    else:
+        st.info("No mutual funds added yet")
\ No newline at end of file
@@ -0,0 +1,187 @@
+# nav.py
+"""Daily NAV ingestion and revaluation of every folio.
+
+Reads a scheme NAV file in the AMFI ``NAVAll.txt`` layout::
+
+    Scheme Code;ISIN Div Payout/ ISIN Growth;ISIN Div Reinvestment;Scheme Name;Net Asset Value;Date
+    <blank line and fund-house / category heading lines>
+    119551;INF209KA12Z1;INF209KA13Z9;Aditya Birla Sun Life ...;103.4521;17-Oct-2026
+
+The file is parsed in chunks with pandas, and malformed rows are skipped.
+NAVs are upserted into every shard's ``scheme_navs`` keyed by scheme code.
+Folios are then revalued on the server as ``units * nav``, with
+``UPDATE ... JOIN`` over primary-key ranges, so no folio rows are brought
+into Python.
+
+Each revalued folio bumps its owner's ``data_version`` through the version
+triggers (migration 11), so the API serves the new values at once. This job
+runs in its own process and cannot reach a running app's in-process cache,
+so the dashboard keeps showing cached values for up to ``FOLIO_CACHE_TTL``.
+
+    python nav.py NAVAll.txt            # ingest and revalue
+    python nav.py NAVAll.txt --no-revalue
+"""
+import argparse
+import sys
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+from mysql.connector import Error
+
+from database import get_features
+from sharding import scatter
+
+CHUNK_ROWS = 50000
+UPSERT_BATCH = 5000
+REVALUE_BATCH = 50000  # folio ids per UPDATE, keeps each transaction short
+
+COLUMNS = ['scheme_code', 'isin_growth', 'isin_reinvestment', 'scheme_name', 'nav', 'nav_date']
+
+NAV_UPSERT = """
+    INSERT INTO scheme_navs (scheme_code, isin_growth, isin_reinvestment, scheme_name, nav, nav_date)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        isin_growth = VALUES(isin_growth),
+        isin_reinvestment = VALUES(isin_reinvestment),
+        scheme_name = VALUES(scheme_name),
+        nav = IF(VALUES(nav_date) >= nav_date, VALUES(nav), nav),
+        nav_date = GREATEST(nav_date, VALUES(nav_date))
+"""
+
+# Only rows whose value actually changes are written (and reach the history triggers)
+REVALUE_RANGE = """
+    UPDATE user_mutual_funds f
+    JOIN scheme_navs n ON n.scheme_code = f.scheme_code
+    SET f.current_value = ROUND(f.units * n.nav, 2)
+    WHERE f.id >= %s AND f.id < %s
+      AND f.units IS NOT NULL
+      AND NOT (f.current_value <=> ROUND(f.units * n.nav, 2))
+"""
+
+
+@dataclass
+class NavReport:
+    parsed: int = 0
+    skipped: int = 0
+    stored: int = 0
+    folios_revalued: int = 0
+    parse_seconds: float = 0.0
+    revalue_seconds: float = 0.0
+
+    @property
+    def navs_per_second(self):
+        return self.parsed / self.parse_seconds if self.parse_seconds else 0.0
+
+    @property
+    def folios_per_second(self):
+        return self.folios_revalued / self.revalue_seconds if self.revalue_seconds else 0.0
+
+
+def iter_nav_chunks(path, chunk_rows=CHUNK_ROWS):
+    """Yield ``(valid_rows, skipped_count)`` for each chunk of the file.
+
+    Heading lines have no ``;`` and parse with an empty scheme code. Those
+    lines, "N.A." NAVs and unparseable dates are counted as skipped.
+    """
+    reader = pd.read_csv(
+        path, sep=';', names=COLUMNS, header=None, dtype=str, chunksize=chunk_rows,
+        skip_blank_lines=True, on_bad_lines='skip', encoding='utf-8', encoding_errors='replace',
+    )
+    for chunk in reader:
+        chunk['scheme_code'] = pd.to_numeric(chunk['scheme_code'], errors='coerce')
+        chunk['nav'] = pd.to_numeric(chunk['nav'], errors='coerce')
+        chunk['nav_date'] = pd.to_datetime(chunk['nav_date'], format='%d-%b-%Y', errors='coerce')
+        valid = chunk['scheme_code'].notna() & (chunk['nav'] > 0) & chunk['nav_date'].notna()
+        rows = chunk[valid]
+        for column in ('isin_growth', 'isin_reinvestment', 'scheme_name'):
+            cleaned = rows[column].str.strip()
+            keep = cleaned.notna() & ~cleaned.isin(['', '-'])
+            rows = rows.assign(**{column: cleaned.astype(object).where(keep, None)})
+        yield rows, int((~valid).sum())
+
+
+def _params(rows):
+    # Python scalars only: the connector cannot bind NumPy types
+    return list(zip(
+        rows['scheme_code'].astype(int).tolist(),
+        rows['isin_growth'].tolist(),
+        rows['isin_reinvestment'].tolist(),
+        rows['scheme_name'].str.slice(0, 255).tolist(),
+        rows['nav'].round(4).tolist(),
+        rows['nav_date'].dt.date.tolist(),
+    ))
+
+
+def _upsert_navs(conn, params):
+    with conn.cursor() as cursor:
+        for start in range(0, len(params), UPSERT_BATCH):
+            cursor.executemany(NAV_UPSERT, params[start:start + UPSERT_BATCH])
+    conn.commit()
+
+
+def ingest_navs(path, report):
+    """Stream the file into every shard's ``scheme_navs``, committing once per chunk"""
+    started = time.perf_counter()
+    for rows, skipped in iter_nav_chunks(path):
+        report.skipped += skipped
+        report.parsed += len(rows)
+        params = _params(rows)
+        # Reference data: each shard keeps a full copy
+        scatter(lambda conn, shard: _upsert_navs(conn, params))
+        report.stored += len(params)
+    report.parse_seconds = time.perf_counter() - started
+
+
+def revalue_folios(conn, batch=REVALUE_BATCH):
+    """Set ``current_value = units * nav`` for every linked folio, by id range.
+
+    Returns the number of folios whose value changed.
+    """
+    revalued = 0
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM user_mutual_funds")
+        low, high = cursor.fetchone()
+        for start in range(low, high + 1, batch):
+            cursor.execute(REVALUE_RANGE, (start, start + batch))
+            revalued += max(cursor.rowcount, 0)
+            conn.commit()
+    return revalued
+
+
+def run(path, revalue=True):
+    """Ingest a NAV file and (optionally) revalue all folios; returns a NavReport"""
+    report = NavReport()
+    ingest_navs(path, report)
+    if revalue:
+        started = time.perf_counter()
+        revalued = scatter(lambda conn, shard: revalue_folios(conn))
+        report.folios_revalued = sum(revalued.values())
+        report.revalue_seconds = time.perf_counter() - started
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load a scheme NAV file and revalue folios")
+    parser.add_argument('path', help="NAV file in AMFI NAVAll.txt format")
+    parser.add_argument('--no-revalue', action='store_true', help="only store the NAVs")
+    args = parser.parse_args(argv)
+
+    if 'nav_revaluation' not in get_features():
+        print("NAV import needs the MySQL storage backend on every shard")
+        return 1
+    try:
+        report = run(args.path, revalue=not args.no_revalue)
+    except (Error, OSError) as e:
+        print(f"NAV import failed: {e}")
+        return 1
+    print(f"Parsed {report.parsed:,} NAVs ({report.skipped:,} lines skipped) "
+          f"in {report.parse_seconds:.1f}s · {report.navs_per_second:,.0f} NAVs/s")
+    if not args.no_revalue:
+        print(f"Revalued {report.folios_revalued:,} folios in {report.revalue_seconds:.1f}s "
+              f"· {report.folios_per_second:,.0f} folios/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+# profiler.py
+"""Per-rerun render profiler.
+
+Turn it on for every session with ``FOLIO_PROFILE=1``, or for one browser tab
+by adding ``?profile=1`` to the URL. While it is on, every ``stage(name)``
+block in a rerun is timed. Each rerun's stages are kept as a trace, and the
+timings of each stage name are added to histograms shared by all sessions.
+A panel at the bottom of the page shows the current rerun and the
+aggregates. The recent traces can be downloaded in Chrome trace format
+(chrome://tracing, Perfetto) or speedscope format.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from itertools import count
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from querylog import Histogram
+
+ALWAYS_ON = os.environ.get('FOLIO_PROFILE', '0') == '1'
+KEEP_TRACES = int(os.environ.get('FOLIO_PROFILE_KEEP', 200))
+
+
+class Trace:
+    """Spans recorded during one rerun of one session"""
+
+    def __init__(self, rerun, session):
+        self.rerun = rerun
+        self.session = session
+        self.started = time.perf_counter_ns()
+        self.spans = []  # (name, start_ns, end_ns, depth, thread)
+        self._depth = threading.local()
+
+    def span(self, name):
+        depth = getattr(self._depth, 'value', 0)
+        self._depth.value = depth + 1
+        start = time.perf_counter_ns()
+        return name, start, depth
+
+    def close(self, name, start, depth):
+        self._depth.value = depth
+        # list.append is atomic, so worker threads can add spans too
+        self.spans.append((name, start, time.perf_counter_ns(), depth, threading.current_thread().name))
+
+    @property
+    def duration_ms(self):
+        finished = max((end for _, _, end, _, _ in self.spans), default=self.started)
+        return (finished - self.started) / 1e6
+
+
+_local = threading.local()
+_lock = threading.Lock()
+_traces = deque(maxlen=KEEP_TRACES)
+_stages = {}
+_reruns = count(1)
+_sessions = {}
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+def is_enabled():
+    if ALWAYS_ON:
+        return True
+    try:
+        return st.query_params.get('profile') == '1'
+    except Exception:  # outside a Streamlit script run
+        return False
+
+
+@contextmanager
+def stage(name, trace=None):
+    """Time a named block of the current rerun; free when profiling is off"""
+    trace = trace or current_trace()
+    if trace is None:
+        yield
+        return
+    span = trace.span(name)
+    try:
+        yield
+    finally:
+        trace.close(*span)
+
+
+def _session_label():
+    ctx = get_script_run_ctx()
+    session_id = ctx.session_id if ctx else 'script'
+    with _lock:
+        return _sessions.setdefault(session_id, f"session {len(_sessions) + 1}")
+
+
+def _finish(trace):
+    with _lock:
+        _traces.append(trace)
+        for name, start, end, _, _ in trace.spans:
+            _stages.setdefault(name, Histogram()).add((end - start) / 1e6)
+
+
+@contextmanager
+def profile_rerun(name="rerun"):
+    """Wrap a whole script run; shows the profile panel if it finishes normally"""
+    if not is_enabled():
+        yield
+        return
+    trace = Trace(next(_reruns), _session_label())
+    _local.trace = trace
+    completed = False
+    try:
+        with stage(name, trace):
+            yield
+        completed = True
+    finally:
+        _local.trace = None
+        _finish(trace)
+    if completed:
+        display_profile(trace)
+
+
+def stage_summary():
+    """Aggregated timings per stage name across every profiled rerun"""
+    with _lock:
+        rows = [{'stage': name, **hist.summary()} for name, hist in _stages.items()]
+    return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+
+def reset():
+    with _lock:
+        _traces.clear()
+        _stages.clear()
+
+
+def _recent():
+    with _lock:
+        return list(_traces)
+
+
+def chrome_trace(traces=None):
+    """Trace Event Format: one complete ('X') event per span, one row per session"""
+    traces = _recent() if traces is None else traces
+    pid = os.getpid()
+    tids = {}
+    events = []
+    for trace in traces:
+        for name, start, end, depth, thread in trace.spans:
+            key = (trace.session, thread)
+            if key not in tids:
+                tids[key] = len(tids) + 1
+                events.append({'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tids[key],
+                               'args': {'name': f"{trace.session} · {thread}"}})
+            events.append({
+                'ph': 'X', 'name': name, 'cat': 'stage', 'pid': pid, 'tid': tids[key],
+                'ts': start / 1000, 'dur': (end - start) / 1000,
+                'args': {'rerun': trace.rerun, 'depth': depth},
+            })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def speedscope(traces=None):
+    """speedscope file format: one evented profile per rerun and thread"""
+    traces = _recent() if traces is None else traces
+    frames = {}
+    profiles = []
+    for trace in traces:
+        by_thread = {}
+        for span in trace.spans:
+            by_thread.setdefault(span[4], []).append(span)
+        for thread, spans in by_thread.items():
+            marks = []
+            for name, start, end, depth, _ in spans:
+                frame = frames.setdefault(name, len(frames))
+                # At equal times, close inner spans before opening outer ones
+                marks.append((start, 1, depth, 'O', frame))
+                marks.append((end, 0, -depth, 'C', frame))
+            marks.sort()
+            origin = trace.started
+            events = [{'type': kind, 'frame': frame, 'at': (at - origin) / 1e6}
+                      for at, _, _, kind, frame in marks]
+            profiles.append({
+                'type': 'evented',
+                'name': f"rerun {trace.rerun} ({trace.session}, {thread})",
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': events[-1]['at'] if events else 0,
+                'events': events,
+            })
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': [{'name': name} for name in frames]},
+        'profiles': profiles,
+        'name': 'folio_fetch reruns',
+        'exporter': 'folio_fetch profiler',
+    }
+
+
+def display_profile(trace):
+    """Render-profile panel for the rerun that just finished"""
+    with st.expander(f"⏱️ Render profile · rerun {trace.rerun} · {trace.duration_ms:.1f} ms"):
+        spans = sorted(trace.spans, key=lambda span: span[1])
+        st.dataframe(pd.DataFrame({
+            'stage': [" " * depth + name for name, _, _, depth, _ in spans],
+            'ms': [round((end - start) / 1e6, 2) for _, start, end, _, _ in spans],
+            'thread': [thread for *_, thread in spans],
+        }), hide_index=True, use_container_width=True)
+
+        st.subheader("All sessions")
+        st.dataframe(pd.DataFrame(stage_summary()), hide_index=True, use_container_width=True)
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.download_button("Chrome trace", json.dumps(chrome_trace()),
+                               file_name="folio_fetch.trace.json", mime="application/json",
+                               key="profile_chrome_trace")
+        with col2:
+            st.download_button("speedscope", json.dumps(speedscope()),
+                               file_name="folio_fetch.speedscope.json", mime="application/json",
+                               key="profile_speedscope")
+        with col3:
+            if st.button("Reset profile", key="profile_reset"):
+                reset()
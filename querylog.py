@@ -0,0 +1,368 @@
+# querylog.py
+"""Instrumented execution layer for every database query.
+
+``get_db_connection`` wraps each pooled connection in an
+``InstrumentedConnection``, whose cursors time every ``execute`` and
+``executemany`` (including the time spent fetching rows), count the rows
+returned and note the function that issued the query. Queries are grouped
+by fingerprint, the statement with literals and placeholders replaced by
+``?``, into in-process latency histograms. Queries slower than
+``FOLIO_SLOW_QUERY_MS`` are written to the slow-query log. Only
+fingerprints are logged, never parameter values.
+"""
+import bisect
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import pandas as pd
+import streamlit as st
+
+from cache import get_cache_stats
+
+ENABLED = os.environ.get('FOLIO_QUERY_STATS', '1') != '0'
+SLOW_QUERY_MS = float(os.environ.get('FOLIO_SLOW_QUERY_MS', 200))
+# Empty string logs to stderr instead of a file
+SLOW_QUERY_LOG = os.environ.get('FOLIO_SLOW_QUERY_LOG', 'slow_queries.log')
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """Statement shape with literals, placeholders and value lists collapsed"""
+    if isinstance(sql, (bytes, bytearray)):
+        sql = sql.decode('utf-8', errors='replace')
+    sql = _STRING.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _VALUE_LIST.sub('(?+)', sql)
+    return _WHITESPACE.sub(' ', sql).strip().rstrip(';')
+
+
+def caller_name(skip=2):
+    """``module.function`` of the nearest frame outside this module"""
+    frame = sys._getframe(skip)
+    while frame is not None and frame.f_globals.get('__name__') == __name__:
+        frame = frame.f_back
+    if frame is None:
+        return '?'
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f"{frame.f_globals.get('__name__', '?')}.{name}"
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (not thread-safe; QueryStats locks it)"""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile, capped at max"""
+        if not self.count:
+            return 0.0
+        target = q / 100 * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS_MS, self.counts):
+            seen += n
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total_ms': round(self.total, 3),
+            'mean_ms': round(self.total / self.count, 3) if self.count else 0.0,
+            'p50_ms': round(self.percentile(50), 3),
+            'p95_ms': round(self.percentile(95), 3),
+            'p99_ms': round(self.percentile(99), 3),
+            'max_ms': round(self.max, 3),
+        }
+
+
+class QueryStats:
+    """Per-fingerprint latency, row and caller counters for this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._queries = {}
+            self._conn_wait = Histogram()
+            self._started = time.time()
+
+    def record(self, fingerprint, caller, ms, rows, failed=False):
+        with self._lock:
+            entry = self._queries.get(fingerprint)
+            if entry is None:
+                entry = self._queries[fingerprint] = {
+                    'histogram': Histogram(), 'rows': 0, 'errors': 0, 'callers': Counter(),
+                }
+            entry['histogram'].add(ms)
+            entry['rows'] += rows
+            entry['errors'] += failed
+            entry['callers'][caller] += 1
+
+    def record_wait(self, ms):
+        with self._lock:
+            self._conn_wait.add(ms)
+
+    def top(self, n=10, order_by='total_ms'):
+        """The ``n`` fingerprints with the highest ``order_by`` summary value"""
+        with self._lock:
+            rows = [
+                {
+                    'fingerprint': fp,
+                    **entry['histogram'].summary(),
+                    'rows': entry['rows'],
+                    'rows_per_call': round(entry['rows'] / entry['histogram'].count, 1),
+                    'errors': entry['errors'],
+                    'callers': ", ".join(name for name, _ in entry['callers'].most_common(3)),
+                }
+                for fp, entry in self._queries.items()
+            ]
+        rows.sort(key=lambda row: row[order_by], reverse=True)
+        return rows[:n]
+
+    def connection_wait(self):
+        with self._lock:
+            return self._conn_wait.summary()
+
+    def since(self):
+        return self._started
+
+
+_stats = QueryStats()
+_slow_log = logging.getLogger('folio_fetch.slow_queries')
+
+
+def get_query_stats():
+    return _stats
+
+
+def _slow_logger():
+    if not _slow_log.handlers:
+        handler = logging.FileHandler(SLOW_QUERY_LOG) if SLOW_QUERY_LOG else logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _slow_log.addHandler(handler)
+        _slow_log.setLevel(logging.INFO)
+        _slow_log.propagate = False
+    return _slow_log
+
+
+def record(sql, caller, seconds, rows, conn_wait=0.0, failed=False):
+    """Add one finished query to the histograms and the slow log"""
+    ms = seconds * 1000
+    fp = fingerprint(sql)
+    _stats.record(fp, caller, ms, rows, failed)
+    if ms >= SLOW_QUERY_MS:
+        _slow_logger().info(json.dumps({
+            'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'duration_ms': round(ms, 3),
+            'conn_wait_ms': round(conn_wait * 1000, 3),
+            'rows': rows,
+            'caller': caller,
+            'failed': failed,
+            'fingerprint': fp,
+        }))
+
+
+class InstrumentedCursor:
+    """Cursor proxy that times each statement from execute to last fetch"""
+
+    def __init__(self, cursor, conn_wait=0.0):
+        self._cursor = cursor
+        self._conn_wait = conn_wait
+        self._current = None  # [sql, caller, seconds, rows]
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def _begin(self, sql, caller, seconds):
+        self._current = [sql, caller, seconds, 0]
+
+    def _finish(self, failed=False):
+        current, self._current = self._current, None
+        if current is not None:
+            sql, caller, seconds, rows = current
+            rowcount = getattr(self._cursor, 'rowcount', -1)
+            record(sql, caller, seconds, max(rows, rowcount or 0), self._conn_wait, failed)
+
+    def _timed(self, call, *args):
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            if self._current is not None:
+                self._current[2] += time.perf_counter() - started
+
+    def execute(self, operation, params=(), multi=False):
+        self._finish()
+        caller = caller_name()
+        started = time.perf_counter()
+        try:
+            result = self._cursor.execute(operation, params, multi=multi)
+        except Exception:
+            self._begin(operation, caller, time.perf_counter() - started)
+            self._finish(failed=True)
+            raise
+        if multi:
+            return self._iter_results(result, caller, time.perf_counter() - started)
+        self._begin(operation, caller, time.perf_counter() - started)
+        return result
+
+    def _iter_results(self, results, caller, sent):
+        """Record each statement of a multi-statement execute separately"""
+        elapsed = sent
+        while True:
+            started = time.perf_counter()
+            try:
+                next(results)
+            except StopIteration:
+                break
+            except Exception:
+                self._begin(self._cursor.statement, caller, elapsed + time.perf_counter() - started)
+                self._finish(failed=True)
+                raise
+            self._begin(self._cursor.statement, caller, elapsed + time.perf_counter() - started)
+            elapsed = 0.0
+            yield self
+            self._finish()
+
+    def executemany(self, operation, seq_params):
+        self._finish()
+        caller = caller_name()
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = self._cursor.executemany(operation, seq_params)
+            failed = False
+            return result
+        finally:
+            self._begin(operation, caller, time.perf_counter() - started)
+            self._finish(failed=failed)
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is not None and self._current is not None:
+            self._current[3] += 1
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._timed(self._cursor.fetchmany, size)
+        if self._current is not None:
+            self._current[3] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        if self._current is not None:
+            self._current[3] += len(rows)
+        return rows
+
+    def close(self):
+        self._finish()
+        return self._cursor.close()
+
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors report to the query stats"""
+
+    def __init__(self, conn, conn_wait=0.0):
+        self._conn = conn
+        self.conn_wait = conn_wait
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self.conn_wait)
+
+
+def unwrap(conn):
+    """The raw connection under an instrumented one"""
+    return conn._conn if isinstance(conn, InstrumentedConnection) else conn
+
+
+def instrument(conn, conn_wait=0.0):
+    """Wrap a raw connection, recording how long it took to obtain"""
+    if not ENABLED or conn is None:
+        return conn
+    _stats.record_wait(conn_wait * 1000)
+    return InstrumentedConnection(conn, conn_wait)
+
+
+def display_query_stats(limit=20):
+    """Admin view of the slowest query fingerprints by total time"""
+    from sharding import backends  # database imports this module
+    from statements import get_statement_stats
+
+    st.header("🛠️ Query statistics")
+    started = datetime.fromtimestamp(_stats.since()).strftime('%Y-%m-%d %H:%M:%S')
+    st.caption(f"Since {started} · slow-query threshold {SLOW_QUERY_MS:.0f} ms")
+
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        order_by = st.selectbox("Order by", ['total_ms', 'p95_ms', 'max_ms', 'count', 'rows'],
+                                key="query_stats_order")
+    with col2:
+        limit = st.number_input("Top", min_value=5, max_value=200, value=limit, step=5,
+                                key="query_stats_limit")
+    with col3:
+        st.markdown("<div style='height: 28px'></div>", unsafe_allow_html=True)
+        if st.button("Reset statistics", key="query_stats_reset"):
+            _stats.reset()
+
+    rows = _stats.top(int(limit), order_by)
+    if rows:
+        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+    else:
+        st.info("No queries recorded yet.")
+
+    wait = _stats.connection_wait()
+    st.subheader("Connections")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Checkouts", wait['count'])
+    col2.metric("Wait p95", f"{wait['p95_ms']:.1f} ms")
+    col3.metric("Wait max", f"{wait['max_ms']:.1f} ms")
+    col4.metric("Cache hit ratio", f"{get_cache_stats()['hit_ratio']:.0%}")
+    st.json({shard: backend.stats() for shard, backend in backends().items()}, expanded=False)
+
+    st.subheader("Prepared statements")
+    st.dataframe(pd.DataFrame(get_statement_stats()), hide_index=True, use_container_width=True)
@@ -0,0 +1,312 @@
+# returns.py
+"""Money-weighted returns (XIRR) and CAGR for mutual fund folios.
+
+Each folio's cash flows come from ``fund_transactions``: purchases and SIP
+instalments flow out, redemptions and payouts flow in, and the folio's
+current value is the closing inflow as of today. ``xirr_batch`` solves all
+folios at once: cash flows are padded into a matrix and refined together by
+Newton's method, falling back to bisection wherever a step leaves the
+bracketed root.
+
+Results are memoized per folio, keyed by a hash of its cash flows, so a
+render only re-solves folios whose transactions or value changed. The
+per-user result is also held in the 'returns' cache entity, which
+transaction and fund writes invalidate.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from mysql.connector import Error
+
+from aggregates import weighted_roi
+from cache import cached, invalidate
+from database import get_db_connection, get_read_connection
+import statements
+
+TRANSACTION_KINDS = {
+    'purchase': -1,
+    'sip': -1,
+    'switch_in': -1,
+    'redemption': 1,
+    'switch_out': 1,
+    'dividend': 1,
+}
+DAYS_PER_YEAR = 365  # the spreadsheet XIRR convention
+MAX_ITERATIONS = 100
+TOLERANCE = 1e-9
+RATE_BOUNDS = (-0.9999, 100.0)  # -99.99% to +10,000% a year
+MEMO_SIZE = 50000
+
+statements.register('transactions.user', """
+    SELECT fund_id, txn_date, kind, amount
+    FROM fund_transactions WHERE username = %s
+""")
+statements.register('transactions.fund', """
+    SELECT id, txn_date, kind, amount, units
+    FROM fund_transactions
+    WHERE username = %s AND fund_id = %s
+    ORDER BY txn_date, id
+""")
+
+
+@dataclass
+class FundReturn:
+    xirr: Optional[float]  # percent a year; None when it can't be solved
+    cagr: Optional[float]  # percent a year on net invested amount
+    roi: float  # simple percent return on investment_amount
+
+
+def npv(rates, amounts, years):
+    """Present value of each row's cash flows at that row's rate"""
+    return np.sum(amounts * np.power(1.0 + rates[:, None], -years), axis=1)
+
+
+def xirr_batch(amounts, years, mask=None):
+    """Annual rates solving NPV = 0 for every row of padded cash-flow matrices.
+
+    ``amounts`` and ``years`` are ``(folios, flows)`` arrays, and ``years`` is
+    measured from each folio's first flow. Padding cells must have amount 0.
+    Rows without a sign change inside ``RATE_BOUNDS`` come back as NaN.
+    """
+    amounts = np.asarray(amounts, dtype=float)
+    years = np.asarray(years, dtype=float)
+    if mask is not None:
+        amounts = np.where(mask, amounts, 0.0)
+    n = amounts.shape[0]
+    lo = np.full(n, RATE_BOUNDS[0])
+    hi = np.full(n, RATE_BOUNDS[1])
+    f_lo = npv(lo, amounts, years)
+    f_hi = npv(hi, amounts, years)
+    solvable = np.sign(f_lo) * np.sign(f_hi) < 0
+
+    rate = np.full(n, 0.1)
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        for _ in range(MAX_ITERATIONS):
+            discount = np.power(1.0 + rate[:, None], -years)
+            f = np.sum(amounts * discount, axis=1)
+            df = np.sum(-years * amounts * discount / (1.0 + rate[:, None]), axis=1)
+
+            # Keep the bracket around the root: f has the sign of f_lo below it
+            below = np.sign(f) == np.sign(f_lo)
+            lo = np.where(below, rate, lo)
+            hi = np.where(below, hi, rate)
+
+            step = rate - f / df
+            newton_ok = np.isfinite(step) & (step > lo) & (step < hi)
+            new_rate = np.where(newton_ok, step, (lo + hi) / 2)
+            converged = np.abs(new_rate - rate) < TOLERANCE * np.maximum(1.0, np.abs(rate))
+            rate = new_rate
+            if np.all(converged | ~solvable):
+                break
+    return np.where(solvable, rate, np.nan)
+
+
+def cagr(invested, current_value, years):
+    """Compound annual growth of ``invested`` into ``current_value`` (fractions)"""
+    invested = np.asarray(invested, dtype=float)
+    current_value = np.asarray(current_value, dtype=float)
+    years = np.asarray(years, dtype=float)
+    ok = (invested > 0) & (current_value >= 0) & (years > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = np.power(np.where(ok, current_value / np.where(ok, invested, 1), 1.0),
+                          1.0 / np.where(ok, years, 1.0)) - 1.0
+    return np.where(ok, result, np.nan)
+
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _signature(fund_id, flows, current_value, as_of):
+    text = f"{fund_id}|{as_of}|{current_value}|" + ";".join(f"{d}:{a}" for d, a in flows)
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+def _memo_get(key):
+    with _memo_lock:
+        value = _memo.get(key)
+        if value is not None:
+            _memo.move_to_end(key)
+        return value
+
+
+def _memo_set(key, value):
+    with _memo_lock:
+        _memo[key] = value
+        _memo.move_to_end(key)
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+
+
+def compute_returns(funds, transactions, as_of=None):
+    """FundReturn per fund id from fund rows and their transaction rows.
+
+    Only folios missing from the memo are solved, in one ``xirr_batch`` call.
+    """
+    as_of = as_of or date.today()
+    flows_by_fund = {}
+    for txn in transactions:
+        sign = TRANSACTION_KINDS[txn['kind']]
+        flows_by_fund.setdefault(txn['fund_id'], []).append((txn['txn_date'], sign * float(txn['amount'])))
+
+    results, pending = {}, []
+    for fund in funds:
+        invested = float(fund['investment_amount'] or 0)
+        current = float(fund['current_value'] or 0)
+        flows = sorted(flows_by_fund.get(fund['id'], []))
+        roi = weighted_roi(invested, current)
+        if not flows:
+            results[fund['id']] = FundReturn(None, None, roi)
+            continue
+        key = _signature(fund['id'], flows, current, as_of)
+        memoized = _memo_get(key)
+        if memoized is not None:
+            results[fund['id']] = memoized
+        else:
+            pending.append((fund['id'], key, flows, current, roi))
+
+    if pending:
+        width = max(len(flows) for _, _, flows, _, _ in pending) + 1
+        amounts = np.zeros((len(pending), width))
+        years = np.zeros((len(pending), width))
+        net_invested = np.zeros(len(pending))
+        current_values = np.zeros(len(pending))
+        span = np.zeros(len(pending))
+        for row, (_, _, flows, current, _) in enumerate(pending):
+            first = flows[0][0]
+            for col, (day, amount) in enumerate(flows):
+                amounts[row, col] = amount
+                years[row, col] = (day - first).days / DAYS_PER_YEAR
+            # The current value closes the folio as of today
+            amounts[row, len(flows)] = current
+            years[row, len(flows)] = (as_of - first).days / DAYS_PER_YEAR
+            net_invested[row] = -sum(a for _, a in flows)
+            current_values[row] = current
+            span[row] = years[row, len(flows)]
+
+        rates = xirr_batch(amounts, years)
+        growth = cagr(net_invested, current_values, span)
+        for row, (fund_id, key, _, _, roi) in enumerate(pending):
+            result = FundReturn(
+                xirr=None if np.isnan(rates[row]) else round(float(rates[row]) * 100, 4),
+                cagr=None if np.isnan(growth[row]) else round(float(growth[row]) * 100, 4),
+                roi=roi,
+            )
+            _memo_set(key, result)
+            results[fund_id] = result
+    return results
+
+
+@cached('returns')
+def get_fund_returns(username, as_of):
+    """FundReturn for each of a user's folios as of a date (part of the cache key)"""
+    try:
+        with get_read_connection(username) as conn:
+            if conn is None:
+                st.error("Failed to connect to database")
+                return None
+            funds = statements.fetchall(conn, 'funds.list', (username,), dictionary=True)
+            transactions = statements.fetchall(conn, 'transactions.user', (username,),
+                                               dictionary=True)
+    except Error as e:
+        st.error(f"Error fetching fund transactions: {e}")
+        return None
+    return compute_returns(funds, transactions, as_of)
+
+
+def get_transactions(username, fund_id):
+    try:
+        with get_read_connection(username) as conn:
+            if conn is None:
+                st.error("Failed to connect to database")
+                return None
+            return statements.fetchall(conn, 'transactions.fund', (username, fund_id),
+                                       dictionary=True)
+    except Error as e:
+        st.error(f"Error fetching fund transactions: {e}")
+        return None
+
+
+def add_transaction(username, fund_id, txn_date, kind, amount, units=None):
+    try:
+        with get_db_connection(username) as conn:
+            if conn is None:
+                st.error("Failed to connect to database")
+                return False
+            with conn.cursor() as cursor:
+                # Only attach to a folio the user owns
+                cursor.execute("""
+                    INSERT INTO fund_transactions (username, fund_id, txn_date, kind, amount, units)
+                    SELECT username, id, %s, %s, %s, %s FROM user_mutual_funds
+                    WHERE id = %s AND username = %s
+                """, (txn_date, kind, amount, units, fund_id, username))
+                if cursor.rowcount != 1:
+                    st.error("Mutual fund not found")
+                    return False
+                conn.commit()
+                invalidate(username, 'transactions')
+                return True
+    except Error as e:
+        st.error(f"Error saving transaction: {e}")
+        return False
+
+
+def delete_transaction(username, txn_id):
+    try:
+        with get_db_connection(username) as conn:
+            if conn is None:
+                st.error("Failed to connect to database")
+                return False
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM fund_transactions WHERE id = %s AND username = %s",
+                               (txn_id, username))
+                conn.commit()
+                invalidate(username, 'transactions')
+                return True
+    except Error as e:
+        st.error(f"Error deleting transaction: {e}")
+        return False
+
+
+def display_fund_transactions(username, fund):
+    """Transaction list and entry form for one folio"""
+    st.subheader(f"🧾 Transactions · {fund['fund_name']}")
+    transactions = get_transactions(username, fund['id'])
+    if transactions:
+        df = pd.DataFrame(transactions, columns=['id', 'txn_date', 'kind', 'amount', 'units'])
+        st.dataframe(df.drop(columns=['id']), hide_index=True, use_container_width=True)
+        labels = {t['id']: f"{t['txn_date']} · {t['kind']} · ₹{t['amount']:,.2f}" for t in transactions}
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            txn_id = st.selectbox("Transaction", list(labels), format_func=labels.get,
+                                  key=f"txn_select_{fund['id']}")
+        with col2:
+            st.markdown("<div style='height: 28px'></div>", unsafe_allow_html=True)
+            if st.button("Delete", key=f"txn_delete_{fund['id']}"):
+                if delete_transaction(username, txn_id):
+                    st.experimental_rerun()
+    elif transactions is not None:
+        st.info("No transactions yet; XIRR needs at least one purchase.")
+
+    with st.form(f"txn_form_{fund['id']}"):
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            txn_date = st.date_input("Date", value=date.today(), max_value=date.today())
+        with col2:
+            kind = st.selectbox("Type", list(TRANSACTION_KINDS))
+        with col3:
+            amount = st.number_input("Amount (₹)", min_value=0.0, format="%.2f")
+        with col4:
+            units = st.number_input("Units", min_value=0.0, format="%.4f")
+        if st.form_submit_button("Add transaction"):
+            if amount <= 0:
+                st.error("Amount must be greater than zero")
+            elif add_transaction(username, fund['id'], txn_date, kind, amount, units or None):
+                st.experimental_rerun()
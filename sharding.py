@@ -0,0 +1,652 @@
+# sharding.py
+"""Horizontal sharding of user data by a stable hash of the username.
+
+Set ``FOLIO_SHARD_MAP`` to a JSON shard map and every per-user query goes
+to the one database holding that user::
+
+    {
+      "slots": 1024,
+      "shards": {
+        "s0": {"backend": "mysql", "database": "folio_fetch_s0",
+               "replicas": [{"host": "db1-replica"}]},
+        "s1": {"backend": "mysql", "host": "db2", "database": "folio_fetch_s1"},
+        "s2": {"backend": "sqlite", "path": "/var/lib/folio/s2.db"}
+      },
+      "ranges": [[0, 511, "s0"], [512, 767, "s1"], [768, 1023, "s2"]],
+      "users": {},
+      "frozen": []
+    }
+
+A username hashes (blake2b of its lower-cased text, since MySQL compares
+usernames case-insensitively) to one of ``slots`` fixed slots, and
+``ranges`` assigns slot ranges to shards. MySQL shard options are merged
+over ``DB_CONFIG``; each shard gets its own pool, plus one per read
+replica listed in ``replicas`` (see ``database.get_read_connection``).
+``users`` pins single users to a shard while a slot range is being moved,
+and ``frozen`` lists users whose rows are being copied right now. Their
+connections are read-only, so a write fails cleanly and the user retries
+it a few seconds later.
+Every process re-reads the map within ``FOLIO_SHARD_RELOAD`` seconds of a
+change.
+
+``database.get_db_connection(username)`` routes through ``get_router()``.
+Jobs that span all users (migrations, summary rebuilds, NAV revaluation,
+history rollups) go through ``scatter``, which runs a function on every
+shard in parallel. Reference data (``scheme_navs``) is written to each shard.
+
+Users are moved online, one at a time, by the command line tool::
+
+    python sharding.py init --shard s0=mysql:folio_fetch --shard s1=mysql:folio_fetch_s1
+    python sharding.py status
+    python sharding.py where alice
+    python sharding.py move alice --to s1
+    python sharding.py rebalance --slots 512-1023 --to s1
+
+A move freezes the user, waits for every process to see the freeze, copies
+the user's rows in one transaction on the target, pins the user there, and
+deletes the source rows once every process routes to the target. Row ids
+are reassigned on the target (auto-increment ranges overlap between
+shards), and the data version is moved past the source's so API ETags stay
+unique. Holding history moves with the user when both shards keep it.
+``rebalance`` hands a slot range to a shard with its existing users pinned
+where they are, so new users register on the new owner, then moves those
+users one by one and drops the pins. An existing single database becomes
+the first shard: map it as one shard for every slot and rebalance from there.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mysql.connector import Error
+
+from cache import invalidate
+
+SHARD_MAP_PATH = os.environ.get('FOLIO_SHARD_MAP')
+RELOAD_INTERVAL = float(os.environ.get('FOLIO_SHARD_RELOAD', 1.0))
+DRAIN_SECONDS = float(os.environ.get('FOLIO_SHARD_DRAIN', 2.0))  # in-flight writes finish
+DEFAULT_SLOTS = 1024
+SCATTER_WORKERS = int(os.environ.get('FOLIO_SCATTER_WORKERS', 8))
+
+# Rows keyed by a surrogate id are re-inserted without it; children are remapped
+ID_TABLES = ('user_banks', 'user_mutual_funds', 'user_cards')
+HISTORY_TABLES = ('holding_events', 'holding_daily', 'networth_daily')
+# Deleted children first once a user has moved; summary after its triggers fire
+DELETE_ORDER = ('fund_transactions', 'api_sessions', 'user_cards', 'user_banks',
+                'user_mutual_funds', 'user_profiles', 'user_portfolio_summary')
+
+
+class ShardRoutingError(Error):
+    """Raised when a query cannot be routed to a shard"""
+
+
+def slot_for(username, slots=DEFAULT_SLOTS):
+    """The fixed slot a username hashes to, the same in every process"""
+    digest = hashlib.blake2b(username.lower().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % slots
+
+
+class ShardMap:
+    """Slot ranges and per-user pins, as stored in the shard map file"""
+
+    def __init__(self, shards, ranges, slots=DEFAULT_SLOTS, users=None, frozen=None):
+        self.slots = slots
+        self.shards = dict(shards)
+        self.ranges = [tuple(r) for r in sorted(ranges)]
+        self.users = dict(users or {})
+        self.frozen = set(frozen or ())
+        self._owners = [None] * slots
+        for first, last, shard in self.ranges:
+            if shard not in self.shards:
+                raise ValueError(f"Slot range {first}-{last} names unknown shard {shard!r}")
+            for slot in range(first, last + 1):
+                if self._owners[slot] is not None:
+                    raise ValueError(f"Slot {slot} is assigned twice")
+                self._owners[slot] = shard
+        if None in self._owners:
+            raise ValueError(f"Slot {self._owners.index(None)} is not assigned to a shard")
+        for username, shard in self.users.items():
+            if shard not in self.shards:
+                raise ValueError(f"User {username!r} is pinned to unknown shard {shard!r}")
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['shards'], data['ranges'], data.get('slots', DEFAULT_SLOTS),
+                   data.get('users'), data.get('frozen'))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    @classmethod
+    def even(cls, shards, slots=DEFAULT_SLOTS):
+        """A map splitting the slots into equal ranges, one per shard in order"""
+        names = list(shards)
+        ranges = []
+        for i, name in enumerate(names):
+            first, last = i * slots // len(names), (i + 1) * slots // len(names) - 1
+            ranges.append((first, last, name))
+        return cls(shards, ranges, slots)
+
+    def to_dict(self):
+        return {
+            'slots': self.slots,
+            'shards': self.shards,
+            'ranges': [list(r) for r in self.ranges],
+            'users': dict(sorted(self.users.items())),
+            'frozen': sorted(self.frozen),
+        }
+
+    def save(self, path):
+        """Write the map atomically, so readers see the old map or the new one"""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+            f.write('\n')
+        os.replace(tmp, path)
+
+    def slot_owner(self, slot):
+        return self._owners[slot]
+
+    def shard_for(self, username):
+        pinned = self.users.get(username)
+        if pinned is not None:
+            return pinned
+        return self._owners[slot_for(username, self.slots)]
+
+    def assign(self, first, last, shard):
+        """A copy of this map with slots ``first``..``last`` owned by ``shard``"""
+        owners = list(self._owners)
+        owners[first:last + 1] = [shard] * (last - first + 1)
+        ranges, start = [], 0
+        for slot in range(1, self.slots + 1):
+            if slot == self.slots or owners[slot] != owners[start]:
+                ranges.append((start, slot - 1, owners[start]))
+                start = slot
+        return ShardMap(self.shards, ranges, self.slots, self.users, self.frozen)
+
+
+class ShardRouter:
+    """Routes users to their shard's backend, following changes to the map file"""
+
+    def __init__(self, shard_map, path=None):
+        self.map = shard_map
+        self.path = path
+        self._stamp = self._file_stamp()
+        self._checked = time.monotonic()
+        self._backends = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(ShardMap.load(path), path)
+
+    def _file_stamp(self):
+        if self.path is None:
+            return None
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def refresh(self, force=False):
+        """Re-read the map file if it changed; checked at most every RELOAD_INTERVAL"""
+        if self.path is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._checked < RELOAD_INTERVAL:
+            return
+        self._checked = now
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self._stamp:
+            return
+        try:
+            new_map = ShardMap.load(self.path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Keeping the previous shard map; {self.path} is unreadable: {e}")
+            return
+        old_map, self.map, self._stamp = self.map, new_map, stamp
+        # Cached rows of a moved user carry ids from their old shard
+        for username in set(old_map.users) | set(new_map.users):
+            if old_map.shard_for(username) != new_map.shard_for(username):
+                invalidate(username, 'banks', 'funds', 'cards', 'profile', 'transactions', 'api')
+
+    def backend(self, shard):
+        backend = self._backends.get(shard)
+        if backend is None:
+            with self._lock:
+                backend = self._backends.get(shard)
+                if backend is None:
+                    import database  # database routes through this module
+                    options = dict(self.map.shards[shard])
+                    kind = options.pop('backend', 'mysql')
+                    backend = self._backends[shard] = database.create_backend(kind, **options)
+        return backend
+
+    def shard_for(self, username):
+        self.refresh()
+        return self.map.shard_for(username)
+
+    def connection(self, username):
+        """A connection to the user's shard; read-only while the user is being moved"""
+        if username is None:
+            raise ShardRoutingError(msg="A username is needed to pick a shard")
+        self.refresh()
+        shard = self.map.shard_for(username)
+        return self.backend(shard).connection(read_only=username in self.map.frozen)
+
+    def read_connection(self, username):
+        """A connection for reads on the user's shard, from a replica if it has one"""
+        if username is None:
+            raise ShardRoutingError(msg="A username is needed to pick a shard")
+        return self.backend(self.shard_for(username)).read_connection()
+
+    def backends(self):
+        """``{shard: backend}`` for every shard in the map"""
+        self.refresh()
+        return {shard: self.backend(shard) for shard in self.map.shards}
+
+    def dispose(self):
+        with self._lock:
+            backends = list(self._backends.values())
+        for backend in backends:
+            backend.dispose()
+
+
+_router = None
+_router_loaded = False
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """The process-wide router from ``FOLIO_SHARD_MAP``, or None when unsharded"""
+    global _router, _router_loaded
+    if not _router_loaded:
+        with _router_lock:
+            if not _router_loaded:
+                if SHARD_MAP_PATH:
+                    _router = ShardRouter.from_file(SHARD_MAP_PATH)
+                _router_loaded = True
+    return _router
+
+
+def use_router(router):
+    """Swap the process-wide router (None turns sharding off); returns the old one"""
+    global _router, _router_loaded
+    with _router_lock:
+        previous, _router = _router, router
+        _router_loaded = True
+    return previous
+
+
+def shard_of(username):
+    """The name of the shard holding ``username`` ('default' when unsharded)"""
+    router = get_router()
+    return router.shard_for(username) if router is not None else 'default'
+
+
+def backends():
+    """``{shard: backend}``; the single storage backend is shard 'default'"""
+    router = get_router()
+    if router is not None:
+        return router.backends()
+    import database
+    return {'default': database.get_backend()}
+
+
+def _run_on(backend, shard, func):
+    with backend.connection() as conn:
+        if conn is None:
+            raise Error(msg=f"Failed to connect to shard {shard}")
+        return func(conn, shard)
+
+
+def scatter(func, shards=None):
+    """Run ``func(conn, shard)`` on every shard in parallel; ``{shard: result}``.
+
+    Every shard is tried; if any failed, an Error naming each failure is
+    raised once all have finished.
+    """
+    targets = backends()
+    if shards is not None:
+        targets = {shard: targets[shard] for shard in shards}
+    with ThreadPoolExecutor(max_workers=min(SCATTER_WORKERS, len(targets)) or 1,
+                            thread_name_prefix='folio-scatter') as pool:
+        futures = {shard: pool.submit(_run_on, backend, shard, func)
+                   for shard, backend in targets.items()}
+    results, failures = {}, []
+    for shard, future in futures.items():
+        try:
+            results[shard] = future.result()
+        except Error as e:
+            failures.append(f"{shard}: {e}")
+    if failures:
+        raise Error(msg=f"{len(failures)} shard(s) failed: " + "; ".join(failures))
+    return results
+
+
+def gather(sql, params=(), dictionary=False):
+    """Rows of one SELECT from every shard, concatenated in shard order"""
+    def select(conn, shard):
+        with conn.cursor(dictionary=dictionary) as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+    return [row for rows in scatter(select).values() for row in rows]
+
+
+# -- Moving users -----------------------------------------------------------
+
+def _rows(cursor, table, username, order='id', where='', params=()):
+    cursor.execute(f"SELECT * FROM {table} WHERE username = %s{where}"
+                   + (f" ORDER BY {order}" if order else ""), (username, *params))
+    return list(cursor.column_names), cursor.fetchall()
+
+
+def _insert(cursor, table, columns, row):
+    cursor.execute(f"INSERT INTO {table} ({', '.join(columns)}) "
+                   f"VALUES ({', '.join(['%s'] * len(columns))})", tuple(row))
+    return cursor.lastrowid
+
+
+def _copy_table(source, target, table, username, remap=None, drop_id=False, order='id',
+                where='', params=()):
+    """Copy a user's rows of one table; ``{old_id: new_id}`` when ids are reassigned"""
+    columns, rows = _rows(source, table, username, order, where, params)
+    ids = {}
+    for row in rows:
+        values = dict(zip(columns, row))
+        for column, mapping in (remap or {}).items():
+            values[column] = mapping(values)
+        old_id = values.pop('id') if drop_id else None
+        new_id = _insert(target, table, list(values), list(values.values()))
+        if drop_id:
+            ids[old_id] = new_id
+    return ids
+
+
+def copy_user(source_conn, target_conn, username, history=False):
+    """Copy every row of ``username`` from one shard to another in one transaction"""
+    with source_conn.cursor() as source, target_conn.cursor() as target:
+        target.execute("SELECT 1 FROM users WHERE username = %s", (username,))
+        if target.fetchone() is not None:
+            raise ShardRoutingError(msg=f"{username} already has rows on the target shard")
+        _copy_table(source, target, 'users', username, order=None)
+        _copy_table(source, target, 'user_profiles', username, order=None)
+        ids = {table: _copy_table(source, target, table, username, drop_id=True)
+               for table in ID_TABLES}
+        funds = ids['user_mutual_funds']
+        _copy_table(source, target, 'fund_transactions', username, drop_id=True,
+                    remap={'fund_id': lambda row: funds[row['fund_id']]})
+        _copy_table(source, target, 'api_sessions', username, order=None)
+
+        if history:
+            # The target's triggers logged the copied rows as new holdings; the
+            # source's log and rollups replace that, keyed by the new ids
+            target.execute("DELETE FROM holding_events WHERE username = %s", (username,))
+            holdings = {'bank': ids['user_banks'], 'fund': funds}
+            holding_id = {'holding_id': lambda row: holdings[row['kind']].get(row['holding_id'],
+                                                                              row['holding_id'])}
+            # Copied events get new ids past the target's last folded one, so
+            # they are its tail. Only whole days from the source's tail on are
+            # copied, and the rollups before them, so nothing counts twice.
+            source.execute("""
+                SELECT DATE(MIN(recorded_at)) FROM holding_events
+                WHERE username = %s
+                  AND id > (SELECT COALESCE(MAX(last_event_id), 0) FROM history_rollup_state)
+            """, (username,))
+            tail_day = source.fetchone()[0]
+            if tail_day is not None:
+                _copy_table(source, target, 'holding_events', username, remap=holding_id,
+                            drop_id=True, where=" AND recorded_at >= %s", params=(tail_day,))
+            where, params = (" AND day < %s", (tail_day,)) if tail_day is not None else ('', ())
+            _copy_table(source, target, 'holding_daily', username, remap=holding_id, order=None,
+                        where=where, params=params)
+            _copy_table(source, target, 'networth_daily', username, order=None,
+                        where=where, params=params)
+
+        # Past the source's version, so no ETag issued there is reused here
+        source.execute("SELECT data_version FROM user_portfolio_summary WHERE username = %s",
+                       (username,))
+        row = source.fetchone()
+        target.execute("SELECT data_version FROM user_portfolio_summary WHERE username = %s",
+                       (username,))
+        current = target.fetchone()
+        version = max(row[0] if row else 0, current[0] if current else 0) + 1
+        target.execute("""
+            INSERT INTO user_portfolio_summary (username, data_version) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE data_version = VALUES(data_version)
+        """, (username, version))
+    target_conn.commit()
+
+
+def delete_user(conn, username, history=False):
+    """Remove every row of ``username`` from one shard"""
+    with conn.cursor() as cursor:
+        for table in DELETE_ORDER + (HISTORY_TABLES if history else ()):
+            cursor.execute(f"DELETE FROM {table} WHERE username = %s", (username,))
+        cursor.execute("DELETE FROM users WHERE username = %s", (username,))
+    conn.commit()
+
+
+class _MapLock:
+    """Exclusive right to rewrite the map file, held by one mover at a time"""
+
+    def __init__(self, path):
+        self.path = f"{path}.lock"
+
+    def __enter__(self):
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            raise SystemExit(f"Another move holds {self.path}; remove it if that move died")
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        return self
+
+    def __exit__(self, *exc):
+        os.remove(self.path)
+
+
+def update_map(path, change):
+    shard_map = ShardMap.load(path)
+    change(shard_map)
+    shard_map = ShardMap(shard_map.shards, shard_map.ranges, shard_map.slots,
+                         shard_map.users, shard_map.frozen)
+    shard_map.save(path)
+    return shard_map
+
+
+def _settle():
+    """Wait until every process has re-read the map and finished writes begun before it"""
+    time.sleep(2 * RELOAD_INTERVAL + DRAIN_SECONDS)
+
+
+def move_user(router, username, target, log=print):
+    """Move one user's rows to ``target`` while the app keeps serving them.
+
+    The caller holds the map lock. Returns False if the user was already there.
+    """
+    path = router.path
+    router.refresh(force=True)
+    source = router.map.shard_for(username)
+    if source == target:
+        return False
+    source_backend, target_backend = router.backend(source), router.backend(target)
+    history = 'history' in source_backend.features and 'history' in target_backend.features
+
+    update_map(path, lambda m: m.frozen.add(username))
+    try:
+        _settle()
+        with source_backend.connection() as source_conn, \
+                target_backend.connection() as target_conn:
+            if source_conn is None or target_conn is None:
+                raise Error(msg=f"Failed to connect to shard {source} or {target}")
+            copy_user(source_conn, target_conn, username, history)
+        def pin(m):
+            m.users[username] = target
+            m.frozen.discard(username)
+        update_map(path, pin)
+    except BaseException:
+        update_map(path, lambda m: m.frozen.discard(username))
+        raise
+    log(f"Moved {username} from {source} to {target}; removing the old rows")
+    _settle()
+    with source_backend.connection() as conn:
+        if conn is None:
+            raise Error(msg=f"Failed to connect to shard {source}; {username} is still there")
+        delete_user(conn, username, history)
+    router.refresh(force=True)
+    return True
+
+
+def parse_slots(text):
+    first, _, last = text.partition('-')
+    return int(first), int(last or first)
+
+
+def _usernames(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT username FROM users")
+        return [row[0] for row in cursor.fetchall()]
+
+
+def users_in_slots(router, first, last):
+    """``{username: shard}`` for the users stored in slots ``first``..``last``"""
+    slots = router.map.slots
+    found = scatter(lambda conn, shard: _usernames(conn))
+    return {username: shard for shard, usernames in found.items() for username in usernames
+            if first <= slot_for(username, slots) <= last}
+
+
+def rebalance(router, first, last, target, log=print):
+    """Hand slots ``first``..``last`` to ``target`` and move their users there.
+
+    The range is reassigned first with every existing user pinned where
+    they are, so new users in the range register on ``target`` directly.
+    The caller holds the map lock. Returns the number of users moved.
+    """
+    path = router.path
+
+    def reassign(m):
+        m.ranges = m.assign(first, last, target).ranges
+        for username, shard in users_in_slots(router, first, last).items():
+            if shard != target:
+                m.users[username] = shard
+    update_map(path, reassign)
+    _settle()
+    # Also pins anyone who registered on the old owner before every process saw the change
+    remaining = {username: shard for username, shard in users_in_slots(router, first, last).items()
+                 if shard != target}
+    update_map(path, lambda m: m.users.update(remaining))
+
+    moved = 0
+    for username in sorted(remaining):
+        moved += move_user(router, username, target, log)
+
+    def unpin(m):
+        for username in remaining:
+            if m.users.get(username) == target:
+                del m.users[username]
+    update_map(path, unpin)
+    router.refresh(force=True)
+    log(f"Slots {first}-{last} now belong to {target} ({moved} user(s) moved)")
+    return moved
+
+
+def _status(router):
+    counts = scatter(lambda conn, shard: _count_users(conn))
+    print(f"{router.map.slots} slots, map {router.path}")
+    for shard, options in router.map.shards.items():
+        owned = [f"{a}-{b}" for a, b, owner in router.map.ranges if owner == shard]
+        print(f"  {shard}: {options.get('backend', 'mysql')} · slots {', '.join(owned) or 'none'}"
+              f" · {counts[shard]} user(s)")
+    for username, shard in router.map.users.items():
+        print(f"  pinned {username} -> {shard}")
+    for username in sorted(router.map.frozen):
+        print(f"  frozen {username}")
+
+
+def _count_users(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM users")
+        return cursor.fetchone()[0]
+
+
+def _shard_option(text):
+    name, _, spec = text.partition('=')
+    backend, _, where = spec.partition(':')
+    if not name or backend not in ('mysql', 'sqlite') or not where:
+        raise argparse.ArgumentTypeError("expected NAME=mysql:DATABASE or NAME=sqlite:PATH")
+    return name, {'backend': backend, ('database' if backend == 'mysql' else 'path'): where}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect the shard map and move users between shards")
+    parser.add_argument('--map', default=SHARD_MAP_PATH, help="shard map file (FOLIO_SHARD_MAP)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    init = commands.add_parser('init', help="write a new map splitting the slots evenly")
+    init.add_argument('--shard', type=_shard_option, action='append', required=True)
+    init.add_argument('--slots', type=int, default=DEFAULT_SLOTS)
+    commands.add_parser('status', help="slot ranges, pins and users per shard")
+    where = commands.add_parser('where', help="the slot and shard of a user")
+    where.add_argument('username')
+    move = commands.add_parser('move', help="move one user online")
+    move.add_argument('username')
+    move.add_argument('--to', required=True)
+    balance = commands.add_parser('rebalance', help="move a slot range to a shard")
+    balance.add_argument('--slots', type=parse_slots, required=True, help="FIRST-LAST")
+    balance.add_argument('--to', required=True)
+    args = parser.parse_args(argv)
+    if not args.map:
+        parser.error("set FOLIO_SHARD_MAP or pass --map")
+
+    if args.command == 'init':
+        if os.path.exists(args.map):
+            parser.error(f"{args.map} already exists")
+        ShardMap.even(dict(args.shard), args.slots).save(args.map)
+    router = ShardRouter.from_file(args.map)
+    use_router(router)
+    import migrations
+    if not migrations.ensure_schema():
+        print("Could not bring every shard's schema up to date")
+        return 1
+
+    try:
+        if args.command == 'init':
+            print(f"Wrote {args.map}")
+            _status(router)
+        elif args.command == 'status':
+            _status(router)
+        elif args.command == 'where':
+            slot = slot_for(args.username, router.map.slots)
+            print(f"{args.username}: slot {slot}, shard {router.map.shard_for(args.username)}")
+        else:
+            if args.to not in router.map.shards:
+                parser.error(f"unknown shard {args.to!r}")
+            with _MapLock(args.map):
+                if args.command == 'move':
+                    if not move_user(router, args.username, args.to):
+                        print(f"{args.username} is already on {args.to}")
+                else:
+                    first, last = args.slots
+                    if not 0 <= first <= last < router.map.slots:
+                        parser.error(f"slots must be within 0-{router.map.slots - 1}")
+                    rebalance(router, first, last, args.to)
+    except Error as e:
+        print(f"Shard {args.command} failed: {e}")
+        return 1
+    finally:
+        router.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    # Run as the importable module, so the router it installs is the one database uses
+    import sharding
+    sys.exit(sharding.main())
@@ -0,0 +1,546 @@
+# sqlite_backend.py
+"""Embedded SQLite storage for single-node and test deployments.
+
+Selected with ``FOLIO_DB_BACKEND=sqlite``; the database file is
+``FOLIO_SQLITE_PATH``. Reads and writes run in-process against a local file
+with no server and no network hop. The rest of the app keeps its MySQL code:
+``SQLiteConnection`` answers the connector calls the app makes
+(``cursor(dictionary=True)``, ``execute(..., multi=True)``, ``lastrowid``,
+``commit``...). ``translate`` rewrites the few MySQL idioms the queries use,
+and SQLite errors are raised as the matching ``mysql.connector`` errors, so
+every ``except Error`` handler keeps working.
+
+Each thread keeps one connection. It runs in WAL mode, so readers never
+block the writer, and it has a large page cache and memory-mapped I/O.
+Compiled statements are kept in the connection's statement cache.
+Translated SQL is memoised, so the same query text, and with it the same
+prepared statement, is reused on every call.
+
+The schema is created at the latest migration's shape by ``ensure_schema``,
+including the summary, data-version and row-version triggers. Holding
+history (partitioned events and rollups) and NAV revaluation remain
+MySQL-only; see ``FEATURES``.
+"""
+import itertools
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+from mysql.connector import errorcode, errors
+
+from querylog import instrument
+
+SQLITE_PATH = os.environ.get('FOLIO_SQLITE_PATH', 'folio_fetch.db')
+STATEMENT_CACHE = int(os.environ.get('FOLIO_SQLITE_STATEMENT_CACHE', 512))
+BUSY_TIMEOUT_MS = int(os.environ.get('FOLIO_SQLITE_BUSY_TIMEOUT_MS', 5000))
+CACHE_SIZE_KB = int(os.environ.get('FOLIO_SQLITE_CACHE_KB', 64 * 1024))
+MMAP_SIZE = int(os.environ.get('FOLIO_SQLITE_MMAP_BYTES', 256 * 1024 * 1024))
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",  # durable at checkpoints; safe with WAL
+    "PRAGMA foreign_keys = ON",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    f"PRAGMA cache_size = -{CACHE_SIZE_KB}",
+    f"PRAGMA mmap_size = {MMAP_SIZE}",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Capabilities of this backend; MySQL-only features check for their name
+FEATURES = frozenset()
+
+# Declared column types: MONEY and QUANTITY read back as Decimal at MySQL's scale
+_MONEY = Decimal('0.01')
+_QUANTITY = Decimal('0.0001')
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_converter('MONEY', lambda raw: Decimal(raw.decode()).quantize(_MONEY))
+sqlite3.register_converter('QUANTITY', lambda raw: Decimal(raw.decode()).quantize(_QUANTITY))
+sqlite3.register_converter('DATE', lambda raw: date.fromisoformat(raw.decode()))
+sqlite3.register_converter('DATETIME', lambda raw: datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda raw: datetime.fromisoformat(raw.decode()))
+
+_NOW_PLUS_SECONDS = re.compile(r"NOW\(\)\s*\+\s*INTERVAL\s+(\?|\d+)\s+SECOND", re.IGNORECASE)
+_ON_DUPLICATE = re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.IGNORECASE)
+_VALUES_OF = re.compile(r"\bVALUES\((\w+)\)", re.IGNORECASE)
+_INSERT_SELECT = re.compile(r"(\s*INSERT\s+INTO\s+\w+\s*\([^)]*\)\s*)(SELECT\b.*)",
+                            re.IGNORECASE | re.DOTALL)
+_DERIVED_ALIAS = re.compile(r"\)\s*(\w+)\s*$")  # ... FROM (SELECT ...) t
+_RIGHT = re.compile(r"\bRIGHT\(([\w.]+),\s*(\d+)\)", re.IGNORECASE)  # RIGHT is a join keyword here
+
+
+@lru_cache(maxsize=1024)
+def translate(sql):
+    """The SQLite spelling of one of the app's MySQL statements"""
+    sql = sql.replace('%s', '?')
+    sql = _NOW_PLUS_SECONDS.sub(r"datetime('now', 'localtime', printf('%+d seconds', \1))", sql)
+    sql = re.sub(r"\bNOW\(\)", "datetime('now', 'localtime')", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bIF\(", "iif(", sql, flags=re.IGNORECASE)
+    sql = sql.replace('<=>', ' IS ')
+    sql = _RIGHT.sub(r"substr(\1, -\2)", sql)
+    upsert = _ON_DUPLICATE.search(sql)
+    if upsert:
+        head, updates = sql[:upsert.start()], _VALUES_OF.sub(r"excluded.\1", sql[upsert.end():])
+        insert_select = _INSERT_SELECT.fullmatch(head)
+        if insert_select:
+            # Updates naming the derived table's columns (t.c) mean the proposed row
+            alias = _DERIVED_ALIAS.search(head)
+            if alias:
+                updates = re.sub(rf"\b{alias.group(1)}\.(\w+)", r"excluded.\1", updates)
+            # Without a WHERE, SQLite would parse ON CONFLICT as a join constraint
+            head = f"{insert_select.group(1)}SELECT * FROM ({insert_select.group(2)}) WHERE true "
+        sql = f"{head}ON CONFLICT DO UPDATE SET{updates}"
+    return sql
+
+
+def _split_statements(sql):
+    return [statement for statement in (s.strip() for s in sql.split(';')) if statement]
+
+
+def _mysql_error(e):
+    """The ``mysql.connector`` error matching a sqlite3 exception"""
+    message = str(e)
+    if isinstance(e, sqlite3.IntegrityError):
+        if 'UNIQUE' in message or 'PRIMARY KEY' in message:
+            errno = errorcode.ER_DUP_ENTRY
+        elif 'FOREIGN KEY' in message:
+            errno = errorcode.ER_NO_REFERENCED_ROW_2
+        else:
+            errno = errorcode.ER_BAD_NULL_ERROR
+        return errors.IntegrityError(msg=message, errno=errno)
+    if isinstance(e, sqlite3.OperationalError):
+        if 'locked' in message or 'busy' in message:
+            return errors.OperationalError(msg=message, errno=errorcode.ER_LOCK_WAIT_TIMEOUT)
+        if 'readonly' in message:
+            return errors.ProgrammingError(
+                msg=message, errno=errorcode.ER_CANT_EXECUTE_IN_READ_ONLY_TRANSACTION)
+        return errors.ProgrammingError(msg=message, errno=errorcode.ER_PARSE_ERROR)
+    return errors.DatabaseError(msg=message)
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class SQLiteCursor:
+    """The subset of the MySQL cursor API the app uses, over a sqlite3 cursor"""
+
+    def __init__(self, conn, dictionary=False):
+        self._cursor = conn.cursor()
+        if dictionary:
+            self._cursor.row_factory = _dict_row
+        self.statement = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def column_names(self):
+        return tuple(column[0] for column in self._cursor.description or ())
+
+    @property
+    def with_rows(self):
+        return self._cursor.description is not None
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def _run(self, call, *args):
+        try:
+            return call(*args)
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def execute(self, operation, params=(), multi=False):
+        self.statement = operation
+        if multi:
+            return self._execute_each(operation, params)
+        self._run(self._cursor.execute, translate(operation), tuple(params or ()))
+        return None
+
+    def _execute_each(self, operation, params):
+        """Run ``;``-separated statements in turn, yielding after each like ``multi=True``"""
+        params = tuple(params or ())
+        for statement in _split_statements(operation):
+            sql = translate(statement)
+            count = sql.count('?')
+            self.statement = statement
+            self._run(self._cursor.execute, sql, params[:count])
+            params = params[count:]
+            yield self
+
+    def executemany(self, operation, seq_params):
+        self.statement = operation
+        self._run(self._cursor.executemany, translate(operation), [tuple(p) for p in seq_params])
+
+    def fetchone(self):
+        return self._run(self._cursor.fetchone)
+
+    def fetchmany(self, size=1):
+        return self._run(self._cursor.fetchmany, size)
+
+    def fetchall(self):
+        return self._run(self._cursor.fetchall)
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """One thread's sqlite3 connection, behaving like a MySQL connection"""
+
+    unread_result = False
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES,
+                                     cached_statements=STATEMENT_CACHE, check_same_thread=False)
+        for pragma in PRAGMAS:
+            self._conn.execute(pragma)
+        self._conn.create_function('CONCAT', -1, lambda *parts: None if None in parts
+                                   else ''.join(str(p) for p in parts), deterministic=True)
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self._conn, dictionary)
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def commit(self):
+        try:
+            self._conn.commit()
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def consume_results(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def ping(self, reconnect=False):
+        self._conn.execute("SELECT 1")
+
+    def set_query_only(self, on):
+        self._conn.execute(f"PRAGMA query_only = {int(on)}")
+
+    def executescript(self, script):
+        try:
+            self._conn.executescript(script)
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def close(self):
+        self._conn.close()
+
+
+def _summary_upsert(columns, row, sign, condition):
+    names = ', '.join(columns)
+    values = ', '.join(f"{sign}({expr.format(row=row)})" for expr in columns.values())
+    updates = ', '.join(f"{name} = {name} + excluded.{name}" for name in columns)
+    return (f"INSERT INTO user_portfolio_summary (username, {names}) "
+            f"SELECT {row}.username, {values} WHERE {condition} "
+            f"ON CONFLICT (username) DO UPDATE SET {updates};")
+
+
+def _summary_triggers():
+    """SQLite versions of the MySQL summary triggers from ``migrations``"""
+    import summary  # summary imports database, which imports this module lazily
+    triggers = []
+    for table, columns in summary.CONTRIBUTIONS.items():
+        columns = {name: translate(expr) for name, expr in columns.items()}
+        delta = {name: f"({expr.format(row='NEW')}) - ({expr.format(row='OLD')})"
+                 for name, expr in columns.items()}
+        changed = ' OR '.join(f"NOT ({expr.format(row='NEW')} IS {expr.format(row='OLD')})"
+                              for expr in columns.values())
+        moved = "NOT (NEW.username IS OLD.username)"
+        triggers += [
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_summary_insert
+                AFTER INSERT ON {table} FOR EACH ROW BEGIN
+                    {_summary_upsert(columns, 'NEW', '+', 'NEW.username IS NOT NULL')}
+                END;""",
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_summary_update
+                AFTER UPDATE ON {table} FOR EACH ROW BEGIN
+                    {_summary_upsert(columns, 'OLD', '-', f'OLD.username IS NOT NULL AND {moved}')}
+                    {_summary_upsert(columns, 'NEW', '+', f'NEW.username IS NOT NULL AND {moved}')}
+                    {_summary_upsert(delta, 'NEW', '+',
+                                     f'NEW.username IS NOT NULL AND NOT {moved} AND ({changed})')}
+                END;""",
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_summary_delete
+                AFTER DELETE ON {table} FOR EACH ROW BEGIN
+                    {_summary_upsert(columns, 'OLD', '-', 'OLD.username IS NOT NULL')}
+                END;""",
+        ]
+    return triggers
+
+
+def _version_triggers():
+    """Data-version bumps and row versions on every versioned table"""
+    triggers = [
+        # Every change to a summary row is a new version, as in migration 8
+        """CREATE TRIGGER IF NOT EXISTS trg_user_portfolio_summary_version
+           AFTER UPDATE ON user_portfolio_summary FOR EACH ROW
+           WHEN NEW.data_version = OLD.data_version BEGIN
+               UPDATE user_portfolio_summary SET data_version = OLD.data_version + 1,
+                      updated_at = CURRENT_TIMESTAMP
+               WHERE username = NEW.username;
+           END;""",
+    ]
+    for table, (event, row, when) in itertools.product(
+            ('user_banks', 'user_mutual_funds', 'user_cards', 'user_profiles'),
+            (('INSERT', 'NEW', ''),
+             # Not again for the row-version bump below
+             ('UPDATE', 'NEW', 'WHEN NEW.row_version = OLD.row_version'),
+             ('DELETE', 'OLD', ''))):
+        triggers.append(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+            AFTER {event} ON {table} FOR EACH ROW {when} BEGIN
+                INSERT INTO user_portfolio_summary (username) VALUES ({row}.username)
+                ON CONFLICT (username) DO UPDATE SET data_version = data_version + 1;
+            END;""")
+    for table, key in (('user_banks', 'id'), ('user_mutual_funds', 'id'),
+                       ('user_cards', 'id'), ('user_profiles', 'username')):
+        # Recursive triggers are off, so this UPDATE does not fire itself again
+        triggers.append(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_row_version
+            AFTER UPDATE ON {table} FOR EACH ROW BEGIN
+                UPDATE {table} SET row_version = OLD.row_version + 1 WHERE {key} = NEW.{key};
+            END;""")
+    return triggers
+
+
+# Tables at the shape of MySQL migration SCHEMA_VERSION. ENUM columns become
+# TEXT; DECIMAL columns are MONEY (2 places) or QUANTITY (4 places).
+SCHEMA_VERSION = 11
+TABLES = """
+CREATE TABLE IF NOT EXISTS users (
+    username VARCHAR(255) PRIMARY KEY,
+    password VARCHAR(255) NOT NULL,
+    registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS user_profiles (
+    username VARCHAR(255) PRIMARY KEY REFERENCES users(username),
+    full_name VARCHAR(255),
+    email VARCHAR(255) UNIQUE,
+    gender TEXT CHECK (gender IN ('Male', 'Female', 'Other')),
+    date_of_birth DATE,
+    pan_card VARCHAR(10) UNIQUE,
+    aadhar_card VARCHAR(12) UNIQUE,
+    mobile_number VARCHAR(10) UNIQUE,
+    profile_photo_path VARCHAR(255),
+    address TEXT,
+    city VARCHAR(100),
+    state VARCHAR(100),
+    pincode VARCHAR(10),
+    country VARCHAR(100),
+    row_version INT NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS user_banks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(255) REFERENCES users(username),
+    bank_name VARCHAR(255) NOT NULL,
+    account_number VARCHAR(20) NOT NULL,
+    ifsc_code VARCHAR(11) NOT NULL,
+    account_balance MONEY DEFAULT 0.00,
+    nominee_name VARCHAR(255),
+    row_version INT NOT NULL DEFAULT 1,
+    UNIQUE (username, account_number)
+);
+CREATE TABLE IF NOT EXISTS user_mutual_funds (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(255) REFERENCES users(username),
+    folio_number VARCHAR(50) NOT NULL,
+    fund_name VARCHAR(255) NOT NULL,
+    fund_type TEXT NOT NULL CHECK (fund_type IN ('Equity', 'Debt', 'Hybrid', 'ELSS', 'Other')),
+    investment_amount MONEY,
+    current_value MONEY,
+    nominee_name VARCHAR(255),
+    scheme_code INT NULL,
+    units QUANTITY NULL,
+    row_version INT NOT NULL DEFAULT 1,
+    UNIQUE (username, folio_number)
+);
+CREATE TABLE IF NOT EXISTS user_cards (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(255) REFERENCES users(username),
+    card_number VARCHAR(16) NOT NULL,
+    card_name VARCHAR(255),
+    card_classification TEXT NOT NULL CHECK (card_classification IN ('Debit', 'Credit')),
+    card_type TEXT NOT NULL CHECK (card_type IN ('Visa', 'Mastercard', 'RuPay', 'Amex', 'Other')),
+    expiry_month VARCHAR(2) NOT NULL,
+    expiry_year VARCHAR(4) NOT NULL,
+    cvv VARCHAR(3) NOT NULL,
+    is_active BOOLEAN DEFAULT TRUE,
+    row_version INT NOT NULL DEFAULT 1,
+    UNIQUE (username, card_number)
+);
+CREATE INDEX IF NOT EXISTS idx_mf_user_type_amounts
+    ON user_mutual_funds (username, fund_type, investment_amount, current_value);
+CREATE INDEX IF NOT EXISTS idx_banks_user_balance ON user_banks (username, account_balance);
+CREATE INDEX IF NOT EXISTS idx_mf_scheme_code ON user_mutual_funds (scheme_code);
+CREATE INDEX IF NOT EXISTS idx_banks_user_id ON user_banks (username, id);
+CREATE INDEX IF NOT EXISTS idx_mf_user_id ON user_mutual_funds (username, id);
+CREATE INDEX IF NOT EXISTS idx_cards_user_listing
+    ON user_cards (username, is_active DESC, card_classification);
+CREATE TABLE IF NOT EXISTS scheme_navs (
+    scheme_code INT PRIMARY KEY,
+    isin_growth VARCHAR(12),
+    isin_reinvestment VARCHAR(12),
+    scheme_name VARCHAR(255),
+    nav QUANTITY NOT NULL,
+    nav_date DATE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fund_transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(255) NOT NULL,
+    fund_id INT NOT NULL REFERENCES user_mutual_funds(id) ON DELETE CASCADE,
+    txn_date DATE NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('purchase', 'sip', 'redemption', 'dividend',
+                                       'switch_in', 'switch_out')),
+    amount MONEY NOT NULL,
+    units QUANTITY NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_txn_user_fund ON fund_transactions (username, fund_id, txn_date);
+CREATE INDEX IF NOT EXISTS idx_txn_fund ON fund_transactions (fund_id);
+CREATE TABLE IF NOT EXISTS user_portfolio_summary (
+    username VARCHAR(255) PRIMARY KEY,
+    bank_count INT NOT NULL DEFAULT 0,
+    total_balance MONEY NOT NULL DEFAULT 0,
+    fund_count INT NOT NULL DEFAULT 0,
+    total_invested MONEY NOT NULL DEFAULT 0,
+    fund_value MONEY NOT NULL DEFAULT 0,
+    card_count INT NOT NULL DEFAULT 0,
+    active_cards INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    data_version BIGINT NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS api_sessions (
+    token_hash CHAR(64) PRIMARY KEY,
+    username VARCHAR(255) NOT NULL REFERENCES users(username),
+    expires_at DATETIME NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_api_sessions_user ON api_sessions (username, expires_at);
+"""
+
+
+def schema_script():
+    """The whole SQLite schema, tables then triggers, as one script"""
+    triggers = '\n'.join(_summary_triggers() + _version_triggers())
+    return f"{TABLES}\n{triggers}\nPRAGMA user_version = {SCHEMA_VERSION};"
+
+
+class SQLiteBackend:
+    """Storage in a local SQLite file, one connection per thread"""
+
+    name = 'sqlite'
+    features = FEATURES
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        self._stats = {'connections': 0, 'checkouts': 0}
+
+    def _thread_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = SQLiteConnection(self.path)
+            with self._lock:
+                self._connections.append(conn)
+                self._stats['connections'] += 1
+        return conn
+
+    @contextmanager
+    def connection(self, read_only=False):
+        """This thread's connection; an unfinished transaction is rolled back after.
+
+        Blocks nest on the one connection, so only the outermost rolls back:
+        a helper opening its own block cannot discard the caller's work.
+        ``read_only`` refuses writes for the block (a user being moved).
+        """
+        try:
+            conn = self._thread_connection()
+        except (sqlite3.Error, errors.Error) as e:
+            print(f"Error opening SQLite database {self.path}: {e}")
+            yield None
+            return
+        with self._lock:
+            self._stats['checkouts'] += 1
+        local = self._local
+        depth = getattr(local, 'depth', 0)
+        restrict = read_only and not getattr(local, 'read_only', False)
+        local.depth = depth + 1
+        if restrict:
+            conn.set_query_only(True)
+            local.read_only = True
+        try:
+            yield instrument(conn)
+        finally:
+            local.depth = depth
+            if depth == 0 and conn.in_transaction:
+                conn.rollback()
+            if restrict:
+                conn.set_query_only(False)
+                local.read_only = False
+
+    def read_connection(self):
+        """Reads use the same local file; there are no replicas"""
+        return self.connection()
+
+    def ensure_schema(self):
+        """Create any missing tables and triggers once per process"""
+        if self._schema_ready:
+            return True
+        with self._schema_lock:
+            if self._schema_ready:
+                return True
+            try:
+                with self.connection() as conn:
+                    if conn is None:
+                        return False
+                    conn.executescript(schema_script())
+                self._schema_ready = True
+            except errors.Error as e:
+                print(f"Error creating SQLite schema: {e}")
+        return self._schema_ready
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'path': self.path}
+
+    def dispose(self):
+        """Close every thread's connection; threads reopen on next use"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
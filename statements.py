@@ -0,0 +1,123 @@
+# statements.py
+"""Registry of server-side prepared statements shared by the data layer.
+
+Hot queries are registered once by name (``register('cards.list', CARD_QUERY)``)
+and run with ``fetchall(conn, 'cards.list', (username,))``. The first run on
+a pooled connection prepares the statement over the binary protocol
+(``cursor(prepared=True)``); the prepared cursor is kept on that connection
+and later runs only send the parameters. MySQL then parses and plans the
+query once per connection rather than on every call. On SQLite the cached
+cursor reuses the connection's compiled statement the same way.
+
+Per-statement counters (prepares, executions and hits, which are executions
+without a prepare) show the reuse; they are on the query statistics page.
+Set ``FOLIO_PREPARED_STATEMENTS=0`` for the text protocol, for example behind
+a proxy without prepared-statement support.
+"""
+import os
+import threading
+import time
+
+from mysql.connector import Error
+
+import querylog
+from querylog import caller_name, unwrap
+
+ENABLED = os.environ.get('FOLIO_PREPARED_STATEMENTS', '1') != '0'
+
+_statements = {}  # name -> SQL text; the same str object is sent on every run
+_stats = {}
+_lock = threading.Lock()
+
+
+def register(name, sql):
+    """Add a statement under ``name``; returns the name"""
+    with _lock:
+        if _statements.get(name, sql) != sql:
+            raise ValueError(f"Statement {name!r} is already registered with different SQL")
+        _statements.setdefault(name, sql)
+        _stats.setdefault(name, {'prepares': 0, 'executions': 0, 'failures': 0})
+    return name
+
+
+def sql(name):
+    """The SQL text registered under ``name``"""
+    return _statements[name]
+
+
+def names():
+    """Every registered statement name, sorted"""
+    with _lock:
+        return sorted(_statements)
+
+
+def _prepared_cursors(conn):
+    """The ``{(name, dictionary): cursor}`` cache living on the raw connection"""
+    raw = unwrap(conn)
+    cursors = getattr(raw, '_folio_prepared', None)
+    if cursors is None:
+        cursors = raw._folio_prepared = {}
+    return raw, cursors
+
+
+def _execute(conn, name, params, dictionary, fetch):
+    query = _statements[name]
+    if not ENABLED:
+        with conn.cursor(dictionary=dictionary) as cursor:
+            cursor.execute(query, params)
+            return fetch(cursor)
+
+    raw, cursors = _prepared_cursors(conn)
+    key = (name, dictionary)
+    cursor = cursors.get(key)
+    prepare = cursor is None
+    if prepare:
+        cursor = cursors[key] = raw.cursor(prepared=True, dictionary=dictionary)
+    started = time.perf_counter()
+    failed = True
+    rows = 0
+    try:
+        cursor.execute(query, tuple(params))
+        result = fetch(cursor)
+        rows = len(result) if isinstance(result, list) else int(result is not None)
+        failed = False
+        return result
+    except Error:
+        # A half-read or invalidated statement is re-prepared next time
+        cursors.pop(key, None)
+        try:
+            cursor.close()
+        except Error:
+            pass
+        raise
+    finally:
+        with _lock:
+            stats = _stats[name]
+            stats['executions'] += 1
+            stats['prepares'] += prepare
+            stats['failures'] += failed
+        if querylog.ENABLED:
+            querylog.record(query, caller_name(3), time.perf_counter() - started, rows,
+                            getattr(conn, 'conn_wait', 0.0), failed)
+
+
+def fetchall(conn, name, params=(), dictionary=False):
+    """Run a registered SELECT on ``conn`` and return all of its rows"""
+    return _execute(conn, name, params, dictionary, lambda cursor: cursor.fetchall())
+
+
+def fetchone(conn, name, params=(), dictionary=False):
+    """First row of a registered SELECT, or None; the rest are read and discarded"""
+    def first(cursor):
+        rows = cursor.fetchall()
+        return rows[0] if rows else None
+    return _execute(conn, name, params, dictionary, first)
+
+
+def get_statement_stats():
+    """Counters per registered statement, most executed first"""
+    with _lock:
+        rows = [{'statement': name, **stats,
+                 'hits': stats['executions'] - stats['prepares']}
+                for name, stats in _stats.items()]
+    return sorted(rows, key=lambda row: row['executions'], reverse=True)
@@ -0,0 +1,157 @@
+# summary.py
+"""Per-user portfolio totals kept in ``user_portfolio_summary``.
+
+Triggers on ``user_banks``, ``user_mutual_funds`` and ``user_cards`` apply
+each insert, update and delete to the owner's summary row as a delta. Every
+write path is covered this way, including the bulk importer and NAV
+revaluation. Reading a user's totals is then a primary-key lookup
+(``aggregates.SUMMARY_QUERY``).
+
+Deltas can drift if rows are changed with triggers disabled, for example by
+a restored dump. ``check`` compares the stored rows with totals recomputed
+from the holdings, and ``rebuild`` recomputes them::
+
+    python summary.py check [--user NAME]
+    python summary.py rebuild [--user NAME]
+
+A rebuild bumps each rebuilt user's ``data_version``, so the API serves the
+new totals at once. The CLI cannot reach a running app's in-process cache,
+so the dashboard keeps showing cached totals for up to ``FOLIO_CACHE_TTL``.
+"""
+import argparse
+import sys
+
+from mysql.connector import Error
+
+from aggregates import SUMMARY_COLUMNS
+from sharding import scatter, shard_of
+
+REBUILD_BATCH = 1000  # users per INSERT ... SELECT
+
+# Totals from the holdings themselves; params are (first_username, last_username)
+RECOMPUTE_QUERY = """
+    SELECT u.username,
+           COALESCE(b.bank_count, 0) AS bank_count,
+           COALESCE(b.total_balance, 0) AS total_balance,
+           COALESCE(f.fund_count, 0) AS fund_count,
+           COALESCE(f.total_invested, 0) AS total_invested,
+           COALESCE(f.fund_value, 0) AS fund_value,
+           COALESCE(c.card_count, 0) AS card_count,
+           COALESCE(c.active_cards, 0) AS active_cards
+    FROM users u
+    LEFT JOIN (
+        SELECT username, COUNT(*) AS bank_count, SUM(COALESCE(account_balance, 0)) AS total_balance
+        FROM user_banks WHERE username BETWEEN %s AND %s GROUP BY username
+    ) b ON b.username = u.username
+    LEFT JOIN (
+        SELECT username, COUNT(*) AS fund_count,
+               SUM(COALESCE(investment_amount, 0)) AS total_invested,
+               SUM(COALESCE(current_value, 0)) AS fund_value
+        FROM user_mutual_funds WHERE username BETWEEN %s AND %s GROUP BY username
+    ) f ON f.username = u.username
+    LEFT JOIN (
+        SELECT username, COUNT(*) AS card_count, SUM(IF(is_active, 1, 0)) AS active_cards
+        FROM user_cards WHERE username BETWEEN %s AND %s GROUP BY username
+    ) c ON c.username = u.username
+    WHERE u.username BETWEEN %s AND %s
+"""
+
+# Summary columns each holding table contributes, as expressions over one row
+CONTRIBUTIONS = {
+    'user_banks': {
+        'bank_count': "1",
+        'total_balance': "COALESCE({row}.account_balance, 0)",
+    },
+    'user_mutual_funds': {
+        'fund_count': "1",
+        'total_invested': "COALESCE({row}.investment_amount, 0)",
+        'fund_value': "COALESCE({row}.current_value, 0)",
+    },
+    'user_cards': {
+        'card_count': "1",
+        'active_cards': "IF({row}.is_active, 1, 0)",
+    },
+}
+
+
+def _username_ranges(cursor, username, batch):
+    if username is not None:
+        yield username, username
+        return
+    cursor.execute("SELECT username FROM users ORDER BY username")
+    names = [row[0] for row in cursor.fetchall()]
+    for start in range(0, len(names), batch):
+        chunk = names[start:start + batch]
+        yield chunk[0], chunk[-1]
+
+
+def find_drift(cursor, username=None, batch=REBUILD_BATCH):
+    """``(username, column, stored, actual)`` for every stored total that is off"""
+    drift = []
+    for first, last in _username_ranges(cursor, username, batch):
+        cursor.execute(f"""
+            SELECT t.*, {', '.join(f's.{c} AS stored_{c}' for c in SUMMARY_COLUMNS)}
+            FROM ({RECOMPUTE_QUERY}) t
+            LEFT JOIN user_portfolio_summary s ON s.username = t.username
+        """, (first, last) * 4)
+        names = [d[0] for d in cursor.description]
+        for values in cursor.fetchall():
+            row = dict(zip(names, values))
+            for column in SUMMARY_COLUMNS:
+                stored = row[f'stored_{column}'] or 0
+                if stored != row[column]:
+                    drift.append((row['username'], column, stored, row[column]))
+    return drift
+
+
+def rebuild(cursor, username=None, batch=REBUILD_BATCH, bump_version=True):
+    """Overwrite summary rows with totals recomputed from the holdings.
+
+    Each rebuilt row gets a new ``data_version``, so ETags issued before it go stale.
+    """
+    updates = ', '.join([f'{c} = t.{c}' for c in SUMMARY_COLUMNS]
+                        + (['data_version = data_version + 1'] if bump_version else []))
+    for first, last in _username_ranges(cursor, username, batch):
+        cursor.execute(f"""
+            INSERT INTO user_portfolio_summary (username, {', '.join(SUMMARY_COLUMNS)})
+            SELECT * FROM ({RECOMPUTE_QUERY}) t
+            ON DUPLICATE KEY UPDATE {updates}
+        """, (first, last) * 4)
+
+
+def populate(cursor):
+    """Migration 7's first fill, which runs before migration 8 adds ``data_version``"""
+    rebuild(cursor, bump_version=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check or rebuild the portfolio summary table")
+    parser.add_argument('command', choices=['check', 'rebuild'])
+    parser.add_argument('--user', help="only this username")
+    args = parser.parse_args(argv)
+
+    def run(conn, shard):
+        with conn.cursor() as cursor:
+            if args.command == 'check':
+                return find_drift(cursor, args.user)
+            rebuild(cursor, args.user)
+            conn.commit()
+
+    try:
+        # One user lives on one shard; the whole table spans all of them
+        results = scatter(run, [shard_of(args.user)] if args.user else None)
+    except Error as e:
+        print(f"Summary {args.command} failed: {e}")
+        return 1
+    if args.command == 'check':
+        drift = [d for shard_drift in results.values() for d in shard_drift]
+        for username, column, stored, actual in drift:
+            print(f"{username}: {column} is {stored}, expected {actual}")
+        print(f"{len({d[0] for d in drift})} users with drifted totals")
+        return 1 if drift else 0
+    print("Summary rebuilt")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+# writes.py
+"""Versioned updates and idempotent inserts for the holding forms.
+
+Every mutable table has a ``row_version`` (migration 9) that a trigger bumps
+on each UPDATE, whichever code path runs it. ``update_row`` only applies
+when the version still matches the one the form was opened with. A stale
+form therefore gets a ``conflict`` result instead of silently overwriting a
+change made in another tab.
+
+Inserts can carry an idempotency key, built by ``form_idempotency_key``
+from the open form and its values. The first submission runs; repeats with
+the same key get the stored result back from memory without reaching
+MySQL, and a repeat that arrives while the first is still running waits
+for its result. Results are ``WriteResult`` values, and ``show_write_result``
+renders them in the form's own words.
+"""
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Optional
+
+import streamlit as st
+from mysql.connector import Error, IntegrityError, errorcode
+
+from cache import invalidate
+from database import get_db_connection
+
+IDEMPOTENCY_TTL = float(os.environ.get('FOLIO_IDEMPOTENCY_TTL', 600))
+IDEMPOTENCY_MAX_ENTRIES = int(os.environ.get('FOLIO_IDEMPOTENCY_MAX_ENTRIES', 10000))
+IDEMPOTENCY_WAIT = 10.0  # seconds a repeat waits for the first submission to finish
+
+# Versioned tables and the cache entity their rows feed
+TABLE_ENTITIES = {
+    'user_banks': 'banks',
+    'user_mutual_funds': 'funds',
+    'user_cards': 'cards',
+    'user_profiles': 'profile',
+}
+
+OK = 'ok'
+CONFLICT = 'conflict'
+NOT_FOUND = 'not_found'
+DUPLICATE = 'duplicate'
+MOVING = 'moving'  # the user's rows are being copied to another shard
+FAILED = 'error'
+
+
+@dataclass(frozen=True)
+class WriteResult:
+    status: str
+    row_id: Optional[int] = None
+    row_version: Optional[int] = None  # the version now stored, also on conflict
+    message: str = ''
+    replayed: bool = False  # answered from the idempotency cache
+
+    @property
+    def ok(self):
+        return self.status == OK
+
+
+class _Pending:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.expires = None
+
+
+class IdempotencyCache:
+    """Results of keyed writes, kept for ``ttl`` seconds; LRU beyond ``max_entries``"""
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL, max_entries=IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {'executed': 0, 'replayed': 0}
+
+    def run_once(self, key, write):
+        """Run ``write()`` for the first caller with ``key``; later callers get its result"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires is not None and entry.expires < time.monotonic():
+                del self._entries[key]
+                entry = None
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = _Pending()
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+
+        if not owner:
+            if entry.done.wait(IDEMPOTENCY_WAIT) and entry.result is not None:
+                with self._lock:
+                    self._stats['replayed'] += 1
+                return replace(entry.result, replayed=True)
+            return WriteResult(FAILED, message="The same submission is still being saved")
+
+        result = None
+        try:
+            result = write()
+        finally:
+            with self._lock:
+                self._stats['executed'] += 1
+                if result is not None and result.status in (OK, DUPLICATE):
+                    entry.result = result
+                    entry.expires = time.monotonic() + self.ttl
+                elif self._entries.get(key) is entry:
+                    # Failures are not remembered, so a retry reaches the database
+                    del self._entries[key]
+            entry.done.set()
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'entries': len(self._entries)}
+
+
+_idempotency = IdempotencyCache()
+
+
+def get_idempotency_cache():
+    return _idempotency
+
+
+def form_idempotency_key(form, username, values):
+    """Key for one submission of an open form: same form, same values, same key.
+
+    The per-form nonce lives in session state until ``reset_form_key`` is
+    called, so reopening the form starts a new series of keys.
+    """
+    nonce = st.session_state.setdefault(f'_write_nonce_{form}', secrets.token_hex(8))
+    digest = hashlib.blake2b(repr(sorted(values.items())).encode(), digest_size=16).hexdigest()
+    return f"{username}:{form}:{nonce}:{digest}"
+
+
+def reset_form_key(form):
+    st.session_state.pop(f'_write_nonce_{form}', None)
+
+
+def _duplicate_or_failed(e):
+    if isinstance(e, IntegrityError) and e.errno == errorcode.ER_DUP_ENTRY:
+        return WriteResult(DUPLICATE, message=str(e))
+    if e.errno == errorcode.ER_CANT_EXECUTE_IN_READ_ONLY_TRANSACTION:
+        return WriteResult(MOVING, message=str(e))
+    return WriteResult(FAILED, message=str(e))
+
+
+def _insert(table, values):
+    columns = list(values)
+    try:
+        with get_db_connection(values.get('username')) as conn:
+            if conn is None:
+                return WriteResult(FAILED, message="Failed to connect to database")
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {table} ({', '.join(columns)}) "
+                    f"VALUES ({', '.join(['%s'] * len(columns))})",
+                    tuple(values[c] for c in columns))
+                conn.commit()
+                invalidate(values.get('username'), TABLE_ENTITIES[table])
+                return WriteResult(OK, row_id=cursor.lastrowid, row_version=1)
+    except Error as e:
+        return _duplicate_or_failed(e)
+
+
+def insert_row(table, values, idempotency_key=None):
+    """INSERT ``values`` (which include ``username``) into a versioned table"""
+    if idempotency_key is None:
+        return _insert(table, values)
+    return _idempotency.run_once((table, idempotency_key), lambda: _insert(table, values))
+
+
+def update_row(table, row_id, username, expected_version, values):
+    """UPDATE one of the user's rows if it is still at ``expected_version``"""
+    assignments = ', '.join(f"{column} = %s" for column in values)
+    try:
+        with get_db_connection(username) as conn:
+            if conn is None:
+                return WriteResult(FAILED, message="Failed to connect to database")
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    UPDATE {table} SET {assignments}
+                    WHERE id = %s AND username = %s AND row_version = %s
+                """, (*values.values(), row_id, username, expected_version))
+                if cursor.rowcount == 1:
+                    conn.commit()
+                    invalidate(username, TABLE_ENTITIES[table])
+                    return WriteResult(OK, row_id=row_id, row_version=expected_version + 1)
+                cursor.execute(f"SELECT row_version FROM {table} WHERE id = %s AND username = %s",
+                               (row_id, username))
+                row = cursor.fetchone()
+                conn.rollback()
+    except Error as e:
+        return _duplicate_or_failed(e)
+    if row is None:
+        return WriteResult(NOT_FOUND, row_id=row_id)
+    # Our cached copy is older than the row, so drop it too
+    invalidate(username, TABLE_ENTITIES[table])
+    return WriteResult(CONFLICT, row_id=row_id, row_version=row[0])
+
+
+def show_write_result(result, noun, saved_message):
+    """Tell the user how a write went; True if it was saved"""
+    if result.ok:
+        st.success(saved_message)
+    elif result.status == CONFLICT:
+        st.warning(f"This {noun} was changed in another tab or session after you opened it. "
+                   "Your changes were not saved; reopen it to see the latest values.")
+    elif result.status == NOT_FOUND:
+        st.warning(f"This {noun} no longer exists.")
+    elif result.status == DUPLICATE:
+        st.warning(f"A {noun} with these details already exists.")
+    elif result.status == MOVING:
+        st.warning("Your account is being moved to another database server and nothing was "
+                   "saved. Please try again in a few seconds.")
+    else:
+        st.error(f"Error saving {noun}: {result.message}")
+    return result.ok